@@ -0,0 +1,142 @@
+import time  # Importa o módulo time para agrupar os chunks por intervalo
+import queue  # Importa o módulo queue para entregar os chunks à thread do Streamlit
+import asyncio  # Importa o módulo asyncio para o event loop compartilhado
+import threading  # Importa o módulo threading para executar o event loop em segundo plano
+
+# Tipos de mensagens trocadas entre o event loop e o gerador síncrono
+_CHUNK = "chunk"
+_ERROR = "error"
+_DONE = "done"
+
+
+class AsyncStreamBridge:
+    """
+    Ponte entre geradores assíncronos dos modelos e o st.write_stream, que consome geradores síncronos.
+
+    Um único event loop, executado em uma thread em segundo plano, atende os streams de todos os
+    usuários: a espera pela rede acontece no event loop, e não nas threads do Streamlit. Cada stream
+    é associado a uma chave (a sessão do usuário); iniciar um novo stream com a mesma chave cancela o
+    anterior, assim como fechar o gerador (quando o usuário sai ou o Streamlit interrompe a execução).
+    """
+
+    def __init__(self):
+        """Inicia o event loop em segundo plano."""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever,
+            name="async-stream-bridge",
+            daemon=True,
+        )
+        self._thread.start()
+
+        self._active_streams = {}  # chave -> concurrent.futures.Future do stream em andamento
+        self._lock = threading.Lock()
+
+    def stream(self, key, make_stream, coalesce_seconds=0.0, coalesce_chars=2000):
+        """
+        Inicia um stream assíncrono no event loop e o expõe como um gerador síncrono.
+
+        Com coalesce_seconds, os chunks que chegam dentro desse intervalo são entregues juntos (o
+        primeiro chunk é sempre entregue imediatamente), o que reduz as renderizações da interface
+        quando o modelo envia muitos chunks pequenos.
+
+        Args:
+            key (str): Chave do stream (ex.: a chave da sessão do usuário).
+            make_stream (callable): Função sem argumentos que retorna o gerador assíncrono.
+            coalesce_seconds (float, optional): Intervalo (em segundos) de agrupamento dos chunks.
+                Padrão: 0.0 (cada chunk é entregue separadamente).
+            coalesce_chars (int, optional): Tamanho que encerra um grupo antes do intervalo. Padrão: 2000.
+
+        Returns:
+            generator: Um gerador síncrono com os chunks do stream.
+        """
+        chunks = queue.Queue()
+
+        async def pump():
+            # Encaminha os chunks do gerador assíncrono para a fila consumida pela thread do Streamlit
+            try:
+                async for chunk in make_stream():
+                    chunks.put((_CHUNK, chunk))
+            except asyncio.CancelledError:
+                chunks.put((_DONE, None))
+                raise
+            except Exception as e:
+                chunks.put((_ERROR, e))
+            else:
+                chunks.put((_DONE, None))
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self._loop)
+
+        # Cancela o stream anterior da mesma chave (ex.: o usuário enviou um novo prompt)
+        with self._lock:
+            previous = self._active_streams.get(key)
+            self._active_streams[key] = future
+        if previous is not None:
+            previous.cancel()
+
+        return self._consume(key, future, chunks, coalesce_seconds, coalesce_chars)
+
+    def cancel(self, key):
+        """
+        Cancela o stream em andamento associado à chave, se houver.
+
+        Args:
+            key (str): Chave do stream.
+        """
+        with self._lock:
+            future = self._active_streams.pop(key, None)
+        if future is not None:
+            future.cancel()
+
+    def active_streams(self):
+        """Retorna o número de streams em andamento."""
+        with self._lock:
+            return len(self._active_streams)
+
+    def _consume(self, key, future, chunks, coalesce_seconds=0.0, coalesce_chars=2000):
+        """Gerador síncrono que entrega os chunks (agrupados) e cancela o stream se for fechado antes do fim."""
+        pending = []  # Chunks recebidos e ainda não entregues
+        pending_chars = 0
+        deadline = None  # Instante em que o grupo atual deve ser entregue
+        delivered = False  # O primeiro chunk é entregue sem esperar o intervalo
+        try:
+            while True:
+                timeout = 0.5 if deadline is None else deadline - time.monotonic()
+                try:
+                    kind, value = chunks.get(timeout=timeout) if timeout > 0 else chunks.get_nowait()
+                except queue.Empty:
+                    if pending:
+                        # O intervalo do grupo venceu: entrega o que chegou até agora
+                        yield "".join(pending)
+                        pending, pending_chars, deadline = [], 0, None
+                        continue
+                    # Um stream cancelado antes de começar nunca envia o marcador de fim
+                    if future.done() and chunks.empty():
+                        return
+                    continue
+
+                if kind == _CHUNK:
+                    if coalesce_seconds <= 0 or not delivered:
+                        delivered = True
+                        yield value
+                        continue
+                    pending.append(value)
+                    pending_chars += len(value)
+                    if deadline is None:
+                        deadline = time.monotonic() + coalesce_seconds
+                    if pending_chars >= coalesce_chars:
+                        yield "".join(pending)
+                        pending, pending_chars, deadline = [], 0, None
+                else:
+                    # Entrega o que falta antes de encerrar (ou de propagar o erro)
+                    if pending:
+                        yield "".join(pending)
+                        pending, pending_chars, deadline = [], 0, None
+                    if kind == _ERROR:
+                        raise value
+                    return
+        finally:
+            future.cancel()  # Não faz nada se o stream já terminou
+            with self._lock:
+                if self._active_streams.get(key) is future:
+                    del self._active_streams[key]
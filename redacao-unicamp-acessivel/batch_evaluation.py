@@ -0,0 +1,381 @@
+"""
+Avaliação em lote de redações pela Dani Stella, sem interface (ex.: para as turmas de um cursinho).
+
+As redações são lidas em stream de um diretório (um arquivo .txt ou .md por redação) ou de um arquivo
+JSONL (uma redação por linha, com os campos "id", "redacao" e, opcionalmente, "proposta" e "ano").
+Sem os campos da proposta, ela é reconhecida no nome do arquivo ou no início do texto (ex.:
+"proposta_1_2024.txt" ou "Proposta 2 de 2023"), como no chat.
+
+Cada redação é avaliada em uma nova ChatSession por um pool limitado de threads, com limite de
+requisições por minuto e repetição dos erros transitórios (RouterModel). Os resultados são gravados no
+SQLite à medida que ficam prontos (tabela batch_evaluations) e também em um arquivo JSONL (--output);
+uma execução interrompida é retomada com o mesmo --run-id, pulando as redações já avaliadas.
+
+Uso (a partir da raiz do repositório):
+    python redacao-unicamp-acessivel/batch_evaluation.py redacoes.jsonl --model mock --output resultados.jsonl
+    python redacao-unicamp-acessivel/batch_evaluation.py redacoes/ --model gemini-1.5-flash --workers 16 \\
+        --requests-per-minute 1000 --run-id turma-2024
+"""
+import os  # Importa o módulo os para ler o diretório das redações
+import json  # Importa o módulo json para ler e gravar os arquivos JSONL
+import time  # Importa o módulo time para medir a vazão
+import argparse  # Importa o módulo argparse para a linha de comando
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait  # Pool de threads das avaliações
+from chat_session import ChatSession  # Importa a sessão de chat usada em cada avaliação
+from llm_model import MockModel, GeminiModel, OllamaModel  # Importa os modelos disponíveis
+from model_router import RouterModel, BackendLimiter  # Importa o limite de taxa e a repetição de erros transitórios
+from proposal_index import parse_proposal_reference, load_proposal_index, DEFAULT_PROPOSALS_PATH
+from knowledge_index import load_or_build_index  # Importa o índice da base de conhecimento da persona
+from history_writer import HistoryWriter  # Importa o escritor em segundo plano
+from sql_connection import SQLiteConnection  # Importa a conexão com o banco de dados
+
+# Persona usada nas avaliações (a mesma do main.py)
+DEFAULT_PERSONA_PATH = "personas/dani_stella/dani_stella.json"
+
+# Extensões dos arquivos de redação lidos de um diretório
+ESSAY_EXTENSIONS = (".txt", ".md")
+
+# Campos aceitos para o texto da redação em cada linha do JSONL
+ESSAY_TEXT_FIELDS = ("redacao", "texto", "essay", "text")
+
+# Consulta usada para gravar o resultado de cada redação
+RESULT_QUERY = (
+    "INSERT OR REPLACE INTO batch_evaluations "
+    "(run_id, essay_id, status, proposal, model_name, response, error, duration_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def _find_reference(*texts):
+    """Retorna a primeira proposta (proposta, ano) reconhecida nos textos, ou None."""
+    for text in texts:
+        reference = parse_proposal_reference(text)
+        if reference:
+            return reference
+    return None
+
+
+def iter_essays(path):
+    """
+    Lê as redações em stream, de um diretório ou de um arquivo JSONL.
+
+    Args:
+        path (str): Diretório com um arquivo por redação, ou arquivo JSONL.
+
+    Returns:
+        generator: Dicionários com "id", "text" e "proposal" (tupla (proposta, ano) ou None).
+    """
+    if os.path.isdir(path):
+        names = sorted(name for name in os.listdir(path) if name.endswith(ESSAY_EXTENSIONS))
+        for name in names:
+            with open(os.path.join(path, name), encoding="utf-8") as essay_file:
+                text = essay_file.read()
+            stem = os.path.splitext(name)[0].replace("_", " ").replace("-", " ")
+            first_line = text.strip().split("\n", 1)[0] if text.strip() else ""
+            yield {"id": name, "text": text, "proposal": _find_reference(stem, first_line)}
+        return
+
+    with open(path, encoding="utf-8") as jsonl_file:
+        for line_number, line in enumerate(jsonl_file, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            text = next((record[field] for field in ESSAY_TEXT_FIELDS if record.get(field)), "")
+            if record.get("proposta") and record.get("ano"):
+                proposal = (int(record["proposta"]), int(record["ano"]))
+            else:
+                proposal = _find_reference(text[:200])
+            yield {"id": str(record.get("id", f"linha-{line_number}")), "text": text, "proposal": proposal}
+
+
+def build_message(essay):
+    """
+    Monta a mensagem enviada à Dani Stella para uma redação.
+
+    Args:
+        essay (dict): Redação retornada por iter_essays.
+
+    Returns:
+        str: Pedido de avaliação com a proposta (se conhecida) e o texto da redação.
+    """
+    if essay["proposal"]:
+        return "Avalie a minha redação para a proposta {} de {}.\n\n".format(*essay["proposal"]) + essay["text"]
+    return "Avalie a minha redação.\n\n" + essay["text"]
+
+
+class BatchEvaluator:
+    """
+    Avalia redações em lote, com um pool limitado de threads, e grava os resultados no SQLite.
+
+    Args:
+        model_factory (callable): Função sem argumentos que cria um novo modelo (um por redação).
+        connection (SQLiteConnection): Conexão com o banco de dados dos resultados.
+        run_id (str): Identificador da execução (usado para retomá-la).
+        persona_path (str, optional): Caminho da persona. Padrão: DEFAULT_PERSONA_PATH.
+        proposal_index (ProposalIndex, optional): Índice da base de propostas.
+        knowledge_index (KnowledgeIndex, optional): Índice da base de conhecimento da persona.
+        requests_per_minute (float, optional): Limite de requisições por minuto ao modelo. Padrão: None.
+        max_retries (int, optional): Repetições de cada redação em erros transitórios. Padrão: 3.
+        output_path (str, optional): Arquivo JSONL em que os resultados são acrescentados. Padrão: None.
+    """
+
+    def __init__(
+        self,
+        model_factory,
+        connection,
+        run_id,
+        persona_path=DEFAULT_PERSONA_PATH,
+        proposal_index=None,
+        knowledge_index=None,
+        requests_per_minute=None,
+        max_retries=3,
+        output_path=None,
+    ):
+        """Inicializa o avaliador."""
+        self.model_factory = model_factory
+        self.connection = connection
+        self.writer = HistoryWriter(connection)
+        self.run_id = run_id
+        self.persona_path = persona_path
+        self.proposal_index = proposal_index
+        self.knowledge_index = knowledge_index
+        self.requests_per_minute = requests_per_minute
+        self.max_retries = max_retries
+        self.output_path = output_path
+        # Limite de taxa compartilhado pelas threads (sem limite de concorrência aqui: ela já é limitada
+        # pelo pool de threads)
+        self._limiter = BackendLimiter(
+            "batch_evaluation",
+            max_concurrency=10 ** 6,
+            requests_per_minute=requests_per_minute,
+            failure_threshold=10 ** 6,
+        )
+
+        # Estatísticas da execução
+        self.evaluated = 0
+        self.failed = 0
+        self.skipped = 0
+        self.durations = []
+
+    def completed_ids(self):
+        """Retorna os IDs das redações já avaliadas com sucesso nesta execução."""
+        rows = self.connection.query(
+            "SELECT essay_id FROM batch_evaluations WHERE run_id = ? AND status = 'ok'",
+            (self.run_id,),
+        )
+        return {row[0] for row in rows}
+
+    def _create_model(self):
+        """Cria o modelo de uma redação, com o limite de taxa compartilhado e a repetição de erros transitórios."""
+        model = self.model_factory()
+        return RouterModel(model.name, [model], limiters={model.name: self._limiter}, max_retries=self.max_retries)
+
+    def evaluate(self, essay):
+        """
+        Avalia uma redação em uma nova sessão de chat.
+
+        Args:
+            essay (dict): Redação retornada por iter_essays.
+
+        Returns:
+            dict: Resultado com "id", "status" ("ok" ou "error"), "proposal", "model", "response",
+                "error" e "duration_ms".
+        """
+        start = time.perf_counter()
+        model_name, response, error = "", "", ""
+        try:
+            chat_session = ChatSession(
+                self.persona_path,
+                None,  # O histórico das avaliações não é gravado no chat_history
+                knowledge_index=self.knowledge_index,
+                proposal_index=self.proposal_index,
+            )
+            model = self._create_model()
+            model_name = model.name
+            chat_session.update_model(model_name, model)
+            response = "".join(chat_session.send_stream_message(build_message(essay)))
+            status = "ok"
+        except Exception as e:
+            status, error = "error", repr(e)
+
+        return {
+            "id": essay["id"],
+            "status": status,
+            "proposal": "proposta {} de {}".format(*essay["proposal"]) if essay["proposal"] else "",
+            "model": model_name,
+            "response": response,
+            "error": error,
+            "duration_ms": (time.perf_counter() - start) * 1000,
+        }
+
+    def _record(self, result, output_file):
+        """Grava o resultado no SQLite (em segundo plano) e no arquivo JSONL."""
+        self.writer.submit(
+            RESULT_QUERY,
+            (
+                self.run_id, result["id"], result["status"], result["proposal"], result["model"],
+                result["response"], result["error"], result["duration_ms"],
+            ),
+        )
+        if output_file:
+            output_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output_file.flush()
+
+        if result["status"] == "ok":
+            self.evaluated += 1
+            self.durations.append(result["duration_ms"])
+        else:
+            self.failed += 1
+
+    def run(self, essays, workers=8, progress_every=50):
+        """
+        Avalia as redações, mantendo no máximo 2 * workers redações lidas e ainda não avaliadas.
+
+        Args:
+            essays (iterable): Redações (ex.: o gerador retornado por iter_essays).
+            workers (int, optional): Número de threads do pool. Padrão: 8.
+            progress_every (int, optional): Intervalo (em redações) entre as mensagens de progresso. Padrão: 50.
+
+        Returns:
+            dict: Estatísticas da execução (veja report).
+        """
+        done_ids = self.completed_ids()
+        start = time.perf_counter()
+        output_file = open(self.output_path, "a", encoding="utf-8") if self.output_path else None
+        pending = set()
+        try:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-evaluation") as executor:
+                try:
+                    for essay in essays:
+                        if essay["id"] in done_ids:
+                            self.skipped += 1  # Já avaliada em uma execução anterior
+                            continue
+
+                        # Limita as redações em memória: espera uma avaliação terminar antes de ler a próxima
+                        while len(pending) >= 2 * workers:
+                            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in finished:
+                                self._record(future.result(), output_file)
+                                self._report_progress(start, progress_every)
+                        pending.add(executor.submit(self.evaluate, essay))
+
+                    for future in wait(pending).done:
+                        self._record(future.result(), output_file)
+                        self._report_progress(start, progress_every)
+                    pending = set()
+                except KeyboardInterrupt:
+                    # Descarta as redações que ainda não começaram e grava as avaliações já concluídas e as
+                    # em andamento (a saída do pool espera por elas), para que sejam puladas ao retomar
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    for future in wait(pending).done:
+                        if not future.cancelled():
+                            self._record(future.result(), output_file)
+                    pending = set()
+                    raise
+        finally:
+            for future in pending:
+                future.cancel()
+            self.writer.close()  # Grava os resultados pendentes (também em uma interrupção)
+            if output_file:
+                output_file.close()
+
+        return self.report(time.perf_counter() - start)
+
+    def _report_progress(self, start, progress_every):
+        """Exibe o progresso a cada progress_every redações."""
+        finished = self.evaluated + self.failed
+        if progress_every and finished % progress_every == 0:
+            elapsed = time.perf_counter() - start
+            print(f"{finished} redações avaliadas ({finished / elapsed * 60:.1f} redações/min)", flush=True)
+
+    def report(self, elapsed):
+        """
+        Retorna as estatísticas da execução.
+
+        Args:
+            elapsed (float): Duração da execução, em segundos.
+
+        Returns:
+            dict: Redações avaliadas, com erro e puladas, duração, vazão e latência mediana.
+        """
+        durations = sorted(self.durations)
+        return {
+            "run_id": self.run_id,
+            "evaluated": self.evaluated,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "elapsed_seconds": elapsed,
+            "essays_per_minute": (self.evaluated + self.failed) / elapsed * 60 if elapsed else 0.0,
+            "median_duration_ms": durations[len(durations) // 2] if durations else 0.0,
+        }
+
+
+def create_model_factory(args):
+    """Retorna a função que cria o modelo escolhido na linha de comando."""
+    if args.model == "mock":
+        return lambda: MockModel(
+            "mock",
+            temperature=1.0,
+            time_to_first_token=args.mock_ttft,
+            inter_chunk_delay=args.mock_chunk_delay,
+            chunk_size=args.mock_chunk_size,
+            response_length=args.mock_response_length,
+        )
+    if args.model.startswith("ollama/"):
+        return lambda: OllamaModel(model_name=args.model.removeprefix("ollama/"), host=args.ollama_host, temperature=1.0)
+
+    api_key = args.api_key or os.environ.get("GOOGLE_API_KEY", "")
+    if not api_key:
+        raise SystemExit("Informe a chave de API do Gemini com --api-key ou GOOGLE_API_KEY.")
+    return lambda: GeminiModel(model_name=args.model, api_key=api_key, temperature=1.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Diretório com as redações ou arquivo JSONL.")
+    parser.add_argument("--model", default="mock", help='Modelo: "mock", "ollama/<modelo>" ou um modelo Gemini.')
+    parser.add_argument("--api-key", default="", help="Chave de API do Gemini (padrão: GOOGLE_API_KEY).")
+    parser.add_argument("--ollama-host", default=os.environ.get("OLLAMA_HOST", "http://localhost:11434"))
+    parser.add_argument("--workers", type=int, default=8, help="Número de avaliações simultâneas.")
+    parser.add_argument("--requests-per-minute", type=float, default=None, help="Limite de requisições ao modelo.")
+    parser.add_argument("--max-retries", type=int, default=3, help="Repetições em erros transitórios.")
+    parser.add_argument("--database", default="batch_evaluations.db", help="Banco SQLite dos resultados.")
+    parser.add_argument("--run-id", default=None, help="ID da execução (padrão: nome da entrada e modelo).")
+    parser.add_argument("--output", default=None, help="Arquivo JSONL em que os resultados são acrescentados.")
+    parser.add_argument("--persona", default=DEFAULT_PERSONA_PATH)
+    parser.add_argument("--progress-every", type=int, default=50)
+    parser.add_argument("--mock-ttft", type=float, default=0.0, help="Tempo até o primeiro token do MockModel (s).")
+    parser.add_argument("--mock-chunk-delay", type=float, default=0.0, help="Intervalo entre chunks do MockModel (s).")
+    parser.add_argument("--mock-chunk-size", type=int, default=None, help="Tamanho dos chunks do MockModel.")
+    parser.add_argument("--mock-response-length", type=int, default=None, help="Tamanho das respostas do MockModel.")
+    args = parser.parse_args()
+
+    run_id = args.run_id or f"{os.path.basename(os.path.normpath(args.input))}:{args.model}"
+    evaluator = BatchEvaluator(
+        create_model_factory(args),
+        SQLiteConnection(database=args.database, connection_name="batch-evaluation", check_same_thread=False),
+        run_id,
+        persona_path=args.persona,
+        proposal_index=load_proposal_index(DEFAULT_PROPOSALS_PATH),
+        knowledge_index=load_or_build_index(args.persona),
+        requests_per_minute=args.requests_per_minute,
+        max_retries=args.max_retries,
+        output_path=args.output,
+    )
+
+    try:
+        report = evaluator.run(iter_essays(args.input), workers=args.workers, progress_every=args.progress_every)
+    except KeyboardInterrupt:
+        print("Execução interrompida; os resultados gravados serão pulados ao retomá-la com o mesmo --run-id.")
+        raise SystemExit(130)
+
+    print(
+        f"Execução {report['run_id']}: {report['evaluated']} avaliadas, {report['failed']} com erro, "
+        f"{report['skipped']} já avaliadas em {report['elapsed_seconds']:.1f}s "
+        f"({report['essays_per_minute']:.1f} redações/min, mediana {report['median_duration_ms']:.0f}ms por redação)"
+    )
+    if report["failed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
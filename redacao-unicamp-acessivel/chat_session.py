@@ -1,6 +1,22 @@
+import time  # Importa o módulo time para medir as etapas de cada turno
+import asyncio  # Importa o módulo asyncio para executar as etapas bloqueantes fora do event loop
 import uuid  # Importa o módulo uuid para gerar IDs únicos
 from llm_model import LLMBaseModel  # Importa a classe LLMBaseModel
-import json  # Importa o módulo json para trabalhar com arquivos JSON
+from persona_compiler import compile_persona  # Importa o compilador de prompts de persona
+from persona_registry import get_persona_registry  # Importa o registro de personas compartilhado pelo processo
+from knowledge_index import load_or_build_index, KNOWLEDGE_FIELD  # Importa o índice da base de conhecimento
+from history_buffer import HistoryBuffer  # Importa o buffer em memória do histórico
+from proposal_index import parse_proposal_reference  # Importa o reconhecimento da proposta mencionada
+from response_cache import replay, async_replay  # Importa a reprodução das respostas em cache
+from conversation_context import ConversationContext  # Importa o contexto limitado de conversas longas
+from persona_compiler import estimate_tokens  # Importa o estimador local de tokens
+from metrics import metrics  # Importa o registro de métricas do processo
+from stream_renderer import StreamBuffer  # Importa o acumulador das respostas em stream
+from token_accounting import preflight  # Importa a verificação do tamanho do prompt antes do envio
+from history_store import SQLiteHistoryStore  # Importa o armazenamento padrão do histórico
+
+# Aviso acrescentado a uma resposta cujo stream foi interrompido antes do fim
+INTERRUPTED_RESPONSE_NOTICE = "\n\n*(resposta interrompida)*"
 
 # Define a classe ChatSession para gerenciar o histórico do chat
 class ChatSession:
@@ -20,7 +36,25 @@ class ChatSession:
     __END_TURN_USER__ = "<end_of_turn>\n"
     __END_TURN_ASSISTANT__ = "<end_of_turn>\n"
 
-    def __init__(self, persona_path, connection):
+    def __init__(
+        self,
+        persona_path,
+        connection,
+        persona_field_budgets=None,
+        knowledge_index=None,
+        use_knowledge_index=False,
+        knowledge_top_k=4,
+        history_writer=None,
+        proposal_index=None,
+        response_cache=None,
+        response_cache_history_window=2,
+        context_token_budget=None,
+        context_recent_messages=6,
+        stream_checkpoint_interval=None,
+        persona_registry=None,
+        token_accounting=None,
+        history_store=None,
+    ):
         """
         Inicializa o estado do chat.
 
@@ -28,45 +62,205 @@ class ChatSession:
             model (LLMBaseModel): O modelo de inteligencia artificial utilizado.
             connection (SQLiteConnection, optional): Objeto SQLiteConnection para armazenar o histórico do chat.
             persona_path (str, optional): Caminho para a pasta que contém os arquivos JSON da persona.
+            persona_field_budgets (dict, optional): Orçamento máximo de tokens por campo da persona no prompt.
+            knowledge_index (KnowledgeIndex, optional): Índice da base de conhecimento da persona. Quando
+                informado, a base de conhecimento sai do prompt da persona e cada turno recebe apenas os
+                trechos mais relevantes. O índice informado é usado para qualquer persona.
+            use_knowledge_index (bool, optional): Usa o índice da base de conhecimento da persona atual,
+                aberto (ou construído) por load_or_build_index e identificado pelo hash da persona, de modo
+                que uma persona alterada passa a ser consultada no seu novo índice. Padrão: False.
+            knowledge_top_k (int, optional): Número de trechos da base de conhecimento por turno. Padrão: 4.
+            history_writer (HistoryWriter, optional): Escritor em segundo plano do histórico. Quando
+                informado, as mensagens são gravadas fora do caminho da resposta.
+            proposal_index (ProposalIndex, optional): Índice da base de propostas de redação. Quando
+                informado, o turno em que o usuário menciona uma proposta recebe os dados dessa proposta.
+            response_cache (ResponseCache, optional): Cache de respostas. Quando informado, perguntas
+                repetidas no mesmo contexto são respondidas sem chamar o modelo.
+            response_cache_history_window (int, optional): Número de mensagens anteriores que fazem parte
+                da chave do cache de respostas. Padrão: 2.
+            context_token_budget (int, optional): Orçamento de tokens da conversa mantida pelo modelo
+                (sem contar a persona). Quando a conversa o ultrapassa, o histórico do modelo é
+                descartado e substituído por um contexto compacto: resumo das mensagens antigas,
+                redação em avaliação e últimas mensagens. Padrão: None (sem limite).
+            context_recent_messages (int, optional): Número de mensagens recentes mantidas na íntegra no
+                contexto compacto. Padrão: 6.
+            stream_checkpoint_interval (float, optional): Intervalo (em segundos) entre as gravações da
+                resposta parcial durante o stream. A resposta parcial de um stream interrompido (ex.: o
+                usuário saiu da página ou o servidor reiniciou) é registrada no histórico. Padrão: None
+                (a resposta só é gravada ao fim do stream).
+            persona_registry (PersonaRegistry, optional): Registro de personas compartilhado pelas sessões.
+                Padrão: None (registro padrão do processo).
+            token_accounting (TokenAccounting, optional): Registro do uso de tokens e da latência de
+                cada turno. Padrão: None (o uso não é registrado).
+            history_store (HistoryStore, optional): Armazenamento do histórico (ex.: particionado entre
+                vários bancos de dados). Padrão: None (tabelas chat_history e stream_checkpoints de
+                connection, gravadas pelo history_writer).
         """
         self.connection = connection  # Define a conexão com o banco de dados
+        self.history_writer = history_writer  # Define o escritor em segundo plano do histórico
+        if history_store is None and connection:
+            history_store = SQLiteHistoryStore(connection, history_writer)
+        self.history_store = history_store  # Define o armazenamento do histórico (None: não é gravado)
         self.persona_path = persona_path  # Define o caminho para a pasta da persona
+        self.persona_field_budgets = persona_field_budgets  # Define os orçamentos de tokens da persona
+        self._knowledge_index = knowledge_index  # Define o índice fixo da base de conhecimento
+        self.use_knowledge_index = use_knowledge_index  # Usa o índice da persona atual
+        self.knowledge_top_k = knowledge_top_k  # Define o número de trechos recuperados por turno
+        self.proposal_index = proposal_index  # Define o índice da base de propostas
+        self.selected_proposal = ""  # Última proposta mencionada pelo usuário (usada na recuperação)
+        self.response_cache = response_cache  # Define o cache de respostas
+        self.response_cache_history_window = response_cache_history_window
+
+        # Contexto limitado da conversa, usado para compactar o histórico mantido pelo modelo
+        self.context_token_budget = context_token_budget
+        self.context = ConversationContext(recent_messages=context_recent_messages)
+        self.model_context_tokens = 0  # Tokens da conversa (sem a persona) acumulados no modelo
+        self.compactions = 0  # Número de vezes em que o histórico do modelo foi compactado
+        self.restores = 0  # Número de vezes em que a conversa foi retomada em um novo modelo
+        self._restore_pending = False  # Indica se o modelo ainda não recebeu a conversa retomada
+
+        # Checkpoints da resposta parcial durante o stream
+        self.stream_checkpoint_interval = stream_checkpoint_interval
+
+        # Uso de tokens de cada turno
+        self.token_accounting = token_accounting
+        self.last_prompt_tokens = 0  # Estimativa local dos tokens do último prompt enviado (com a persona)
+        self._has_checkpoint = False  # Indica se a resposta em andamento já tem um checkpoint gravado
+
+        # Histórico da sessão em memória; o banco de dados só é lido na primeira leitura de cada sessão
+        self.history_buffer = HistoryBuffer(self._format_turn)
         self.session_id = str(uuid.uuid4())  # Gera um ID de sessão único
+        self._is_history_loaded = True  # Uma sessão nova ainda não tem histórico no banco de dados
 
-        with open(persona_path) as persona_file:
-            self.persona = json.load(persona_file)  # Inicializa a persona como None
+        # A persona é lida uma única vez por processo, pelo registro (o prompt vem do artefato compilado)
+        self.persona_registry = persona_registry or get_persona_registry()
 
         self.model = None  # Inicializa o modelo de linguagem como None
         self.model_name = ""
         self.is_persona_initialized = False  # Inicializa a flag de inicialização da persona como False
+        self.model_holds_persona = False  # Indica se o modelo mantém a persona fora das mensagens
+
+    @property
+    def session_id(self):
+        """Retorna o ID da sessão."""
+        return self._session_id
+
+    @session_id.setter
+    def session_id(self, value):
+        """Define o ID da sessão e invalida o histórico em memória (que será lido do banco de dados)."""
+        self._session_id = value
+        self.history_buffer.clear()
+        self.context.reset()
+        self._is_history_loaded = False
+
+    def restore(self, session_id, model_name="", context_snapshot=None):
+        """
+        Retoma uma sessão gravada anteriormente (ex.: após uma reconexão ou o reinício do servidor).
 
-        # Cria a tabela chat_history se ela não existir
-        if self.connection:
-            self.connection.execute(
-                """
-                CREATE TABLE IF NOT EXISTS chat_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id TEXT NOT NULL,
-                    role TEXT NOT NULL,
-                    message TEXT NOT NULL,
-                    model_name TEXT NOT NULL,
-                    persona_name TEXT NOT NULL,
-                    temperature REAL NOT NULL,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                );
-                """
-            )
+        Nada é enviado ao modelo aqui: o histórico é lido do banco de dados na primeira leitura, e o
+        contexto compacto da conversa é enviado junto com a próxima mensagem do usuário.
+
+        Args:
+            session_id (str): ID da sessão a ser retomada.
+            model_name (str, optional): Nome do último modelo usado na sessão. Padrão: "".
+            context_snapshot (dict, optional): Contexto compacto gravado (veja ConversationContext.snapshot).
+        """
+        self.session_id = session_id
+        self.model_name = model_name
+        if context_snapshot:
+            self.context.restore(context_snapshot)
+        self._restore_pending = True
+
+    @property
+    def persona(self):
+        """Retorna a persona como uma visão somente leitura, compartilhada por todas as sessões do processo."""
+        if not self.persona_path:
+            return None
+        return self.persona_registry.get(self.persona_path)
+
+    @property
+    def knowledge_index(self):
+        """Retorna o índice da base de conhecimento da persona atual (None se não houver índice)."""
+        if self._knowledge_index is not None or not self.use_knowledge_index or not self.persona_path:
+            return self._knowledge_index
+        # Os índices abertos ficam em cache pelo hash da persona: a consulta é barata a cada turno
+        return load_or_build_index(self.persona_path, persona_registry=self.persona_registry)
 
     def load_persona(self, persona_path):
         """Carrega a persona de um arquivo JSON, permitindo subpastas."""
-        self.persona_path = persona_path  # Define o caminho para a persona
+        self.persona_path = persona_path  # Define o caminho para a persona (lida pelo registro no próximo acesso)
+
+    def get_compiled_persona(self):
+        """Retorna o prompt compilado da persona (compilado uma única vez por hash do arquivo)."""
+        # Com o índice, a base de conhecimento é enviada em trechos a cada turno, e não no prompt da persona
+        exclude_fields = (KNOWLEDGE_FIELD,) if self.knowledge_index else ()
+        return compile_persona(
+            self.persona_path,
+            field_budgets=self.persona_field_budgets,
+            exclude_fields=exclude_fields,
+            persona_registry=self.persona_registry,
+        )
+
+    def get_persona_prefix(self):
+        """Retorna o prompt completo da persona, delimitado pelos marcadores de início e fim."""
+        compiled = self.get_compiled_persona()  # Inclui os marcadores, sem reinterpretar o JSON
+        return compiled.beg_marker + "\n" + compiled.prompt + "\n" + compiled.end_marker + "\n"
+
+    def select_proposal(self, message):
+        """
+        Lembra a proposta mencionada na mensagem, para que as mensagens seguintes (ex.: a redação) a considerem.
+
+        Args:
+            message (str): Mensagem do usuário.
+
+        Returns:
+            tuple: Chave (proposta, ano) da proposta mencionada, ou None.
+        """
+        reference = parse_proposal_reference(message)
+        # Uma menção que não corresponde a uma proposta da base (ex.: em uma redação colada no chat)
+        # não substitui a proposta escolhida
+        if reference is None or (self.proposal_index is not None and reference not in self.proposal_index):
+            return None
+        self.selected_proposal = "proposta {} de {}".format(*reference)
+        return reference
+
+    def get_proposal_context(self, reference):
+        """
+        Retorna os dados da proposta mencionada pelo usuário, lidos do índice da base de propostas.
+
+        Args:
+            reference (tuple): Chave (proposta, ano) retornada por select_proposal, ou None.
+
+        Returns:
+            str: Dados da proposta formatados para o prompt, ou uma string vazia.
+        """
+        if not self.proposal_index or not reference:
+            return ""
+        return self.proposal_index.format_proposal(*reference)
+
+    def get_knowledge_context(self, message):
+        """
+        Recupera os trechos da base de conhecimento relevantes para a mensagem do usuário.
+
+        Args:
+            message (str): Mensagem do usuário.
 
-        # Verifica se uma persona foi especificada
-        if self.persona_path:
-            # Carrega o arquivo JSON da persona
-            with open(self.persona_path, "r") as f:
-                self.persona = json.load(f)  # Carrega a persona como um dicionário
+        Returns:
+            str: Trechos relevantes formatados para o prompt, ou uma string vazia.
+        """
+        knowledge_index = self.knowledge_index
+        if not knowledge_index:
+            return ""
 
+        results = knowledge_index.search(
+            message + "\n" + self.selected_proposal,
+            top_k=self.knowledge_top_k,
+        )
+        if not results:
+            return ""
+
+        passages = "\n\n".join(passage for _, passage in results)
+        return "Trechos relevantes da base de conhecimento:\n" + passages + "\n"
 
     def update_model(self, model_name, model: LLMBaseModel):
         """
@@ -78,75 +272,106 @@ class ChatSession:
         """
         self.model = model  # Define o novo modelo
         self.model_name = model_name
-        self.session_id = str(uuid.uuid4())  # Gera um novo ID de sessão único
+
+        # A sessão (e o seu histórico) é mantida; o novo modelo recebe a conversa na próxima mensagem
+        self._restore_pending = True
+
+        # O novo modelo ainda não conhece a persona, a menos que ele mantenha o prefixo (ex.: em cache)
+        self.is_persona_initialized = False
+        self.model_holds_persona = False  # Indica se o modelo mantém a persona fora das mensagens
+        self.model_context_tokens = 0
+        if model is not None:
+            self.model_holds_persona = model.set_persona_prefix(
+                self.get_persona_prefix(), self.get_compiled_persona().persona_hash
+            )
+            self.is_persona_initialized = self.model_holds_persona
 
     def is_model_initialized(self):
         """Verifica se o modelo de linguagem foi inicializado."""
         return self.model is not None  # Retorna True se o modelo foi inicializado, False caso contrário
 
+    def _insert_into_history(self, role, message):
+        """Grava uma mensagem no histórico, em segundo plano se houver um escritor configurado."""
+        # Obtem o nome do modelo e a temperatura, se o modelo estiver inicializado
+        model_name = self.model.name if self.model else ""
+        temperature = self.model.temperature if self.model else -1
+
+        self._ensure_history_loaded()  # O buffer precisa conter as mensagens anteriores da sessão
+        self.history_buffer.append(role, message)
+        self.history_store.append(self.session_id, role, message, model_name, self.persona_path, temperature)
+
     def add_to_history_as_user(self, message):
         """Adiciona uma mensagem do usuário ao histórico com marcadores de início/fim de turno."""
-        if self.connection:
-            # Obtem o nome do modelo e a temperatura, se o modelo estiver inicializado
-            model_name = self.model.name if self.model else ""
-            temperature = self.model.temperature if self.model else -1
-
+        if self.history_store:
             # Insere a mensagem do usuário no banco de dados
-            self.connection.execute(
-                "INSERT INTO chat_history (session_id, role, message, model_name, persona_name, temperature) VALUES (?, ?, ?, ?, ?, ?)",
-                (self.session_id, self.__USER__, message, model_name, self.persona_path, temperature),
-            )
+            self._insert_into_history(self.__USER__, message)
 
     def add_to_history_as_assistant(self, message):
         """Adiciona uma resposta do assistente ao histórico com marcadores de início/fim de turno."""
-        if self.connection:
-            # Obtem o nome do modelo e a temperatura, se o modelo estiver inicializado
-            model_name = self.model.name if self.model else ""
-            temperature = self.model.temperature if self.model else -1
-
+        if self.history_store:
             # Insere a resposta do assistente no banco de dados
-            self.connection.execute(
-                "INSERT INTO chat_history (session_id, role, message, model_name, persona_name, temperature) VALUES (?, ?, ?, ?, ?, ?)",
-                (self.session_id, self.__ASSISTANT__, message, model_name, self.persona_path, temperature),
-            )
+            self._insert_into_history(self.__ASSISTANT__, message)
+
+    def _format_turn(self, role, message):
+        """Formata uma mensagem do histórico com os marcadores de início/fim de turno."""
+        # Formata a mensagem do usuário
+        if role == self.__USER__:
+            return f"{self.__START_TURN_USER__}\n{message}\n{self.__END_TURN_USER__}\n"
+        # Formata a resposta do assistente
+        return f"{self.__START_TURN_ASSISTANT__}{message}{self.__END_TURN_ASSISTANT__}\n"
+
+    def _ensure_history_loaded(self):
+        """Carrega o histórico da sessão do banco de dados para a memória, se ainda não foi carregado."""
+        if self._is_history_loaded:
+            return
+
+        # Recupera o histórico do armazenamento (apenas no início ou na retomada da sessão)
+        self.history_buffer.extend(self.history_store.load(self.session_id))
+        self._is_history_loaded = True
+        self._recover_checkpoint()
+
+        # Descarta um contexto compacto gravado que não corresponde mais ao histórico
+        if len(self.context) > len(self.history_buffer):
+            self.context.reset()
+
+    def _recover_checkpoint(self):
+        """Registra no histórico a resposta parcial de um stream interrompido (ex.: pelo reinício do servidor)."""
+        checkpoint = self.history_store.load_checkpoint(self.session_id)
+        if not checkpoint:
+            return
+
+        message, model_name, temperature = checkpoint
+        message += INTERRUPTED_RESPONSE_NOTICE
+        self.history_buffer.append(self.__ASSISTANT__, message)
+        self.history_store.append(self.session_id, self.__ASSISTANT__, message, model_name, self.persona_path, temperature)
+        self.history_store.clear_checkpoint(self.session_id)
 
     def get_history(self):
         """Retorna todo o histórico do chat como uma lista de tuplas (role, message)."""
-        if not self.connection:
-            return []  # Retorna uma lista vazia se não houver conexão com o banco de dados
+        if not self.history_store:
+            return []  # Retorna uma lista vazia se o histórico não for armazenado
 
-        # Recupera o histórico do banco de dados
-        chat_history = self.connection.query(
-            f"SELECT role, message FROM chat_history WHERE session_id = '{self.session_id}'"
-        )
-        return chat_history
+        # Serve o histórico a partir da memória
+        self._ensure_history_loaded()
+        return self.history_buffer.entries()
 
     def get_history_as_turns(self):
-        """Retorna todo o histórico do chat como uma única string, formatado em turnos."""
-        if not self.connection:
-            return ""  # Retorna uma string vazia se não houver conexão com o banco de dados
-
-        # Recupera o histórico do banco de dados
-        chat_history = self.get_history()
-
-        # Cria uma lista para armazenar o histórico em turnos
-        turn_history = []
-
-        # Itera sobre cada mensagem do histórico
-        for role, message in chat_history:
-            # Adiciona a mensagem do usuário ao histórico em turnos
-            if role == self.__USER__:
-                turn_history.append(
-                    f"{self.__START_TURN_USER__}\n{message}\n{self.__END_TURN_USER__}\n"
-                )
-            # Adiciona a resposta do assistente ao histórico em turnos
-            else:
-                turn_history.append(
-                    f"{self.__START_TURN_ASSISTANT__}{message}{self.__END_TURN_ASSISTANT__}\n"
-                )
-
-        # Converte a lista para uma única string
-        str_turn_history = "".join(turn_history)
+        """
+        Retorna o histórico do chat como uma única string, formatado em turnos.
+
+        Com um orçamento de contexto configurado, retorna o contexto compacto da conversa (resumo,
+        redação em avaliação e últimas mensagens), cujo tamanho não cresce com a conversa.
+        """
+        if not self.history_store:
+            return ""  # Retorna uma string vazia se o histórico não for armazenado
+
+        self._ensure_history_loaded()
+        if self.context_token_budget:
+            self.context.update(self.history_buffer)
+            return self.context.render(max_tokens=self.context_token_budget // 2)
+
+        # As mensagens são formatadas apenas aqui, sem uma segunda cópia mantida no buffer
+        str_turn_history = "".join(self.history_buffer.turns())
 
         # Retorna o histórico em turnos junto com uma mensagem de aviso
         return (
@@ -155,50 +380,364 @@ class ChatSession:
             + "\nNote: you must hide any turn tag from your response."
         )
 
-    def send_stream_message(self, message):
+    def get_context_snapshot(self):
+        """Retorna o contexto compacto da conversa, atualizado, em um formato serializável em JSON."""
+        if self._is_history_loaded:
+            self.context.update(self.history_buffer)
+        return self.context.snapshot()
+
+    def compact_model_context(self):
         """
-        Envia uma mensagem do usuário e recebe a resposta do modelo em stream.
+        Descarta o histórico mantido pelo modelo e retorna o contexto compacto que o substitui.
+
+        Também é usado para entregar a conversa retomada a um novo modelo, sem reenviar o histórico completo.
+
+        Returns:
+            str: Contexto compacto da conversa (sem a mensagem atual), a ser enviado no próximo turno.
+        """
+        self.context.update(self.history_buffer)
+        self.model.reset_history()
+        self.model_context_tokens = 0
+
+        # Sem o histórico, o modelo só conhece a persona se a mantiver fora das mensagens
+        self.is_persona_initialized = self.model_holds_persona
+
+        # O contexto compacto ocupa no máximo metade do orçamento, deixando espaço para os próximos turnos
+        return self.context.render(max_tokens=self.context_token_budget // 2 if self.context_token_budget else None)
+
+    def _needs_compaction(self, message):
+        """Verifica se a conversa mantida pelo modelo ultrapassaria o orçamento com a nova mensagem."""
+        if not self.context_token_budget or not self.is_persona_initialized:
+            return False
+        return self.model_context_tokens + estimate_tokens(message) > self.context_token_budget
+
+    def build_prompt(self, message):
+        """
+        Registra a mensagem do usuário no histórico e monta o prompt enviado ao modelo.
 
         Args:
             message (str): Mensagem do usuário.
 
         Returns:
-            generator: Um gerador que retorna as partes da resposta em stream.
+            str: O prompt a ser enviado ao modelo.
         """
-        self.add_to_history_as_user(message)  # Adiciona a mensagem do usuário ao histórico
-
         # Verifica se o modelo foi inicializado
         if self.model is None:
+            self.add_to_history_as_user(message)  # Adiciona a mensagem do usuário ao histórico
             # Lança uma exceção se o modelo não estiver inicializado
             raise ValueError("Model not initialized. Please update the model.")
 
+        # Entrega ao modelo a conversa retomada (nova conexão ou novo modelo), ou compacta o histórico
+        # do modelo se ele excedeu o orçamento, antes de registrar a nova mensagem
+        conversation_context = ""
+        if self._restore_pending and self.get_history():
+            conversation_context = self.compact_model_context()
+            self.restores += 1
+        elif self._needs_compaction(message):
+            conversation_context = self.compact_model_context()
+            self.compactions += 1
+        self._restore_pending = False
+
+        self.add_to_history_as_user(message)  # Adiciona a mensagem do usuário ao histórico
+
+        # Dados da proposta mencionada nesta mensagem e trechos relevantes da base de conhecimento
+        reference = self.select_proposal(message)
+        knowledge_context = self.get_proposal_context(reference) + self.get_knowledge_context(message)
+        turn_context = conversation_context + knowledge_context
+
         # Adiciona a persona ao prompt se ela não estiver carregada ainda
         if not self.is_persona_initialized:
             self.is_persona_initialized = True  # Define a flag como True
 
-            # Combina as informações da persona com o prompt
-            prompt = (
-                self.persona.get("beg_persona_content", "<beg_persona>\n")
-                + "\n"
-                + str(self.persona)
-                + "\n"
-                + self.persona.get("end_persona_content", "\n<end_persona>")
-                + "\n"
-                + "\nNova mensagem do usuario: "
-                + message
-            )
+            # Combina o prompt compilado da persona com a mensagem do usuário
+            prompt = turn_context + "\nNova mensagem do usuario: " + message
+            self.model_context_tokens = estimate_tokens(prompt)  # A persona não entra no orçamento
+            prompt = self.get_persona_prefix() + prompt
+            self.last_prompt_tokens = estimate_tokens(prompt)
+            return prompt
+
+        if turn_context:
+            # Se a persona já estiver carregada, envia apenas o contexto do turno e a mensagem
+            prompt = turn_context + "\nNova mensagem do usuario: " + message
         else:
             # Se a persona já estiver carregada, usa o prompt como a mensagem do usuário
             prompt = message
 
+        self.model_context_tokens += estimate_tokens(prompt)
+        # O modelo também processa os turnos anteriores que mantém no histórico (e a persona, se ela estiver nele)
+        self.last_prompt_tokens = self._persona_history_tokens() + self.model_context_tokens
+        return prompt
+
+    def _persona_history_tokens(self):
+        """Retorna os tokens da persona enviados ao modelo a cada turno (zero se o modelo a mantém fora das mensagens)."""
+        holds_persona = self.model_holds_persona
+        if holds_persona and hasattr(self.model, "next_backend_holds_persona"):
+            # O roteador envia a persona junto com a mensagem aos modelos que não a mantêm
+            holds_persona = self.model.next_backend_holds_persona()
+        return 0 if holds_persona else self.get_compiled_persona().compiled_tokens
+
+    def estimate_turn_tokens(self, message):
+        """
+        Estima localmente os tokens que o modelo vai processar para a mensagem, antes do envio.
+
+        Args:
+            message (str): Mensagem do usuário.
+
+        Returns:
+            int: Tokens estimados da conversa mantida pelo modelo, da mensagem e da persona, se ela for
+                enviada (no primeiro turno ou no histórico de um modelo que não a mantém).
+        """
+        return self._persona_history_tokens() + self.model_context_tokens + estimate_tokens(message)
+
+    def preflight_check(self, message):
+        """
+        Verifica, antes do envio, se o prompt da mensagem cabe no modelo escolhido.
+
+        Args:
+            message (str): Mensagem do usuário.
+
+        Returns:
+            str: Aviso se a resposta deve demorar mais para começar, ou None.
+
+        Raises:
+            ValueError: Se o prompt excede o máximo aceito pelo modelo.
+        """
+        if self.model is None:
+            return None
+        # Um roteador (ex.: o modelo "auto") usa os limites dos modelos para os quais encaminha a mensagem
+        backend_names = [backend.name for backend in getattr(self.model, "backends", ())]
+        return preflight(self.model.name, self.estimate_turn_tokens(message), backend_names)
+
+    def _record_usage(self, response, turn_start, first_chunk_at, cached=False):
+        """Registra os tokens e a latência do turno, se houver um registro de uso configurado."""
+        if not self.token_accounting:
+            return
+        now = time.perf_counter()
+        # Com o roteador (modelo "auto"), o uso é registrado para o modelo que respondeu o turno; uma
+        # resposta do cache não passou por nenhum deles
+        model_name = self.model.name if cached else getattr(self.model, "active_backend", "") or self.model.name
+        self.token_accounting.record(
+            self.session_id,
+            model_name,
+            self.last_prompt_tokens,
+            response,
+            usage=None if cached else self.model.last_usage,
+            time_to_first_token=(first_chunk_at or now) - turn_start,
+            total_latency=now - turn_start,
+            cached=cached,
+        )
+
+    def get_cached_response(self, message):
+        """
+        Consulta o cache de respostas para a mensagem do usuário.
+
+        A chave considera a persona, o modelo, a temperatura, a mensagem normalizada, as últimas
+        mensagens do histórico e a proposta selecionada.
+
+        Args:
+            message (str): Mensagem do usuário (ainda não registrada no histórico).
+
+        Returns:
+            tuple: Tupla (chave, resposta); a chave é None sem cache ou sem modelo, e a resposta é None
+                quando ela não está em cache.
+        """
+        if not self.response_cache or self.model is None:
+            return None, None
+
+        self.select_proposal(message)  # A proposta mencionada na mensagem faz parte do contexto
+        window = self.get_history()[-self.response_cache_history_window:] if self.response_cache_history_window else []
+        key = self.response_cache.make_key(
+            self.get_compiled_persona().persona_hash,
+            self.model.name,
+            self.model.temperature,
+            message,
+            history=list(window) + [("proposal", self.selected_proposal)],
+        )
+        return key, self.response_cache.get(key)
+
+    def complete_turn(self, cache_key, response):
+        """
+        Registra a resposta completa do modelo no histórico, no orçamento de contexto e no cache de respostas.
+
+        Args:
+            cache_key (str): Chave do cache de respostas retornada por get_cached_response, ou None.
+            response (str): Resposta completa do modelo.
+        """
+        self.add_to_history_as_assistant(response)
+        self.model_context_tokens += estimate_tokens(response)  # A resposta também fica no histórico do modelo
+        self._clear_checkpoint()
+        if cache_key:
+            self.response_cache.put(cache_key, response, model_name=self.model.name)
+
+    def interrupt_turn(self, partial_response):
+        """
+        Registra no histórico a parte recebida de uma resposta cujo stream foi interrompido.
+
+        Args:
+            partial_response (str): Parte da resposta recebida até a interrupção.
+        """
+        if partial_response:
+            self.add_to_history_as_assistant(partial_response + INTERRUPTED_RESPONSE_NOTICE)
+            self.model_context_tokens += estimate_tokens(partial_response)
+        self._clear_checkpoint()
+
+    def checkpoint_response(self, buffer, last_checkpoint):
+        """
+        Grava a resposta parcial do stream em andamento, se o intervalo de checkpoint já passou.
+
+        Args:
+            buffer (StreamBuffer): Resposta recebida até agora.
+            last_checkpoint (float): Instante (time.monotonic) do último checkpoint ou do início do stream.
+
+        Returns:
+            float: Instante do último checkpoint.
+        """
+        if not self.checkpoint_due(last_checkpoint):
+            return last_checkpoint
+
+        now = time.monotonic()
+
+        model_name = self.model.name if self.model else ""
+        temperature = self.model.temperature if self.model else -1
+        self.history_store.save_checkpoint(self.session_id, buffer.text(), model_name, temperature)
+        self._has_checkpoint = True
+        return now
+
+    def checkpoint_due(self, last_checkpoint):
+        """
+        Verifica se a resposta parcial deve ser gravada (veja checkpoint_response).
+
+        Args:
+            last_checkpoint (float): Instante (time.monotonic) do último checkpoint ou do início do stream.
+
+        Returns:
+            bool: True se o intervalo de checkpoint já passou.
+        """
+        if self.stream_checkpoint_interval is None or not self.history_store:
+            return False
+        return time.monotonic() - last_checkpoint >= self.stream_checkpoint_interval
+
+    def _clear_checkpoint(self):
+        """Descarta o checkpoint da resposta em andamento, se houver."""
+        if self._has_checkpoint:
+            self.history_store.clear_checkpoint(self.session_id)
+            self._has_checkpoint = False
+
+    def _observe(self, event, start):
+        """Registra a duração de uma etapa do turno nas métricas e no trace da sessão (se habilitados)."""
+        if not metrics.enabled:
+            return
+        seconds = time.perf_counter() - start
+        model_name = self.model.name if self.model else ""
+        metrics.observe(f"{event}_seconds", seconds, model=model_name)
+        metrics.trace(self.session_id, event, seconds, model_name)
+
+    def send_stream_message(self, message):
+        """
+        Envia uma mensagem do usuário e recebe a resposta do modelo em stream.
+
+        Args:
+            message (str): Mensagem do usuário.
+
+        Returns:
+            generator: Um gerador que retorna as partes da resposta em stream.
+        """
+        turn_start = time.perf_counter()
+        cache_key, cached_response = self.get_cached_response(message)
+        if cached_response is not None:
+            # Resposta em cache: reproduzida em partes, sem chamar o modelo (e sem alterar o seu estado)
+            metrics.inc("chat_cached_responses_total")
+            self.add_to_history_as_user(message)
+            yield from replay(cached_response)
+            self.add_to_history_as_assistant(cached_response)
+            self._restore_pending = True  # O modelo não viu esta troca: recebe a conversa no próximo turno
+            self._record_usage(cached_response, turn_start, None, cached=True)
+            return
+
+        prompt = self.build_prompt(message)
+        self._observe("chat_prompt_build", turn_start)
+
         # Envia o prompt para o modelo e recebe a resposta em stream
+        model_start = time.perf_counter()
         response_stream = self.model.send_stream_message(prompt)
 
         # Extrai o conteúdo da mensagem do gerador da resposta. Yield dentro do loop para retornar em stream
-        full_response = ""
-        for chunk_content in response_stream:
-            full_response += chunk_content
-            yield chunk_content
+        buffer = StreamBuffer()
+        last_checkpoint = time.monotonic()
+        first_chunk_at = None
+        completed = False
+        try:
+            for chunk_content in response_stream:
+                if not buffer:
+                    first_chunk_at = time.perf_counter()
+                    self._observe("llm_time_to_first_token", model_start)
+                    self._observe("chat_time_to_first_chunk", turn_start)
+                buffer.append(chunk_content)
+                last_checkpoint = self.checkpoint_response(buffer, last_checkpoint)
+                yield chunk_content
+            completed = True
+        finally:
+            if not completed:
+                self.interrupt_turn(buffer.text())  # Stream fechado ou com erro: mantém a parte recebida
+        self._observe("llm_stream", model_start)
+
+        # Adiciona a resposta completa do modelo ao histórico do chat
+        self.complete_turn(cache_key, buffer.text())
+        self._record_usage(buffer.text(), turn_start, first_chunk_at)
+        self._observe("chat_response", turn_start)
+
+    async def async_send_stream_message(self, message):
+        """
+        Versão assíncrona de send_stream_message, para uso com o AsyncStreamBridge.
+
+        Args:
+            message (str): Mensagem do usuário.
+
+        Returns:
+            async generator: Um gerador assíncrono que retorna as partes da resposta em stream.
+        """
+        # O event loop é compartilhado pelas respostas de todos os usuários: as etapas que leem o banco de
+        # dados, a persona ou o índice da base de conhecimento (ou esperam o escritor do histórico) rodam
+        # em threads, para que uma etapa lenta não atrase os streams dos demais
+        turn_start = time.perf_counter()
+        cache_key, cached_response = await asyncio.to_thread(self.get_cached_response, message)
+        if cached_response is not None:
+            # Resposta em cache: reproduzida em partes, sem chamar o modelo (e sem alterar o seu estado)
+            metrics.inc("chat_cached_responses_total")
+            await asyncio.to_thread(self.add_to_history_as_user, message)
+            async for chunk_content in async_replay(cached_response):
+                yield chunk_content
+            await asyncio.to_thread(self.add_to_history_as_assistant, cached_response)
+            self._restore_pending = True  # O modelo não viu esta troca: recebe a conversa no próximo turno
+            await asyncio.to_thread(self._record_usage, cached_response, turn_start, None, True)
+            return
+
+        prompt = await asyncio.to_thread(self.build_prompt, message)
+        self._observe("chat_prompt_build", turn_start)
+
+        # Envia o prompt para o modelo e recebe a resposta em stream, sem bloquear o event loop
+        model_start = time.perf_counter()
+        buffer = StreamBuffer()
+        last_checkpoint = time.monotonic()
+        first_chunk_at = None
+        completed = False
+        try:
+            async for chunk_content in self.model.async_send_stream_message(prompt):
+                if not buffer:
+                    first_chunk_at = time.perf_counter()
+                    self._observe("llm_time_to_first_token", model_start)
+                    self._observe("chat_time_to_first_chunk", turn_start)
+                buffer.append(chunk_content)
+                if self.checkpoint_due(last_checkpoint):
+                    last_checkpoint = await asyncio.to_thread(self.checkpoint_response, buffer, last_checkpoint)
+                yield chunk_content
+            completed = True
+        finally:
+            if not completed:
+                self.interrupt_turn(buffer.text())  # Stream cancelado ou com erro: mantém a parte recebida
+        self._observe("llm_stream", model_start)
 
         # Adiciona a resposta completa do modelo ao histórico do chat
-        self.add_to_history_as_assistant(full_response)
+        await asyncio.to_thread(self.complete_turn, cache_key, buffer.text())
+        await asyncio.to_thread(self._record_usage, buffer.text(), turn_start, first_chunk_at)
+        self._observe("chat_response", turn_start)
@@ -0,0 +1,141 @@
+import os  # Importa o módulo os para verificar alterações nos arquivos
+import csv  # Importa o módulo csv para ler a base de propostas sem depender do Pandas
+import json  # Importa o módulo json para serializar a persona para download
+import threading  # Importa o módulo threading para proteger o cache entre threads
+from persona_registry import get_persona_registry  # Importa o registro de personas compartilhado pelo processo
+
+
+def _infer_column(values):
+    """
+    Converte os valores de uma coluna do CSV para inteiros quando todos os valores preenchidos são inteiros.
+
+    Args:
+        values (list): Valores da coluna, como lidos do CSV.
+
+    Returns:
+        list: Os inteiros (com None nas células vazias) ou os valores originais.
+    """
+    filled = [value.strip() for value in values if value.strip()]
+    if not filled or not all(value.lstrip("+-").isdigit() for value in filled):
+        return values
+    return [int(value) if value.strip() else None for value in values]
+
+
+class ContentRegistry:
+    """
+    Registro do conteúdo estático da plataforma, carregado uma única vez por processo.
+
+    Guarda os textos da documentação, a base de propostas de redação (já como tabela Arrow) e o JSON
+    da persona para download. Cada item é identificado pelo caminho do arquivo e pela sua versão
+    (data de modificação e tamanho): enquanto o arquivo não muda, todas as execuções do script
+    reutilizam o mesmo objeto; quando ele muda, o item é recarregado automaticamente. A persona é
+    lida pelo registro de personas (PersonaRegistry), e o seu JSON, identificado pelo hash da persona.
+
+    Args:
+        persona_registry (PersonaRegistry, optional): Registro das personas. Padrão: o registro do processo.
+    """
+
+    def __init__(self, persona_registry=None):
+        """Inicializa o registro vazio."""
+        self.persona_registry = persona_registry or get_persona_registry()
+        self._items = {}  # (tipo, caminho ou hash da persona) -> (versão do arquivo, conteúdo)
+        self._lock = threading.Lock()
+        self._loads = 0
+        self._hits = 0
+
+    def _get(self, kind, path, loader):
+        """Retorna o conteúdo do arquivo, carregando-o com loader se ele ainda não foi carregado ou mudou."""
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        key = (kind, path)
+
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] == version:
+                self._hits += 1
+                return item[1]
+
+        # Carrega fora do lock, para que a leitura de um arquivo não bloqueie os demais
+        content = loader(path)
+
+        with self._lock:
+            self._items[key] = (version, content)
+            self._loads += 1
+        return content
+
+    def get_text(self, path):
+        """
+        Retorna o conteúdo de um arquivo de texto (ex.: as seções em Markdown da documentação).
+
+        Args:
+            path (str): Caminho do arquivo.
+
+        Returns:
+            str: Conteúdo do arquivo.
+        """
+        def load_text(text_path):
+            with open(text_path, encoding="utf-8") as text_file:
+                return text_file.read()
+
+        return self._get("text", path, load_text)
+
+    def get_table(self, path):
+        """
+        Retorna um arquivo CSV como tabela Arrow (ex.: a base de propostas de redação).
+
+        O st.dataframe envia tabelas Arrow ao navegador sem convertê-las para DataFrame, de modo que o
+        Pandas não é usado para exibir a base. A tabela é imutável e compartilhada entre as execuções.
+
+        Args:
+            path (str): Caminho do arquivo CSV.
+
+        Returns:
+            pyarrow.Table: Conteúdo do arquivo.
+        """
+        def load_table(csv_path):
+            import pyarrow  # Dependência do Streamlit, importada apenas quando a base é carregada
+
+            with open(csv_path, encoding="utf-8-sig", newline="") as csv_file:
+                reader = csv.DictReader(csv_file)
+                columns = {name: [] for name in reader.fieldnames}
+                for row in reader:
+                    for name in columns:
+                        columns[name].append(row[name])
+
+            # Colunas numéricas (ex.: proposta e ano) voltam a ser inteiros, como eram no Pandas,
+            # para que a ordenação e a exibição na tabela sejam numéricas
+            return pyarrow.table({name: _infer_column(values) for name, values in columns.items()})
+
+        return self._get("table", path, load_table)
+
+    def get_persona_json(self, name_or_path, indent=4):
+        """
+        Retorna a persona serializada em JSON com a indentação informada (ex.: para download).
+
+        Args:
+            name_or_path (str): Nome da persona ou caminho do seu arquivo JSON.
+            indent (int, optional): Indentação do JSON gerado. Padrão: 4.
+
+        Returns:
+            str: JSON serializado.
+        """
+        persona = self.persona_registry.get(name_or_path)
+        key = (f"persona-json-{indent}", persona.persona_hash)
+
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._hits += 1
+                return item[1]
+
+        content = json.dumps(persona.to_dict(), indent=indent)
+
+        with self._lock:
+            self._items[key] = (persona.persona_hash, content)
+            self._loads += 1
+        return content
+
+    def stats(self):
+        """Retorna estatísticas de uso do registro."""
+        with self._lock:
+            return {"items": len(self._items), "loads": self._loads, "hits": self._hits}
@@ -0,0 +1,192 @@
+from collections import deque  # Importa deque para a janela de mensagens recentes e o resumo
+from persona_compiler import estimate_tokens  # Importa o estimador local de tokens
+
+# Tamanho mínimo (em caracteres) de uma mensagem do usuário para que ela seja tratada como uma redação
+ESSAY_MIN_CHARS = 800
+
+# Tamanho máximo (em caracteres) do resumo de cada mensagem antiga
+MESSAGE_SUMMARY_CHARS = 300
+
+# Nomes dos papéis no contexto enviado ao modelo
+_ROLE_LABELS = {"user": "Aluno", "assistant": "Dani Stella"}
+
+
+def is_essay(role, message, min_chars=ESSAY_MIN_CHARS):
+    """
+    Verifica se a mensagem é uma redação enviada para avaliação.
+
+    Args:
+        role (str): Papel do autor da mensagem.
+        message (str): Conteúdo da mensagem.
+        min_chars (int, optional): Tamanho mínimo de uma redação. Padrão: ESSAY_MIN_CHARS.
+
+    Returns:
+        bool: True se a mensagem é uma redação.
+    """
+    return role == "user" and len(message.strip()) >= min_chars
+
+
+def summarize_message(message, max_chars=MESSAGE_SUMMARY_CHARS):
+    """
+    Resume uma mensagem de forma extrativa: mantém as primeiras frases, até max_chars caracteres.
+
+    Args:
+        message (str): Conteúdo da mensagem.
+        max_chars (int, optional): Tamanho máximo do resumo. Padrão: MESSAGE_SUMMARY_CHARS.
+
+    Returns:
+        str: Resumo da mensagem.
+    """
+    text = " ".join(message.split())
+    if len(text) <= max_chars:
+        return text
+
+    # Corta no fim da última frase completa dentro do limite, ou na última palavra
+    cut = text[:max_chars]
+    sentence_end = max(cut.rfind(". "), cut.rfind("? "), cut.rfind("! "))
+    if sentence_end >= max_chars // 2:
+        return cut[:sentence_end + 1] + " (...)"
+    return cut.rsplit(" ", 1)[0] + " (...)"
+
+
+class ConversationContext:
+    """
+    Contexto limitado de uma conversa longa, usado no lugar do histórico completo.
+
+    Mantém as últimas recent_messages mensagens na íntegra, um resumo contínuo (extrativo) das
+    mensagens mais antigas, limitado a summary_tokens, e a última redação enviada pelo aluno, que
+    permanece fixada no contexto enquanto ele revisa o texto. As mensagens são processadas de forma
+    incremental: cada mensagem é lida uma única vez, e o custo de render não depende do tamanho da conversa.
+
+    Args:
+        recent_messages (int, optional): Número de mensagens recentes mantidas na íntegra. Padrão: 6.
+        summary_tokens (int, optional): Orçamento de tokens do resumo das mensagens antigas. Padrão: 1000.
+        essay_min_chars (int, optional): Tamanho mínimo de uma redação. Padrão: ESSAY_MIN_CHARS.
+    """
+
+    def __init__(self, recent_messages=6, summary_tokens=1000, essay_min_chars=ESSAY_MIN_CHARS):
+        """Inicializa o contexto vazio."""
+        self.recent_messages = recent_messages
+        self.summary_tokens = summary_tokens
+        self.essay_min_chars = essay_min_chars
+        self.reset()
+
+    def reset(self):
+        """Descarta o contexto (ex.: ao iniciar uma nova sessão)."""
+        self.essay = ""  # Última redação enviada pelo aluno
+        self._recent = deque()  # Mensagens recentes, na íntegra: tuplas (role, message)
+        self._summary = deque()  # Linhas do resumo das mensagens antigas
+        self._summary_token_count = 0
+        self._observed = 0  # Número de mensagens do histórico já processadas
+
+    def snapshot(self):
+        """
+        Retorna o estado do contexto como um dicionário serializável em JSON (ex.: para retomar a sessão).
+
+        Returns:
+            dict: Estado do contexto.
+        """
+        return {
+            "essay": self.essay,
+            "recent": [list(entry) for entry in self._recent],
+            "summary": list(self._summary),
+            "observed": self._observed,
+        }
+
+    def restore(self, snapshot):
+        """
+        Restaura o contexto a partir de um estado retornado por snapshot.
+
+        Args:
+            snapshot (dict): Estado do contexto.
+        """
+        self.reset()
+        self.essay = snapshot.get("essay", "")
+        self._recent = deque(tuple(entry) for entry in snapshot.get("recent", []))
+        self._summary = deque(snapshot.get("summary", []))
+        self._summary_token_count = sum(estimate_tokens(line) for line in self._summary)
+        self._observed = snapshot.get("observed", 0)
+
+    def __len__(self):
+        """Retorna o número de mensagens processadas."""
+        return self._observed
+
+    def update(self, history_buffer):
+        """
+        Processa as mensagens do histórico que ainda não fazem parte do contexto.
+
+        Args:
+            history_buffer (HistoryBuffer): Histórico da sessão.
+        """
+        for role, message in history_buffer.entries(self._observed):
+            self.append(role, message)
+
+    def append(self, role, message):
+        """
+        Acrescenta uma mensagem ao contexto, resumindo as que saem da janela de mensagens recentes.
+
+        Args:
+            role (str): Papel do autor da mensagem ("user" ou "assistant").
+            message (str): Conteúdo da mensagem.
+        """
+        self._observed += 1
+        if is_essay(role, message, self.essay_min_chars):
+            self.essay = message  # A redação mais recente substitui a anterior
+
+        self._recent.append((role, message))
+        while len(self._recent) > self.recent_messages:
+            self._summarize(*self._recent.popleft())
+
+    def _summarize(self, role, message):
+        """Acrescenta uma mensagem ao resumo, descartando as linhas mais antigas além do orçamento."""
+        if is_essay(role, message, self.essay_min_chars):
+            text = "(enviou uma versão da redação)"
+        else:
+            text = summarize_message(message)
+
+        line = f"- {_ROLE_LABELS.get(role, role)}: {text}"
+        self._summary.append(line)
+        self._summary_token_count += estimate_tokens(line)
+
+        while self._summary_token_count > self.summary_tokens and len(self._summary) > 1:
+            self._summary_token_count -= estimate_tokens(self._summary.popleft())
+
+    def render(self, max_tokens=None):
+        """
+        Retorna o contexto da conversa formatado para o prompt.
+
+        Args:
+            max_tokens (int, optional): Orçamento de tokens do contexto. As mensagens recentes que não
+                cabem no orçamento (começando pelas mais antigas) são incluídas apenas resumidas.
+                Padrão: None (sem limite).
+
+        Returns:
+            str: Resumo, redação fixada e mensagens recentes, ou uma string vazia se não houver contexto.
+        """
+        sections = []
+        if self._summary:
+            sections.append("Resumo da conversa até aqui:\n" + "\n".join(self._summary))
+        if self.essay:
+            sections.append("Redação do aluno em avaliação:\n" + self.essay)
+
+        if self._recent:
+            remaining = None
+            if max_tokens is not None:
+                remaining = max_tokens - sum(estimate_tokens(section) for section in sections)
+
+            # Percorre as mensagens da mais recente para a mais antiga, resumindo as que não cabem
+            recent = []
+            for role, message in reversed(self._recent):
+                if message == self.essay:
+                    message = "(enviou a redação em avaliação, reproduzida acima)"
+                elif remaining is not None and estimate_tokens(message) > remaining:
+                    message = summarize_message(message)
+                line = f"{_ROLE_LABELS.get(role, role)}: {message}"
+                recent.append(line)
+                if remaining is not None:
+                    remaining -= estimate_tokens(line)
+            sections.append("Últimas mensagens:\n" + "\n\n".join(reversed(recent)))
+
+        if not sections:
+            return ""
+        return "Contexto da conversa até aqui:\n" + "\n\n".join(sections) + "\n"
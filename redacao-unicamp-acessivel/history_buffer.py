@@ -0,0 +1,75 @@
+import threading  # Importa o módulo threading para proteger o buffer entre threads
+
+
+class HistoryBuffer:
+    """
+    Buffer em memória, somente de acréscimo, com o histórico de uma sessão de chat.
+
+    Guarda as mensagens na ordem em que foram gravadas, uma única cópia de cada, e as leituras não
+    consultam o banco de dados. A versão formatada em turnos é gerada apenas quando pedida (turns),
+    para que a memória de cada sessão não dobre com uma cópia formatada de todo o histórico.
+
+    Args:
+        format_turn (callable): Função (role, message) -> str que formata uma mensagem como turno.
+    """
+
+    def __init__(self, format_turn):
+        """Inicializa o buffer vazio."""
+        self._format_turn = format_turn
+        self._entries = []  # Lista de tuplas (role, message)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Retorna o número de mensagens no buffer."""
+        return len(self._entries)
+
+    def append(self, role, message):
+        """
+        Acrescenta uma mensagem ao buffer.
+
+        Args:
+            role (str): Papel do autor da mensagem ("user" ou "assistant").
+            message (str): Conteúdo da mensagem.
+        """
+        with self._lock:
+            self._entries.append((role, message))
+
+    def extend(self, entries):
+        """
+        Acrescenta várias mensagens ao buffer (ex.: as lidas do banco de dados).
+
+        Args:
+            entries (iterable): Tuplas (role, message).
+        """
+        with self._lock:
+            self._entries.extend((role, message) for role, message in entries)
+
+    def clear(self):
+        """Remove todas as mensagens do buffer."""
+        with self._lock:
+            self._entries = []
+
+    def entries(self, start=0):
+        """
+        Retorna as mensagens a partir da posição start.
+
+        Args:
+            start (int, optional): Posição da primeira mensagem retornada. Padrão: 0.
+
+        Returns:
+            list: Lista de tuplas (role, message).
+        """
+        with self._lock:
+            return self._entries[start:]
+
+    def turns(self, start=0):
+        """
+        Retorna as mensagens, formatadas em turnos, a partir da posição start.
+
+        Args:
+            start (int, optional): Posição da primeira mensagem retornada. Padrão: 0.
+
+        Returns:
+            list: Lista de mensagens formatadas (str).
+        """
+        return [self._format_turn(role, message) for role, message in self.entries(start)]
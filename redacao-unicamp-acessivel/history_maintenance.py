@@ -0,0 +1,276 @@
+import sys  # Importa o módulo sys para ler os argumentos da linha de comando
+import time  # Importa o módulo time para medir a duração de cada execução
+import threading  # Importa o módulo threading para executar a manutenção em segundo plano
+from history_store import HistoryRow, encode_archive, decode_archive  # Importa o formato do arquivo comprimido
+from history_store import SESSION_ROWS_QUERY, ARCHIVE_QUERY, LOAD_ARCHIVE_QUERY  # Importa as consultas do arquivo
+from metrics import metrics  # Importa o registro de métricas do processo
+
+# Sessões cuja última mensagem é anterior ao limite de retenção (relativo a um instante de referência). Pelo
+# índice idx_chat_history_timestamp (indicado explicitamente: sem estatísticas, o SQLite prefere o índice da
+# sessão e percorre a tabela inteira), a consulta lê apenas as mensagens anteriores ao limite, e cada sessão
+# encontrada é descartada se tiver uma mensagem recente (pelo índice da sessão)
+CANDIDATES_QUERY = (
+    "SELECT DISTINCT old.session_id FROM chat_history AS old INDEXED BY idx_chat_history_timestamp "
+    "WHERE old.timestamp < datetime(?1, ?2) "
+    "AND NOT EXISTS (SELECT 1 FROM chat_history AS recent WHERE recent.session_id = old.session_id "
+    "AND recent.timestamp >= datetime(?1, ?2)) LIMIT ?3"
+)
+PURGE_QUERY = "DELETE FROM chat_history_archive WHERE last_timestamp < datetime(?, ?)"
+
+
+class HistoryMaintenance:
+    """
+    Manutenção do histórico: retenção, arquivamento comprimido e devolução do espaço liberado.
+
+    A cada execução, as sessões sem mensagens há mais de retention_days dias saem da tabela
+    chat_history e passam para chat_history_archive, em um único registro por sessão com as mensagens
+    comprimidas (zlib). O histórico de uma sessão arquivada continua sendo lido normalmente (veja
+    SQLiteHistoryStore.load e SQLiteHistoryStore.scan), inclusive quando a sessão é retomada; as novas
+    mensagens voltam para chat_history e são somadas ao arquivo na próxima execução. Em seguida, as
+    páginas liberadas são devolvidas ao sistema aos poucos (PRAGMA incremental_vacuum), de modo que o
+    arquivo do banco e o índice da tabela chat_history não crescem com o número de sessões antigas.
+
+    Cada sessão é arquivada em uma transação própria, para que as escritas das sessões em andamento
+    não esperem pela execução inteira.
+
+    Args:
+        connection (SQLiteConnection): Conexão com o banco de dados.
+        retention_days (float, optional): Dias sem mensagens após os quais a sessão é arquivada. Padrão: 30.
+        writer (HistoryWriter, optional): Escritor em segundo plano do histórico, cujas escritas
+            pendentes são gravadas antes de cada execução. Padrão: None.
+        delete_after_days (float, optional): Dias após a última mensagem em que a sessão arquivada é
+            excluída. Padrão: None (as sessões arquivadas são mantidas).
+        max_sessions_per_run (int, optional): Número máximo de sessões arquivadas por execução. Padrão: 1000.
+        vacuum_pages (int, optional): Número máximo de páginas devolvidas ao sistema por execução. Padrão: 2000.
+        interval_seconds (float, optional): Intervalo entre as execuções em segundo plano. Padrão: 3600.
+    """
+
+    def __init__(
+        self,
+        connection,
+        retention_days=30,
+        writer=None,
+        delete_after_days=None,
+        max_sessions_per_run=1000,
+        vacuum_pages=2000,
+        interval_seconds=3600,
+    ):
+        """Inicializa a manutenção (a execução em segundo plano começa com start)."""
+        self.connection = connection
+        self.retention_days = retention_days
+        self.writer = writer
+        self.delete_after_days = delete_after_days
+        self.max_sessions_per_run = max_sessions_per_run
+        self.vacuum_pages = vacuum_pages
+        self.interval_seconds = interval_seconds
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+
+        # Estatísticas acumuladas das execuções
+        self._runs = 0
+        self._archived_sessions = 0
+        self._archived_messages = 0
+        self._purged_sessions = 0
+        self._freed_pages = 0
+        self.last_run = None
+        self.last_error = None
+
+    def archive_session(self, session_id):
+        """
+        Move as mensagens de uma sessão da tabela chat_history para o arquivo comprimido.
+
+        Args:
+            session_id (str): ID da sessão.
+
+        Returns:
+            int: Número de mensagens arquivadas.
+        """
+        # A leitura, a gravação do arquivo e a exclusão ocorrem na mesma transação, na conexão de escrita
+        with self.connection.transaction() as cursor:
+            rows = [HistoryRow(*row) for row in cursor.execute(SESSION_ROWS_QUERY, (session_id,)).fetchall()]
+            if not rows:
+                return 0
+
+            # Uma sessão retomada depois de arquivada tem as novas mensagens somadas ao arquivo existente
+            existing = cursor.execute(LOAD_ARCHIVE_QUERY, (session_id,)).fetchone()
+            archived = (decode_archive(session_id, existing[0]) if existing else []) + rows
+
+            cursor.execute(
+                ARCHIVE_QUERY,
+                (session_id, encode_archive(archived), len(archived), archived[0].timestamp, archived[-1].timestamp),
+            )
+            cursor.execute("DELETE FROM chat_history WHERE session_id = ? AND id <= ?", (session_id, rows[-1].id))
+        return len(rows)
+
+    def archive(self, now="now"):
+        """
+        Arquiva as sessões sem mensagens há mais de retention_days dias.
+
+        Args:
+            now (str, optional): Instante de referência, no formato do SQLite. Padrão: "now".
+
+        Returns:
+            tuple: (sessões arquivadas, mensagens arquivadas).
+        """
+        sessions = messages = 0
+        while sessions < self.max_sessions_per_run:
+            limit = min(100, self.max_sessions_per_run - sessions)
+            candidates = self.connection.query(CANDIDATES_QUERY, (now, f"-{self.retention_days} days", limit))
+            if not candidates:
+                break
+            for (session_id,) in candidates:
+                messages += self.archive_session(session_id)
+                sessions += 1
+            if len(candidates) < limit:
+                break
+        return sessions, messages
+
+    def purge(self, now="now"):
+        """
+        Exclui as sessões arquivadas cuja última mensagem é anterior a delete_after_days dias.
+
+        Args:
+            now (str, optional): Instante de referência, no formato do SQLite. Padrão: "now".
+
+        Returns:
+            int: Número de sessões excluídas.
+        """
+        if self.delete_after_days is None:
+            return 0
+        with self.connection.transaction() as cursor:
+            return cursor.execute(PURGE_QUERY, (now, f"-{self.delete_after_days} days")).rowcount
+
+    def _pragma(self, name):
+        """Retorna o valor de um PRAGMA do banco de dados."""
+        return self.connection.query(f"PRAGMA {name}")[0][0]
+
+    def vacuum(self):
+        """
+        Devolve ao sistema até vacuum_pages páginas livres do banco de dados.
+
+        Um banco criado antes do auto_vacuum incremental é convertido na primeira execução, com um VACUUM
+        completo (que bloqueia as escritas enquanto reescreve o arquivo, uma única vez).
+
+        Returns:
+            int: Número de páginas devolvidas.
+        """
+        if self._pragma("auto_vacuum") != 2:  # 2: INCREMENTAL
+            before = self._pragma("page_count")
+            self.connection.execute_script("PRAGMA auto_vacuum=INCREMENTAL; VACUUM;")
+            return max(before - self._pragma("page_count"), 0)
+
+        before = self._pragma("freelist_count")
+        if before:
+            # O checkpoint grava as páginas no arquivo principal e limita o tamanho do WAL
+            self.connection.execute_script(
+                f"PRAGMA incremental_vacuum({int(self.vacuum_pages)}); PRAGMA wal_checkpoint(TRUNCATE);"
+            )
+        return before - self._pragma("freelist_count")
+
+    def run_once(self, now="now"):
+        """
+        Executa a manutenção: arquivamento, exclusão das sessões arquivadas expiradas e vacuum.
+
+        Args:
+            now (str, optional): Instante de referência, no formato do SQLite. Padrão: "now".
+
+        Returns:
+            dict: Resultado da execução.
+        """
+        start = time.perf_counter()
+        if self.writer:
+            self.writer.flush()  # As mensagens pendentes contam para a última atividade das sessões
+
+        sessions, messages = self.archive(now)
+        purged = self.purge(now)
+        freed = self.vacuum()
+
+        seconds = time.perf_counter() - start
+        metrics.inc("history_archived_sessions_total", sessions)
+        metrics.inc("history_archived_messages_total", messages)
+        metrics.observe("history_maintenance_seconds", seconds)
+
+        result = {
+            "archived_sessions": sessions,
+            "archived_messages": messages,
+            "purged_sessions": purged,
+            "freed_pages": freed,
+            "seconds": seconds,
+        }
+        with self._stats_lock:
+            self._runs += 1
+            self._archived_sessions += sessions
+            self._archived_messages += messages
+            self._purged_sessions += purged
+            self._freed_pages += freed
+            self.last_run = result
+        return result
+
+    def database_stats(self):
+        """Retorna o tamanho do banco de dados e o número de mensagens na tabela e no arquivo."""
+        archived_sessions, archived_messages, archived_bytes = self.connection.query(
+            "SELECT COUNT(*), COALESCE(SUM(message_count), 0), COALESCE(SUM(LENGTH(messages)), 0) FROM chat_history_archive"
+        )[0]
+        return {
+            "size_bytes": self._pragma("page_count") * self._pragma("page_size"),
+            "free_pages": self._pragma("freelist_count"),
+            "hot_messages": self.connection.query("SELECT COUNT(*) FROM chat_history")[0][0],
+            "archived_sessions": archived_sessions,
+            "archived_messages": archived_messages,
+            "archived_bytes": archived_bytes,
+        }
+
+    def start(self):
+        """Inicia a execução periódica em segundo plano."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="history-maintenance", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Interrompe a execução em segundo plano (após a execução em andamento, se houver)."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        """Executa a manutenção a cada interval_seconds, até stop."""
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                # Uma falha não interrompe a manutenção; a próxima execução tenta novamente
+                self.last_error = e
+                metrics.inc("history_maintenance_errors_total")
+            if self._stop.wait(self.interval_seconds):
+                return
+
+    def stats(self):
+        """Retorna estatísticas acumuladas das execuções."""
+        with self._stats_lock:
+            return {
+                "runs": self._runs,
+                "archived_sessions": self._archived_sessions,
+                "archived_messages": self._archived_messages,
+                "purged_sessions": self._purged_sessions,
+                "freed_pages": self._freed_pages,
+                "last_run": self.last_run,
+                "last_error": repr(self.last_error) if self.last_error else None,
+            }
+
+
+if __name__ == "__main__":
+    # Executa a manutenção uma vez (ex.: python history_maintenance.py chat_history.db 30)
+    from sql_connection import SQLiteConnection
+
+    database = sys.argv[1] if len(sys.argv) > 1 else "chat_history.db"
+    retention_days = float(sys.argv[2]) if len(sys.argv) > 2 else 30
+    maintenance = HistoryMaintenance(
+        SQLiteConnection(database=database, connection_name="history_maintenance", check_same_thread=False),
+        retention_days=retention_days,
+    )
+    print(f"antes: {maintenance.database_stats()}")
+    print(f"execução: {maintenance.run_once()}")
+    print(f"depois: {maintenance.database_stats()}")
@@ -0,0 +1,508 @@
+import os  # Importa o módulo os para criar o diretório das partições
+import glob  # Importa o módulo glob para encontrar as partições existentes
+import json  # Importa o módulo json para serializar as mensagens arquivadas e o número de partições
+import time  # Importa o módulo time para registrar o horário das mensagens em memória
+import heapq  # Importa o módulo heapq para intercalar as leituras das partições
+import zlib  # Importa o módulo zlib para distribuir as sessões entre as partições e comprimir o arquivo
+import threading  # Importa o módulo threading para proteger o armazenamento em memória
+from abc import ABC, abstractmethod  # Importa as ferramentas para definir a interface do armazenamento
+from collections import namedtuple  # Importa namedtuple para as linhas lidas pela varredura
+
+# Consultas do histórico e dos checkpoints da resposta parcial do stream em andamento
+INSERT_MESSAGE_QUERY = "INSERT INTO chat_history (session_id, role, message, model_name, persona_name, temperature) VALUES (?, ?, ?, ?, ?, ?)"
+# O histórico de uma sessão inclui as mensagens arquivadas (um único registro comprimido, lido primeiro); a
+# leitura é uma única consulta, de modo que a mensagem movida pela manutenção não é perdida nem duplicada
+LOAD_SESSION_QUERY = (
+    "SELECT 0, NULL, messages FROM chat_history_archive WHERE session_id = ? "
+    "UNION ALL SELECT id, role, message FROM chat_history WHERE session_id = ? ORDER BY 1"
+)
+SCAN_QUERY = (
+    "SELECT id, session_id, role, message, model_name, persona_name, temperature, timestamp "
+    "FROM chat_history WHERE id > ? ORDER BY id LIMIT ?"
+)
+# Sessões arquivadas lidas pela varredura, paginadas pelo session_id (ARCHIVE_SCAN_SESSIONS por consulta)
+SCAN_ARCHIVE_QUERY = "SELECT session_id, messages FROM chat_history_archive WHERE session_id > ? ORDER BY session_id LIMIT ?"
+ARCHIVE_SCAN_SESSIONS = 100
+CHECKPOINT_QUERY = "INSERT OR REPLACE INTO stream_checkpoints (session_id, message, model_name, temperature) VALUES (?, ?, ?, ?)"
+LOAD_CHECKPOINT_QUERY = "SELECT message, model_name, temperature FROM stream_checkpoints WHERE session_id = ?"
+CLEAR_CHECKPOINT_QUERY = "DELETE FROM stream_checkpoints WHERE session_id = ?"
+
+# Consultas usadas para mover as sessões entre bancos de dados (veja move_sessions)
+SESSIONS_QUERY = (
+    "SELECT session_id FROM chat_history UNION SELECT session_id FROM chat_history_archive "
+    "UNION SELECT session_id FROM stream_checkpoints"
+)
+SESSION_ROWS_QUERY = (
+    "SELECT id, session_id, role, message, model_name, persona_name, temperature, timestamp "
+    "FROM chat_history WHERE session_id = ? ORDER BY id"
+)
+ARCHIVE_QUERY = (
+    "INSERT OR REPLACE INTO chat_history_archive (session_id, messages, message_count, first_timestamp, last_timestamp) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+LOAD_ARCHIVE_QUERY = "SELECT messages FROM chat_history_archive WHERE session_id = ?"
+MOVE_CHECKPOINT_QUERY = (
+    "INSERT OR IGNORE INTO stream_checkpoints (session_id, message, model_name, temperature, updated_at) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+
+# Arquivo, no diretório das partições, com o número de partições com que o histórico foi distribuído
+SHARDS_FILE = "shards.json"
+
+# Mensagem do histórico retornada pela varredura (id é sequencial dentro de cada armazenamento)
+HistoryRow = namedtuple(
+    "HistoryRow", ("id", "session_id", "role", "message", "model_name", "persona_name", "temperature", "timestamp")
+)
+
+
+def encode_archive(rows):
+    """
+    Comprime as mensagens de uma sessão para a tabela chat_history_archive.
+
+    Args:
+        rows (list): Mensagens da sessão (HistoryRow ou tuplas na mesma ordem), em ordem de gravação.
+
+    Returns:
+        bytes: JSON das mensagens (sem o session_id, que é a chave do arquivo), comprimido com zlib.
+    """
+    data = json.dumps([list(row[:1]) + list(row[2:]) for row in rows], ensure_ascii=False, separators=(",", ":"))
+    return zlib.compress(data.encode("utf-8"), 6)
+
+
+def decode_archive(session_id, blob):
+    """
+    Descomprime as mensagens arquivadas de uma sessão.
+
+    Args:
+        session_id (str): ID da sessão.
+        blob (bytes): Mensagens comprimidas por encode_archive.
+
+    Returns:
+        list: Um HistoryRow por mensagem, em ordem de gravação.
+    """
+    return [HistoryRow(row[0], session_id, *row[1:]) for row in json.loads(zlib.decompress(blob).decode("utf-8"))]
+
+
+def shard_for(session_id, shards):
+    """
+    Retorna a partição de uma sessão.
+
+    O hash é estável entre processos e reinícios (ao contrário de hash(), que varia a cada processo),
+    de modo que todas as mensagens de uma sessão ficam sempre na mesma partição.
+
+    Args:
+        session_id (str): ID da sessão.
+        shards (int): Número de partições.
+
+    Returns:
+        int: Índice da partição (de 0 a shards - 1).
+    """
+    return zlib.crc32(session_id.encode("utf-8")) % shards
+
+
+def move_sessions(source, route):
+    """
+    Move as sessões de um banco de dados para os bancos de dados indicados por route.
+
+    Usado quando o número de partições muda (ou o particionamento é ativado ou desativado), para que o
+    histórico das sessões existentes não fique em um banco de dados que não é mais consultado. As
+    mensagens de cada sessão movida são gravadas no arquivo comprimido (chat_history_archive) do destino,
+    antes das mensagens que ele já tiver, e o checkpoint é copiado se o destino não tiver um. Cada sessão
+    é gravada no destino antes de ser excluída da origem: uma interrupção no meio da mudança não perde
+    mensagens (no máximo, a sessão em andamento fica duplicada).
+
+    Args:
+        source (SQLiteConnection): Banco de dados de origem.
+        route (callable): Função que recebe o session_id e retorna o banco de dados de destino
+            (SQLiteConnection), ou source para manter a sessão onde está.
+
+    Returns:
+        int: Número de sessões movidas.
+    """
+    moved = 0
+    for (session_id,) in source.query(SESSIONS_QUERY):
+        target = route(session_id)
+        if target is source:
+            continue
+
+        archived = source.query(LOAD_ARCHIVE_QUERY, (session_id,))
+        rows = [HistoryRow(*row) for row in source.query(SESSION_ROWS_QUERY, (session_id,))]
+        rows = (decode_archive(session_id, archived[0][0]) if archived else []) + rows
+        checkpoint = source.query(
+            "SELECT message, model_name, temperature, updated_at FROM stream_checkpoints WHERE session_id = ?",
+            (session_id,),
+        )
+
+        with target.transaction() as cursor:
+            if rows:
+                existing = cursor.execute(LOAD_ARCHIVE_QUERY, (session_id,)).fetchone()
+                rows += decode_archive(session_id, existing[0]) if existing else []
+                cursor.execute(
+                    ARCHIVE_QUERY, (session_id, encode_archive(rows), len(rows), rows[0].timestamp, rows[-1].timestamp)
+                )
+            if checkpoint:
+                cursor.execute(MOVE_CHECKPOINT_QUERY, (session_id, *checkpoint[0]))
+
+        with source.transaction() as cursor:
+            cursor.execute("DELETE FROM chat_history WHERE session_id = ?", (session_id,))
+            cursor.execute("DELETE FROM chat_history_archive WHERE session_id = ?", (session_id,))
+            cursor.execute(CLEAR_CHECKPOINT_QUERY, (session_id,))
+        moved += 1
+    return moved
+
+
+class HistoryStore(ABC):
+    """
+    Interface do armazenamento do histórico das sessões e dos checkpoints da resposta em andamento.
+    """
+
+    @abstractmethod
+    def append(self, session_id, role, message, model_name, persona_name, temperature):
+        """
+        Grava uma mensagem no histórico da sessão.
+
+        Args:
+            session_id (str): ID da sessão.
+            role (str): Papel de quem enviou a mensagem ("user" ou "assistant").
+            message (str): Texto da mensagem.
+            model_name (str): Nome do modelo.
+            persona_name (str): Persona da sessão.
+            temperature (float): Temperatura do modelo.
+        """
+
+    @abstractmethod
+    def load(self, session_id):
+        """
+        Retorna o histórico de uma sessão, incluindo as mensagens ainda não gravadas em disco.
+
+        Args:
+            session_id (str): ID da sessão.
+
+        Returns:
+            list: Lista de tuplas (role, message), em ordem.
+        """
+
+    @abstractmethod
+    def save_checkpoint(self, session_id, message, model_name, temperature):
+        """
+        Grava (substituindo a anterior) a resposta parcial do stream em andamento de uma sessão.
+
+        Args:
+            session_id (str): ID da sessão.
+            message (str): Resposta recebida até agora.
+            model_name (str): Nome do modelo.
+            temperature (float): Temperatura do modelo.
+        """
+
+    @abstractmethod
+    def load_checkpoint(self, session_id):
+        """
+        Retorna a resposta parcial gravada de uma sessão.
+
+        Args:
+            session_id (str): ID da sessão.
+
+        Returns:
+            tuple: (message, model_name, temperature), ou None se não houver checkpoint.
+        """
+
+    @abstractmethod
+    def clear_checkpoint(self, session_id):
+        """
+        Descarta a resposta parcial gravada de uma sessão.
+
+        Args:
+            session_id (str): ID da sessão.
+        """
+
+    @abstractmethod
+    def scan(self, batch_size=1000):
+        """
+        Percorre todas as mensagens do histórico, de todas as sessões (para análises).
+
+        Args:
+            batch_size (int, optional): Número de mensagens lidas por consulta. Padrão: 1000.
+
+        Returns:
+            iterator: Um HistoryRow por mensagem, em ordem de gravação.
+        """
+
+    def flush(self):
+        """Espera a gravação das mensagens pendentes."""
+
+    def close(self):
+        """Grava as mensagens pendentes e libera os recursos do armazenamento."""
+
+    def stats(self):
+        """Retorna estatísticas do armazenamento."""
+        return {}
+
+
+class SQLiteHistoryStore(HistoryStore):
+    """
+    Histórico gravado nas tabelas chat_history e stream_checkpoints de um banco de dados SQLite.
+
+    Args:
+        connection (SQLiteConnection): Conexão com o banco de dados.
+        writer (HistoryWriter, optional): Escritor em segundo plano. Quando informado, as escritas são
+            gravadas em lote, fora do caminho da resposta.
+    """
+
+    def __init__(self, connection, writer=None):
+        """Inicializa o armazenamento."""
+        self.connection = connection
+        self.writer = writer
+        self._appended = 0
+
+    def _write(self, query, params):
+        """Executa uma escrita, em segundo plano se houver um escritor configurado."""
+        if self.writer:
+            self.writer.submit(query, params)  # Gravada em lote pela thread de escrita
+        else:
+            self.connection.execute(query, params)
+
+    def append(self, session_id, role, message, model_name, persona_name, temperature):
+        self._write(INSERT_MESSAGE_QUERY, (session_id, role, message, model_name, persona_name, temperature))
+        self._appended += 1
+
+    def load(self, session_id):
+        self.flush()  # Garante que as mensagens ainda na fila do escritor façam parte do histórico lido
+        messages = []
+        for _, role, message in self.connection.query(LOAD_SESSION_QUERY, (session_id, session_id)):
+            if role is None:  # Mensagens arquivadas pela manutenção do histórico
+                messages.extend((row.role, row.message) for row in decode_archive(session_id, message))
+            else:
+                messages.append((role, message))
+        return messages
+
+    def save_checkpoint(self, session_id, message, model_name, temperature):
+        self._write(CHECKPOINT_QUERY, (session_id, message, model_name, temperature))
+
+    def load_checkpoint(self, session_id):
+        checkpoint = self.connection.query(LOAD_CHECKPOINT_QUERY, (session_id,))
+        return tuple(checkpoint[0]) if checkpoint else None
+
+    def clear_checkpoint(self, session_id):
+        self._write(CLEAR_CHECKPOINT_QUERY, (session_id,))
+
+    def scan(self, batch_size=1000):
+        # As sessões arquivadas (mais antigas) vêm primeiro, agrupadas por sessão, e depois a tabela
+        # chat_history, em ordem de gravação
+        self.flush()
+        last_session_id = ""
+        while True:
+            archived = self.connection.query(SCAN_ARCHIVE_QUERY, (last_session_id, ARCHIVE_SCAN_SESSIONS))
+            for session_id, blob in archived:
+                yield from decode_archive(session_id, blob)
+            if len(archived) < ARCHIVE_SCAN_SESSIONS:
+                break
+            last_session_id = archived[-1][0]
+
+        last_id = 0
+        while True:
+            # Paginação pela chave primária: cada consulta é curta e não segura a conexão de leitura
+            rows = self.connection.query(SCAN_QUERY, (last_id, batch_size))
+            for row in rows:
+                yield HistoryRow(*row)
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+    def flush(self):
+        if self.writer:
+            self.writer.flush()
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+
+    def stats(self):
+        stats = {"appended": self._appended}
+        if self.writer:
+            stats["writer"] = self.writer.stats()
+        return stats
+
+
+class ShardedSQLiteHistoryStore(HistoryStore):
+    """
+    Histórico particionado entre vários bancos de dados SQLite, cada um com o seu próprio escritor.
+
+    O SQLite admite uma única escrita por vez em cada arquivo; com as sessões distribuídas entre N
+    arquivos (pelo hash do session_id), até N escritas ocorrem em paralelo. Todas as mensagens e o
+    checkpoint de uma sessão ficam na mesma partição, de modo que as leituras de uma sessão consultam
+    um único arquivo. A varredura (scan) intercala as mensagens de todas as partições.
+
+    Args:
+        shards (list): Armazenamentos das partições (ex.: SQLiteHistoryStore). A ordem define a partição
+            de cada sessão e não deve mudar depois que o histórico começou a ser gravado.
+    """
+
+    def __init__(self, shards):
+        """Inicializa o armazenamento particionado."""
+        if not shards:
+            raise ValueError("At least one shard is required.")
+        self.shards = list(shards)
+
+    @staticmethod
+    def _connect(directory, index):
+        """Abre o banco de dados de uma partição."""
+        from sql_connection import SQLiteConnection  # Importa a conexão apenas quando as partições são abertas
+
+        return SQLiteConnection(
+            database=os.path.join(directory, f"chat_history_{index:02d}.db"),
+            connection_name=f"chat_history_{index:02d}",
+            check_same_thread=False,  # A conexão é usada pela thread de escrita da partição
+        )
+
+    @staticmethod
+    def _existing_shards(directory):
+        """Retorna os índices das partições que já existem no diretório."""
+        names = glob.glob(os.path.join(glob.escape(directory), "chat_history_[0-9][0-9].db"))
+        return sorted(int(os.path.basename(name)[len("chat_history_"):-len(".db")]) for name in names)
+
+    @classmethod
+    def open(cls, directory, shards, writer_options=None, legacy_connection=None):
+        """
+        Abre (criando, se necessário) os bancos de dados das partições em um diretório.
+
+        O número de partições é gravado no diretório (shards.json). Quando ele muda, as sessões das
+        partições existentes são redistribuídas antes da abertura (veja move_sessions), de modo que o
+        histórico continua acessível; o mesmo ocorre com as sessões de legacy_connection (o banco de
+        dados usado sem particionamento).
+
+        Args:
+            directory (str): Diretório dos arquivos (chat_history_00.db, chat_history_01.db, ...).
+            shards (int): Número de partições.
+            writer_options (dict, optional): Argumentos do HistoryWriter de cada partição. Padrão: None.
+            legacy_connection (SQLiteConnection, optional): Banco de dados do histórico sem particionamento,
+                cujas sessões são movidas para as partições. Padrão: None.
+
+        Returns:
+            ShardedSQLiteHistoryStore: O armazenamento particionado.
+        """
+        from history_writer import HistoryWriter  # Importa o escritor apenas quando as partições são abertas
+
+        os.makedirs(directory, exist_ok=True)
+        connections = [cls._connect(directory, index) for index in range(shards)]
+
+        def route(session_id):
+            return connections[shard_for(session_id, shards)]
+
+        shards_path = os.path.join(directory, SHARDS_FILE)
+        previous = None
+        if os.path.exists(shards_path):
+            with open(shards_path, encoding="utf-8") as shards_file:
+                previous = json.load(shards_file)["shards"]
+
+        if previous != shards:
+            # Redistribui as sessões das partições existentes (inclusive as que deixam de existir)
+            for index in cls._existing_shards(directory):
+                source = connections[index] if index < shards else cls._connect(directory, index)
+                move_sessions(source, route)
+            with open(shards_path, "w", encoding="utf-8") as shards_file:
+                json.dump({"shards": shards}, shards_file)
+        if legacy_connection is not None:
+            move_sessions(legacy_connection, route)
+
+        stores = [SQLiteHistoryStore(connection, HistoryWriter(connection, **(writer_options or {}))) for connection in connections]
+        return cls(stores)
+
+    @classmethod
+    def drain(cls, directory, connection):
+        """
+        Move as sessões das partições de um diretório para um único banco de dados (ao desativar o particionamento).
+
+        Args:
+            directory (str): Diretório das partições.
+            connection (SQLiteConnection): Banco de dados do histórico sem particionamento.
+
+        Returns:
+            int: Número de sessões movidas.
+        """
+        if not os.path.isdir(directory):
+            return 0
+        moved = sum(move_sessions(cls._connect(directory, index), lambda _: connection) for index in cls._existing_shards(directory))
+        shards_path = os.path.join(directory, SHARDS_FILE)
+        if os.path.exists(shards_path):
+            os.remove(shards_path)  # Uma nova ativação redistribui as partições que existirem
+        return moved
+
+    def shard(self, session_id):
+        """Retorna o armazenamento da partição de uma sessão."""
+        return self.shards[shard_for(session_id, len(self.shards))]
+
+    def append(self, session_id, role, message, model_name, persona_name, temperature):
+        self.shard(session_id).append(session_id, role, message, model_name, persona_name, temperature)
+
+    def load(self, session_id):
+        return self.shard(session_id).load(session_id)
+
+    def save_checkpoint(self, session_id, message, model_name, temperature):
+        self.shard(session_id).save_checkpoint(session_id, message, model_name, temperature)
+
+    def load_checkpoint(self, session_id):
+        return self.shard(session_id).load_checkpoint(session_id)
+
+    def clear_checkpoint(self, session_id):
+        self.shard(session_id).clear_checkpoint(session_id)
+
+    def scan(self, batch_size=1000):
+        # As partições são intercaladas pelo horário das mensagens
+        return heapq.merge(*(shard.scan(batch_size) for shard in self.shards), key=lambda row: row.timestamp)
+
+    def flush(self):
+        for shard in self.shards:
+            shard.flush()
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+    def stats(self):
+        shards = [shard.stats() for shard in self.shards]
+        return {"shards": len(shards), "appended": sum(shard.get("appended", 0) for shard in shards), "per_shard": shards}
+
+
+class InMemoryHistoryStore(HistoryStore):
+    """
+    Histórico mantido apenas na memória do processo (testes e execuções sem banco de dados).
+    """
+
+    def __init__(self):
+        """Inicializa o armazenamento vazio."""
+        self._lock = threading.Lock()
+        self._rows = []  # Todas as mensagens, em ordem de gravação
+        self._sessions = {}  # session_id -> lista de (role, message)
+        self._checkpoints = {}  # session_id -> (message, model_name, temperature)
+
+    def append(self, session_id, role, message, model_name, persona_name, temperature):
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())  # Mesmo formato do CURRENT_TIMESTAMP
+        with self._lock:
+            row = HistoryRow(len(self._rows) + 1, session_id, role, message, model_name, persona_name, temperature, timestamp)
+            self._rows.append(row)
+            self._sessions.setdefault(session_id, []).append((role, message))
+
+    def load(self, session_id):
+        with self._lock:
+            return list(self._sessions.get(session_id, ()))
+
+    def save_checkpoint(self, session_id, message, model_name, temperature):
+        with self._lock:
+            self._checkpoints[session_id] = (message, model_name, temperature)
+
+    def load_checkpoint(self, session_id):
+        with self._lock:
+            return self._checkpoints.get(session_id)
+
+    def clear_checkpoint(self, session_id):
+        with self._lock:
+            self._checkpoints.pop(session_id, None)
+
+    def scan(self, batch_size=1000):
+        with self._lock:
+            rows = list(self._rows)  # Cópia: gravações durante a varredura não a afetam
+        return iter(rows)
+
+    def stats(self):
+        with self._lock:
+            return {"appended": len(self._rows), "sessions": len(self._sessions), "checkpoints": len(self._checkpoints)}
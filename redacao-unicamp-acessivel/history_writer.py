@@ -0,0 +1,178 @@
+import time  # Importa o módulo time para medir intervalos e esperas
+import queue  # Importa o módulo queue para a fila limitada de escritas
+import atexit  # Importa o módulo atexit para gravar as escritas pendentes ao encerrar o processo
+import threading  # Importa o módulo threading para a thread de escrita em segundo plano
+
+# Marcador usado para encerrar a thread de escrita
+_STOP = object()
+_FLUSH = object()  # Pedido de gravação: (_FLUSH, evento sinalizado quando as escritas anteriores forem gravadas)
+
+
+class HistoryWriter:
+    """
+    Escritor em segundo plano (write-behind) para o banco de dados do histórico.
+
+    As escritas são colocadas em uma fila limitada e gravadas por uma única thread, cada grupo em uma
+    única transação (com um executemany por sequência de consultas iguais), de modo que a latência do
+    commit (fsync) fica fora do caminho da resposta do chat. Os grupos são gravados quando atingem
+    batch_size escritas ou a cada flush_interval segundos, o que ocorrer primeiro. Quando a fila está cheia, quem escreve espera
+    (back-pressure), e essas esperas são contabilizadas nas estatísticas.
+
+    Args:
+        connection (SQLiteConnection): Conexão com o banco de dados.
+        batch_size (int, optional): Número máximo de escritas por transação. Padrão: 100.
+        flush_interval (float, optional): Intervalo máximo (em segundos) entre gravações. Padrão: 0.5.
+        max_queue_size (int, optional): Tamanho máximo da fila de escritas. Padrão: 10000.
+    """
+
+    def __init__(self, connection, batch_size=100, flush_interval=0.5, max_queue_size=10000):
+        """Inicializa o escritor e inicia a thread de escrita."""
+        self.connection = connection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._flush_requested = threading.Event()  # Pede à thread que grave sem esperar o intervalo
+        self._stats_lock = threading.Lock()
+        self._closed = False
+        self._close_lock = threading.Lock()  # Ordena os pedidos de gravação antes do encerramento
+
+        # Estatísticas de escrita e de back-pressure
+        self._submitted = 0
+        self._written = 0
+        self._failed = 0
+        self._batches = 0
+        self._blocked_submits = 0
+        self._blocked_seconds = 0.0
+        self._max_queue_depth = 0
+        self.last_error = None
+
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+        # Grava as escritas pendentes quando o processo for encerrado
+        atexit.register(self.close)
+
+    def submit(self, query, params):
+        """
+        Enfileira uma escrita (consulta SQL e parâmetros) para ser gravada em segundo plano.
+
+        Args:
+            query (str): Consulta SQL de escrita (ex.: INSERT).
+            params (tuple): Parâmetros da consulta.
+        """
+        if self._closed:
+            raise RuntimeError("HistoryWriter is closed.")
+
+        try:
+            self._queue.put_nowait((query, params))
+        except queue.Full:
+            # Fila cheia: espera a thread de escrita liberar espaço (back-pressure)
+            start = time.perf_counter()
+            self._flush_requested.set()
+            self._queue.put((query, params))
+            with self._stats_lock:
+                self._blocked_submits += 1
+                self._blocked_seconds += time.perf_counter() - start
+
+        with self._stats_lock:
+            self._submitted += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+
+    def flush(self):
+        """Bloqueia até que todas as escritas enfileiradas até agora tenham sido gravadas."""
+        # Espera apenas as escritas anteriores ao pedido: as enfileiradas depois por outras sessões não o atrasam
+        done = threading.Event()
+        with self._close_lock:
+            if self._closed:
+                return  # As escritas pendentes já foram gravadas pelo encerramento
+            self._queue.put((_FLUSH, done))
+        done.wait()
+
+    def close(self):
+        """Grava as escritas pendentes e encerra a thread de escrita."""
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+            self._flush_requested.set()
+        self._thread.join()
+
+    def stats(self):
+        """Retorna estatísticas de escrita e de back-pressure."""
+        with self._stats_lock:
+            return {
+                "submitted": self._submitted,
+                "written": self._written,
+                "failed": self._failed,
+                "batches": self._batches,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "blocked_submits": self._blocked_submits,
+                "blocked_seconds": self._blocked_seconds,
+            }
+
+    def _run(self):
+        """Laço da thread de escrita: agrupa as escritas e as grava em transações."""
+        stop = False
+        while not stop:
+            batch = []
+            flushes = []  # Eventos dos pedidos de gravação, sinalizados depois que o grupo é gravado
+            deadline = time.monotonic() + self.flush_interval
+
+            # Acumula escritas até completar o grupo, vencer o intervalo ou receber um pedido de gravação
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if self._flush_requested.is_set() and batch:
+                    timeout = 0
+                try:
+                    item = self._queue.get(timeout=max(timeout, 0)) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    if batch or time.monotonic() >= deadline:
+                        break
+                    continue
+
+                if item is _STOP:
+                    self._queue.task_done()
+                    stop = True
+                    break
+                if item[0] is _FLUSH:
+                    self._queue.task_done()
+                    flushes.append(item[1])
+                    break  # As escritas anteriores ao pedido estão no grupo (ou já foram gravadas)
+                batch.append(item)
+
+            if self._queue.empty():
+                self._flush_requested.clear()
+
+            if batch:
+                self._write_batch(batch)
+            for done in flushes:
+                done.set()
+
+    def _write_batch(self, batch):
+        """Grava um grupo de escritas em uma única transação, com um executemany por sequência de consultas iguais."""
+        try:
+            # Um único commit (fsync) por grupo, mesmo com consultas diferentes intercaladas
+            with self.connection.transaction() as cursor:
+                start = 0
+                while start < len(batch):
+                    query = batch[start][0]
+                    end = start
+                    while end < len(batch) and batch[end][0] == query:
+                        end += 1
+                    cursor.executemany(query, [params for _, params in batch[start:end]])
+                    start = end
+
+            with self._stats_lock:
+                self._written += len(batch)
+                self._batches += 1
+        except Exception as e:
+            # Uma falha de escrita não pode derrubar a thread; as escritas do grupo são descartadas
+            with self._stats_lock:
+                self._failed += len(batch)
+                self.last_error = e
+        finally:
+            for _ in batch:
+                self._queue.task_done()
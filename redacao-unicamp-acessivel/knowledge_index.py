@@ -0,0 +1,313 @@
+import os  # Importa o módulo os para manipular caminhos e diretórios
+import re  # Importa o módulo re para separar os textos em termos
+import sys  # Importa o módulo sys para ler os argumentos da linha de comando
+import json  # Importa o módulo json para ler e gravar o cabeçalho do índice
+import math  # Importa o módulo math para o cálculo do IDF do BM25
+import mmap  # Importa o módulo mmap para mapear o índice em memória
+import heapq  # Importa o módulo heapq para selecionar os melhores trechos
+import struct  # Importa o módulo struct para ler e gravar o cabeçalho binário
+import threading  # Importa o módulo threading para proteger o cache de índices
+import unicodedata  # Importa o módulo unicodedata para remover acentos
+from array import array  # Importa array para gravar as listas de postings de forma compacta
+from collections import Counter, defaultdict  # Importa estruturas auxiliares para a indexação
+from persona_registry import get_persona_registry, thaw  # Importa o registro de personas compartilhado pelo processo
+
+# Diretório padrão onde os índices construídos são armazenados
+DEFAULT_INDEX_DIR = os.path.join(".cache", "indices")
+
+# Campo da persona que contém a base de conhecimento indexada
+KNOWLEDGE_FIELD = "base_de_conhecimento_da_persona"
+
+# Tamanho máximo (em caracteres) de cada trecho indexado
+PASSAGE_CHARS = 1500
+
+# Parâmetros do BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Formato do arquivo: assinatura, versão e tamanho do cabeçalho JSON
+_MAGIC = b"RUKI"
+_VERSION = 1
+_PREAMBLE = struct.Struct("<4sII")
+
+# Palavras muito frequentes em português que não ajudam a diferenciar os trechos
+_STOPWORDS = frozenset(
+    "a o as os e de da do das dos em no na nos nas um uma uns umas por para com sem que se "
+    "ao aos à às ou como mais mas seu sua seus suas ele ela eles elas isso esse essa este esta "
+    "foi ser são é há me te lhe nao não já também muito entre sobre até quando".split()
+)
+
+_TERM_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Referências a uma proposta ("proposta 1 de 2024", "ano_2024_proposta_1") geram um termo composto,
+# muito mais seletivo que os termos "proposta", "1" e "2024" isolados
+_PROPOSAL_PATTERNS = (
+    re.compile(r"proposta[\s_]*(\d)\D{1,12}?((?:19|20)\d{2})"),
+    re.compile(r"((?:19|20)\d{2})[\s_]*proposta[\s_]*(\d)"),
+)
+
+# Cache em memória dos índices abertos, compartilhado por todas as sessões do processo
+_open_indices = {}
+_open_indices_lock = threading.Lock()
+
+
+def tokenize(text):
+    """
+    Separa um texto em termos normalizados (minúsculos, sem acentos e sem stopwords).
+
+    Args:
+        text (str): Texto a ser separado.
+
+    Returns:
+        list: Lista de termos.
+    """
+    normalized = unicodedata.normalize("NFKD", text.lower())
+    normalized = normalized.encode("ascii", "ignore").decode("ascii")
+    terms = [term for term in _TERM_PATTERN.findall(normalized) if term not in _STOPWORDS]
+
+    number_first, year_first = _PROPOSAL_PATTERNS
+    terms.extend(f"proposta{number}de{year}" for number, year in number_first.findall(normalized))
+    terms.extend(f"proposta{number}de{year}" for year, number in year_first.findall(normalized))
+    return terms
+
+
+def _flatten(value, path):
+    """Percorre a base de conhecimento e gera pares (caminho, texto) para cada valor folha."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _flatten(item, path + [str(key)])
+    elif isinstance(value, list):
+        for position, item in enumerate(value):
+            yield from _flatten(item, path + [str(position)])
+    elif value not in (None, ""):
+        yield path, str(value)
+
+
+def _split_text(text, max_chars):
+    """Divide um texto longo em partes de até max_chars, cortando em espaços em branco."""
+    while len(text) > max_chars:
+        cut = text.rfind(" ", 0, max_chars)
+        cut = cut if cut > 0 else max_chars
+        yield text[:cut]
+        text = text[cut:].lstrip()
+    if text:
+        yield text
+
+
+def chunk_knowledge_base(knowledge_base, max_chars=PASSAGE_CHARS):
+    """
+    Divide a base de conhecimento em trechos de até max_chars caracteres.
+
+    Valores folha consecutivos do mesmo ramo são agrupados no mesmo trecho, e cada trecho começa
+    com o caminho do ramo (por exemplo, "ano_2024 > ano_2024_proposta_1 > coletanea"), o que
+    permite encontrar a proposta pelo número e ano.
+
+    Args:
+        knowledge_base (dict): Base de conhecimento da persona.
+        max_chars (int, optional): Tamanho máximo de cada trecho. Padrão: PASSAGE_CHARS.
+
+    Returns:
+        list: Lista de trechos (str).
+    """
+    passages = []
+    current_branch, current_lines, current_size = None, [], 0
+
+    def flush():
+        if current_lines:
+            passages.append(" > ".join(current_branch) + "\n" + "\n".join(current_lines))
+
+    for path, text in _flatten(knowledge_base, []):
+        branch, leaf = path[:-1], path[-1]
+
+        for part in _split_text(text, max_chars):
+            line = f"{leaf}: {part}"
+            if branch != current_branch or current_size + len(line) > max_chars:
+                flush()
+                current_branch, current_lines, current_size = branch, [], 0
+            current_lines.append(line)
+            current_size += len(line) + 1
+
+    flush()
+    return passages
+
+
+def build_index(passages, index_path):
+    """
+    Constrói o índice BM25 dos trechos e o grava em index_path.
+
+    O arquivo contém um cabeçalho JSON (vocabulário e deslocamentos), seguido de regiões binárias
+    com o tamanho de cada trecho, os deslocamentos dos textos, as listas de postings
+    (pares trecho/frequência) e os textos em UTF-8.
+
+    Args:
+        passages (list): Lista de trechos a serem indexados.
+        index_path (str): Caminho do arquivo de índice a ser gravado.
+    """
+    postings = defaultdict(list)  # termo -> [(trecho, frequência)]
+    doc_lengths = array("I")
+
+    for doc_id, passage in enumerate(passages):
+        terms = tokenize(passage)
+        doc_lengths.append(len(terms))
+        for term, frequency in Counter(terms).items():
+            postings[term].append((doc_id, frequency))
+
+    # Serializa as listas de postings em um único array e guarda o deslocamento de cada termo
+    vocabulary = {}
+    postings_array = array("I")
+    for term in sorted(postings):
+        vocabulary[term] = [len(postings_array) // 2, len(postings[term])]  # Posição do primeiro par e quantidade
+        for doc_id, frequency in postings[term]:
+            postings_array.extend((doc_id, frequency))
+
+    encoded_passages = [passage.encode("utf-8") for passage in passages]
+    text_offsets = array("Q", [0])
+    for encoded in encoded_passages:
+        text_offsets.append(text_offsets[-1] + len(encoded))
+
+    header = {
+        "num_docs": len(passages),
+        "avg_doc_length": (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0,
+        "vocabulary": vocabulary,
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    # Grava em um arquivo temporário e renomeia, para que leitores nunca vejam um índice parcial
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    tmp_path = f"{index_path}.{os.getpid()}.{threading.get_ident()}.tmp"  # Único por processo e thread
+    with open(tmp_path, "wb") as index_file:
+        index_file.write(_PREAMBLE.pack(_MAGIC, _VERSION, len(header_bytes)))
+        index_file.write(header_bytes)
+        index_file.write(b"\0" * (-index_file.tell() % 8))  # Alinha as regiões binárias
+        index_file.write(doc_lengths.tobytes())
+        index_file.write(b"\0" * (-index_file.tell() % 8))
+        index_file.write(text_offsets.tobytes())
+        index_file.write(postings_array.tobytes())
+        for encoded in encoded_passages:
+            index_file.write(encoded)
+    os.replace(tmp_path, index_path)
+
+
+class KnowledgeIndex:
+    """
+    Índice BM25 somente leitura, mapeado em memória a partir do arquivo gerado por build_index.
+
+    As regiões binárias são lidas diretamente do mmap, de modo que vários processos compartilham
+    as mesmas páginas do arquivo.
+
+    Args:
+        index_path (str): Caminho do arquivo de índice.
+    """
+
+    def __init__(self, index_path):
+        """Abre e mapeia o arquivo de índice."""
+        self.index_path = index_path
+
+        with open(index_path, "rb") as index_file:
+            self._mmap = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, header_size = _PREAMBLE.unpack_from(self._mmap, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"Invalid knowledge index file: {index_path}")
+
+        header_start = _PREAMBLE.size
+        header = json.loads(self._mmap[header_start : header_start + header_size].decode("utf-8"))
+        self.num_docs = header["num_docs"]
+        self.avg_doc_length = header["avg_doc_length"]
+        self._vocabulary = header["vocabulary"]
+
+        # Calcula onde começa cada região binária do arquivo
+        offset = header_start + header_size
+        offset += -offset % 8
+        view = memoryview(self._mmap)
+
+        self._doc_lengths = view[offset : offset + 4 * self.num_docs].cast("I")
+        offset += 4 * self.num_docs
+        offset += -offset % 8
+
+        self._text_offsets = view[offset : offset + 8 * (self.num_docs + 1)].cast("Q")
+        offset += 8 * (self.num_docs + 1)
+
+        num_postings = sum(count for _, count in self._vocabulary.values())
+        self._postings = view[offset : offset + 8 * num_postings].cast("I")
+        self._texts_start = offset + 8 * num_postings
+
+    def __len__(self):
+        """Retorna o número de trechos indexados."""
+        return self.num_docs
+
+    def passage(self, doc_id):
+        """Retorna o texto de um trecho indexado."""
+        start = self._texts_start + self._text_offsets[doc_id]
+        end = self._texts_start + self._text_offsets[doc_id + 1]
+        return self._mmap[start:end].decode("utf-8")
+
+    def search(self, query, top_k=4):
+        """
+        Busca os trechos mais relevantes para a consulta, ordenados pela pontuação BM25.
+
+        Args:
+            query (str): Texto da consulta.
+            top_k (int, optional): Número máximo de trechos retornados. Padrão: 4.
+
+        Returns:
+            list: Lista de tuplas (pontuação, trecho).
+        """
+        scores = defaultdict(float)
+
+        for term in set(tokenize(query)):
+            entry = self._vocabulary.get(term)
+            if entry is None:
+                continue
+
+            start, count = entry
+            idf = math.log(1 + (self.num_docs - count + 0.5) / (count + 0.5))
+            postings = self._postings[2 * start : 2 * (start + count)]
+
+            for position in range(0, len(postings), 2):
+                doc_id, frequency = postings[position], postings[position + 1]
+                length_norm = 1 - BM25_B + BM25_B * self._doc_lengths[doc_id] / self.avg_doc_length
+                scores[doc_id] += idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm)
+
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [(score, self.passage(doc_id)) for doc_id, score in best]
+
+
+def load_or_build_index(persona_path, index_dir=DEFAULT_INDEX_DIR, persona_registry=None):
+    """
+    Abre o índice da base de conhecimento da persona, construindo-o se ainda não existir.
+
+    O índice é identificado pelo hash do arquivo da persona, então qualquer alteração na persona
+    gera um novo índice. Ele também pode ser construído offline executando este módulo.
+
+    Args:
+        persona_path (str): Nome da persona ou caminho para o seu arquivo JSON.
+        index_dir (str, optional): Diretório onde os índices são armazenados.
+        persona_registry (PersonaRegistry, optional): Registro que lê a persona. Padrão: o registro do processo.
+
+    Returns:
+        KnowledgeIndex: O índice da persona, ou None se ela não possuir base de conhecimento.
+    """
+    persona = (persona_registry or get_persona_registry()).get(persona_path)
+    index_path = os.path.join(index_dir, persona.persona_hash + ".idx")
+
+    with _open_indices_lock:
+        if index_path in _open_indices:
+            return _open_indices[index_path]
+
+        if not os.path.exists(index_path):
+            knowledge_base = thaw(persona.get(KNOWLEDGE_FIELD))
+            if not knowledge_base:
+                return None
+            build_index(chunk_knowledge_base(knowledge_base), index_path)
+
+        index = KnowledgeIndex(index_path)
+        _open_indices[index_path] = index
+        return index
+
+
+if __name__ == "__main__":
+    # Constrói (offline) os índices das personas informadas
+    for path in sys.argv[1:]:
+        built = load_or_build_index(path)
+        print(f"{path}: {len(built) if built else 0} trechos indexados")
@@ -1,7 +1,11 @@
 import time
-from ollama import Client  # Import the ollama Client
-import google.generativeai as genai  # Import the Google Generative AI library
+import asyncio  # Import asyncio for the asynchronous streaming interface
+import hashlib  # Import hashlib to key the shared context caches by API key
+import datetime  # Import datetime to express the context cache TTL
+import threading  # Import threading to protect the shared context caches
 from abc import ABC, abstractmethod  # Import ABC and abstractmethod for defining abstract classes and methods
+from persona_compiler import estimate_tokens  # Import the local token estimator
+from metrics import metrics  # Import the process-wide metrics registry
 
 # Define uma classe base abstrata para modelos de linguagem
 class LLMBaseModel(ABC):
@@ -30,6 +34,9 @@ class LLMBaseModel(ABC):
         if self._temperature is None:
             self._temperature = 0.7  # Temperatura padrão
 
+        # Tokens da última resposta informados pelo provedor ({"prompt_tokens", "output_tokens"}), ou None
+        self.last_usage = None
+
     def __str__(self) -> str:
         """Retorna o nome do modelo."""
         return self._model_name
@@ -59,6 +66,29 @@ class LLMBaseModel(ABC):
             )
         self._temperature = value
 
+    def set_persona_prefix(self, prefix, prefix_hash):
+        """
+        Oferece ao modelo o prefixo da persona, para que ele o mantenha fora das mensagens.
+
+        Args:
+            prefix (str): Prompt completo da persona.
+            prefix_hash (str): Hash que identifica a versão da persona.
+
+        Returns:
+            bool: True se o modelo passou a manter o prefixo (e a sessão não deve enviá-lo),
+                False se a persona deve continuar sendo enviada no primeiro turno.
+        """
+        return False  # Por padrão, os modelos não mantêm o prefixo da persona
+
+    def reset_history(self):
+        """
+        Descarta o histórico da conversa mantido pelo modelo, preservando o prefixo da persona (se mantido).
+
+        Usado pela sessão de chat para limitar o contexto acumulado em conversas longas; a sessão passa
+        a enviar, no turno seguinte, um resumo da conversa no lugar do histórico descartado.
+        """
+        pass  # Por padrão, os modelos não mantêm histórico
+
     # Define o método send_stream_message como abstrato
     @abstractmethod
     def send_stream_message(self, message):
@@ -73,22 +103,63 @@ class LLMBaseModel(ABC):
         """
         pass
 
+    async def async_send_stream_message(self, message):
+        """
+        Versão assíncrona de send_stream_message.
+
+        A implementação padrão consome o gerador síncrono em um executor, para que modelos sem
+        cliente assíncrono não bloqueiem o event loop. Subclasses com cliente assíncrono a sobrescrevem.
+
+        Args:
+            message (str): Mensagem a ser enviada para o modelo.
+
+        Returns:
+            async generator: Um gerador assíncrono que retorna as partes da resposta em stream.
+        """
+        loop = asyncio.get_running_loop()
+        response_stream = self.send_stream_message(message)
+        end_of_stream = object()  # Marcador de fim do gerador síncrono
+
+        try:
+            while True:
+                chunk = await loop.run_in_executor(None, next, response_stream, end_of_stream)
+                if chunk is end_of_stream:
+                    break
+                yield chunk
+        finally:
+            # Se o stream foi cancelado durante um next(), o gerador ainda está executando no executor
+            # e será descartado quando terminar
+            if not response_stream.gi_running:
+                response_stream.close()
+
 # Define uma classe MockModel que simula a resposta de um modelo de linguagem
 class MockModel(LLMBaseModel):
     """
     Modelo Mock que simula a resposta de um modelo de linguagem.
 
+    Por padrão, responde imediatamente com o tamanho da mensagem recebida. Os parâmetros de tempo e
+    de tamanho permitem simular a latência de um modelo real em testes de carga.
+
     Args:
         model_name (str): Nome do modelo.
         temperature (float, optional): Temperatura do modelo. Padrão: 0.7.
         temperature_range (tuple, optional): Faixa de valores permitidos para a temperatura.
             Padrão: (0.0, 2.0).
+        time_to_first_token (float, optional): Espera (em segundos) antes do primeiro chunk. Padrão: 0.0.
+        inter_chunk_delay (float, optional): Espera (em segundos) entre os chunks. Padrão: 0.0.
+        chunk_size (int, optional): Tamanho (em caracteres) de cada chunk. Padrão: None (um único chunk).
+        response_length (int, optional): Tamanho (em caracteres) da resposta simulada, obtida repetindo
+            a resposta padrão. Padrão: None (apenas a resposta padrão).
     """
     def __init__(
         self,
         model_name,
         temperature=None,  # Permite que a temperatura seja opcional
-        temperature_range=(0.0, 2.0)
+        temperature_range=(0.0, 2.0),
+        time_to_first_token=0.0,
+        inter_chunk_delay=0.0,
+        chunk_size=None,
+        response_length=None,
     ):
         """Inicializa a classe MockModel."""
         super().__init__(
@@ -96,6 +167,23 @@ class MockModel(LLMBaseModel):
             temperature,  # Passa a temperatura para a superclasse
             temperature_range
         )
+        self.time_to_first_token = time_to_first_token
+        self.inter_chunk_delay = inter_chunk_delay
+        self.chunk_size = chunk_size
+        self.response_length = response_length
+
+    def _response_chunks(self, message):
+        """Monta a resposta simulada para a mensagem e a divide em chunks."""
+        response = "User message length is " + str(len(message))  # Resposta padrão: o tamanho da mensagem
+
+        if self.response_length:
+            # Repete a resposta padrão até atingir o tamanho pedido
+            repetitions = self.response_length // (len(response) + 1) + 1
+            response = " ".join([response] * repetitions)[:self.response_length]
+
+        if not self.chunk_size:
+            return [response]
+        return [response[start:start + self.chunk_size] for start in range(0, len(response), self.chunk_size)]
 
     def send_stream_message(self, message):
         """
@@ -107,10 +195,228 @@ class MockModel(LLMBaseModel):
         Returns:
             generator: Um gerador que retorna o tamanho da mensagem.
         """
-        chunk_length = 10  # Define o tamanho do chunk para a resposta simulada
-        message_length = len(message)  # Calcula o tamanho da mensagem
+        for position, chunk in enumerate(self._response_chunks(message)):
+            delay = self.time_to_first_token if position == 0 else self.inter_chunk_delay
+            if delay:
+                time.sleep(delay)  # Simula o tempo de geração do chunk
+            yield chunk  # Retorna o chunk da resposta simulada
+
+    async def async_send_stream_message(self, message):
+        """
+        Versão assíncrona de send_stream_message.
+
+        Args:
+            message (str): Mensagem a ser enviada para o modelo.
+
+        Returns:
+            async generator: Um gerador assíncrono que retorna o tamanho da mensagem.
+        """
+        for position, chunk in enumerate(self._response_chunks(message)):
+            delay = self.time_to_first_token if position == 0 else self.inter_chunk_delay
+            await asyncio.sleep(delay)  # Simula o tempo de geração (e devolve o controle ao event loop)
+            yield chunk
+
+def _import_genai():
+    """
+    Importa a biblioteca do Google Gemini no primeiro uso.
+
+    A biblioteca (e suas dependências, como grpc e protobuf) é lenta para importar; importá-la apenas
+    quando um GeminiModel é usado mantém rápida a inicialização dos processos que não a utilizam.
+    """
+    import google.generativeai as genai  # Import the Google Generative AI library
+
+    return genai
+
+# Clientes da API do Gemini por chave de API (pelo hash da chave). Todas as sessões rodam no mesmo
+# processo, e genai.configure é global: cada modelo usa os clientes da própria chave, nunca a configuração
+# global, para que as chamadas de um usuário não sejam feitas (e cobradas) com a chave de outro
+_gemini_clients = {}
+_gemini_clients_lock = threading.Lock()
+
+
+def get_gemini_clients(api_key):
+    """
+    Retorna os clientes (de geração síncrono e assíncrono, e de context caching) da chave de API.
+
+    Args:
+        api_key (str): Chave de API do Google Gemini.
+
+    Returns:
+        tuple: (GenerativeServiceClient, GenerativeServiceAsyncClient, CacheServiceClient) da chave.
+    """
+    key = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+    with _gemini_clients_lock:
+        if key not in _gemini_clients:
+            from google.ai import generativelanguage as glm  # Cliente de baixo nível, instalado com o genai
+
+            options = {"api_key": api_key}
+            _gemini_clients[key] = (
+                glm.GenerativeServiceClient(client_options=options),
+                glm.GenerativeServiceAsyncClient(client_options=options),
+                glm.CacheServiceClient(client_options=options),
+            )
+        return _gemini_clients[key]
+
+
+def _create_gemini_model(api_key, model_name, generation_config, cached_content=None):
+    """
+    Cria um GenerativeModel que faz as chamadas com a chave de API informada.
+
+    Args:
+        api_key (str): Chave de API do Google Gemini.
+        model_name (str): Nome do modelo (ex.: "gemini-1.5-flash" ou "models/gemini-1.5-flash").
+        generation_config (GenerationConfig): Configuração de geração.
+        cached_content (str, optional): Nome do conteúdo em cache usado como prefixo. Padrão: None.
+
+    Returns:
+        GenerativeModel: O modelo, com os clientes da chave.
+    """
+    genai = _import_genai()
+    model = genai.GenerativeModel(model_name, generation_config=generation_config)
+    # O GenerativeModel só recorre aos clientes globais (genai.configure) quando não tem os próprios
+    model._client, model._async_client, _ = get_gemini_clients(api_key)
+    if cached_content is not None:
+        model._cached_content = cached_content  # Mesmo atributo preenchido por from_cached_content
+    return model
+
+
+class GenaiCacheClient:
+    """Cliente de context caching que usa a API do Google Gemini, com a chave de API de cada chamada."""
+
+    def create_cached_content(self, api_key, model_name, system_instruction, ttl_seconds):
+        """Cria um conteúdo em cache com a instrução de sistema (persona) e retorna seu nome."""
+        from google.ai import generativelanguage as glm
+
+        cached_content = get_gemini_clients(api_key)[2].create_cached_content(
+            glm.CreateCachedContentRequest(
+                cached_content=glm.CachedContent(
+                    model=f"models/{model_name}",
+                    system_instruction=glm.Content(parts=[glm.Part(text=system_instruction)]),
+                    ttl=datetime.timedelta(seconds=ttl_seconds),
+                )
+            )
+        )
+        return cached_content.name
+
+    def create_model(self, api_key, model_name, cached_content, generation_config):
+        """Cria um GenerativeModel que usa o conteúdo em cache como prefixo."""
+        return _create_gemini_model(api_key, f"models/{model_name}", generation_config, cached_content)
+
+
+class FakeCacheClient:
+    """
+    Cliente de context caching em memória, para testes offline.
+
+    Os modelos criados respondem com o tamanho da mensagem recebida (como o MockModel) e
+    registram o prefixo em cache utilizado.
+    """
+
+    class _Chunk:
+        def __init__(self, text):
+            self.text = text
+
+    class _Chat:
+        def __init__(self, cached_content):
+            self.cached_content = cached_content
+            self.history = []
+
+        def send_message(self, message, stream=False):
+            self.history.append(message)
+            return iter([FakeCacheClient._Chunk("User message length is " + str(len(message)))])
+
+        async def send_message_async(self, message, stream=False):
+            chunks = self.send_message(message, stream)
+
+            async def response():
+                for chunk in chunks:
+                    yield chunk
+
+            return response()
+
+    class _Model:
+        def __init__(self, cached_content):
+            self.cached_content = cached_content
+
+        def start_chat(self, history=None):
+            chat = FakeCacheClient._Chat(self.cached_content)
+            chat.history = list(history or [])
+            return chat
+
+    def __init__(self):
+        """Inicializa o cliente falso."""
+        self.created = []  # Prefixos criados, na ordem de criação
+        self.api_keys = []  # Chave de API de cada prefixo criado
+
+    def create_cached_content(self, api_key, model_name, system_instruction, ttl_seconds):
+        """Registra a criação do conteúdo em cache e retorna um identificador falso."""
+        self.created.append((model_name, system_instruction, ttl_seconds))
+        self.api_keys.append(api_key)
+        return f"cachedContents/fake-{len(self.created)}"
+
+    def create_model(self, api_key, model_name, cached_content, generation_config):
+        """Cria um modelo falso associado ao conteúdo em cache."""
+        return FakeCacheClient._Model(cached_content)
+
+
+class GeminiContextCache:
+    """
+    Prefixos de persona em cache no Gemini, compartilhados por todas as sessões do processo.
+
+    Mantém um único conteúdo em cache por (chave de API, nome do modelo, hash da persona) e o recria
+    quando ele expira.
+
+    Args:
+        client (optional): Cliente de context caching. Padrão: GenaiCacheClient.
+        ttl_seconds (int, optional): Tempo de vida de cada conteúdo em cache. Padrão: 3600.
+        refresh_margin_seconds (int, optional): Antecedência com que um conteúdo prestes a expirar é
+            recriado. Padrão: 60.
+    """
+
+    def __init__(self, client=None, ttl_seconds=3600, refresh_margin_seconds=60):
+        """Inicializa o registro de prefixos em cache."""
+        self.client = client or GenaiCacheClient()
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+
+        self._entries = {}  # chave -> (conteúdo em cache, instante de expiração)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._creations = 0
+
+    def get(self, api_key, model_name, prefix, prefix_hash):
+        """
+        Retorna o conteúdo em cache do prefixo, criando-o (ou recriando-o) se necessário.
+
+        Returns:
+            tuple: (conteúdo em cache, instante de expiração segundo time.monotonic()).
+        """
+        api_key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+        key = (api_key_hash, model_name, prefix_hash)
 
-        yield "User message length is " + str(message_length)  # Retorna o tamanho da mensagem como uma parte da resposta simulada
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] - self.refresh_margin_seconds > time.monotonic():
+                self._hits += 1
+                metrics.inc("gemini_context_cache_hits_total", model=model_name)
+                return entry
+
+            # Cria o conteúdo em cache segurando o lock, para que sessões simultâneas não criem cópias; a
+            # chave de API é passada explicitamente, e o cache pertence à chave que compõe a sua entrada
+            cached_content = self.client.create_cached_content(api_key, model_name, prefix, self.ttl_seconds)
+            entry = (cached_content, time.monotonic() + self.ttl_seconds)
+            self._entries[key] = entry
+            self._creations += 1
+            metrics.inc("gemini_context_cache_creations_total", model=model_name)
+            return entry
+
+    def stats(self):
+        """Retorna estatísticas de uso dos prefixos em cache."""
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self._hits, "creations": self._creations}
+
+
+# Registro de prefixos em cache compartilhado por todos os GeminiModel do processo
+shared_context_cache = GeminiContextCache()
 
 # Define uma classe GeminiModel para interagir com o modelo Gemini do Google
 class GeminiModel(LLMBaseModel):
@@ -123,13 +429,17 @@ class GeminiModel(LLMBaseModel):
         temperature (float, optional): Temperatura do modelo. Padrão: 0.7.
         temperature_range (tuple, optional): Faixa de valores permitidos para a temperatura.
             Padrão: (0.0, 2.0).
+        context_cache (GeminiContextCache, optional): Registro de prefixos em cache. Quando informado,
+            o prefixo da persona é mantido em cache no Gemini e compartilhado entre as sessões,
+            que passam a enviar apenas os próprios turnos.
     """
     def __init__(
         self,
         model_name,
         api_key="",
         temperature=None,  # Permite que a temperatura seja opcional
-        temperature_range=(0.0, 2.0)
+        temperature_range=(0.0, 2.0),
+        context_cache=None,
     ):
         """Inicializa a classe GeminiModel."""
         super().__init__(
@@ -137,20 +447,71 @@ class GeminiModel(LLMBaseModel):
             temperature,  # Passa a temperatura para a superclasse
             temperature_range
         )
-        # Configura a chave de API do Google Gemini
-        genai.configure(api_key=api_key)
-
-        # Cria um objeto GenerativeModel com a configuração de temperatura
-        self.model = genai.GenerativeModel(
-            self.name,
-            generation_config=genai.types.GenerationConfig(
-                temperature=temperature,
-            )
+        self.api_key = api_key
+        self.context_cache = context_cache
+
+        # Configuração de geração, reutilizada ao recriar o modelo a partir do prefixo em cache
+        genai = _import_genai()
+        self.generation_config = genai.types.GenerationConfig(
+            temperature=temperature,
         )
 
+        # Cria um objeto GenerativeModel com a configuração de temperatura e os clientes da chave de API
+        self.model = _create_gemini_model(api_key, self.name, self.generation_config)
+
         # Inicia um novo chat com o modelo
         self.chat = self.model.start_chat()
 
+        # Estado do prefixo da persona em cache
+        self._prefix = None
+        self._prefix_hash = None
+        self._prefix_tokens = 0
+        self._cache_expires_at = 0.0
+        self.tokens_avoided = 0  # Tokens da persona que deixaram de ser enviados nesta sessão
+
+    def set_persona_prefix(self, prefix, prefix_hash):
+        """
+        Mantém o prefixo da persona em cache no Gemini, se o context caching estiver habilitado.
+
+        Se a criação do cache falhar (por exemplo, prefixo menor que o mínimo aceito pelo modelo), a
+        persona continua sendo enviada no primeiro turno.
+        """
+        if self.context_cache is None:
+            return False
+
+        self._prefix, self._prefix_hash = prefix, prefix_hash
+        self._prefix_tokens = estimate_tokens(prefix)
+        try:
+            self._start_cached_chat()
+        except Exception:
+            self._prefix = self._prefix_hash = None
+            return False
+        return True
+
+    def reset_history(self):
+        """Inicia um novo chat, sobre o prefixo em cache (se houver), sem os turnos anteriores."""
+        self.chat = self.model.start_chat()
+
+    def _start_cached_chat(self):
+        """(Re)cria o chat sobre o prefixo em cache, preservando os turnos já trocados."""
+        cached_content, self._cache_expires_at = self.context_cache.get(
+            self.api_key, self.name, self._prefix, self._prefix_hash
+        )
+        history = self.chat.history if self.chat is not None else []
+        self.model = self.context_cache.client.create_model(
+            self.api_key, self.name, cached_content, self.generation_config
+        )
+        self.chat = self.model.start_chat(history=history)
+
+    def _prepare_chat(self):
+        """Garante que o prefixo em cache (se houver) esteja válido antes de enviar uma mensagem."""
+        if self._prefix is not None:
+            # Recria o chat se o prefixo em cache estiver prestes a expirar
+            if time.monotonic() >= self._cache_expires_at - self.context_cache.refresh_margin_seconds:
+                self._start_cached_chat()
+            self.tokens_avoided += self._prefix_tokens  # O prefixo não é reenviado neste turno
+            metrics.inc("gemini_context_cache_tokens_avoided_total", self._prefix_tokens, model=self.name)
+
     def send_stream_message(self, message):
         """
         Envia uma mensagem para o modelo Gemini e retorna a resposta em stream.
@@ -161,6 +522,9 @@ class GeminiModel(LLMBaseModel):
         Returns:
             generator: Um gerador que retorna as partes da resposta em stream.
         """
+        self._prepare_chat()
+        self.last_usage = None
+
         response_stream = self.chat.send_message(
             message,
             stream=True,  # Define o envio como stream
@@ -168,4 +532,193 @@ class GeminiModel(LLMBaseModel):
 
         # Itera sobre cada chunk da resposta em stream
         for chunk in response_stream:
+            self._update_usage(chunk)
+            yield chunk.text  # Retorna o texto de cada chunk da resposta
+
+    async def async_send_stream_message(self, message):
+        """
+        Envia uma mensagem para o modelo Gemini e retorna a resposta em stream, sem bloquear o event loop.
+
+        Args:
+            message (str): Mensagem a ser enviada para o modelo.
+
+        Returns:
+            async generator: Um gerador assíncrono que retorna as partes da resposta em stream.
+        """
+        # A (re)criação do prefixo em cache é uma chamada bloqueante à API: roda fora do event loop
+        await asyncio.to_thread(self._prepare_chat)
+        self.last_usage = None
+
+        response_stream = await self.chat.send_message_async(
+            message,
+            stream=True,  # Define o envio como stream
+        )
+
+        # Itera sobre cada chunk da resposta em stream
+        async for chunk in response_stream:
+            self._update_usage(chunk)
             yield chunk.text  # Retorna o texto de cada chunk da resposta
+
+    def _update_usage(self, chunk):
+        """Guarda o uso de tokens informado no chunk (o último chunk do stream traz os totais da resposta)."""
+        usage = getattr(chunk, "usage_metadata", None)
+        if usage and usage.prompt_token_count:
+            self.last_usage = {
+                "prompt_tokens": usage.prompt_token_count,
+                "output_tokens": usage.candidates_token_count,
+            }
+
+# Clientes do Ollama compartilhados por host: cada cliente mantém um pool de conexões HTTP keep-alive
+_ollama_clients = {}
+_ollama_clients_lock = threading.Lock()
+
+
+def get_ollama_clients(host, max_connections=100):
+    """
+    Retorna os clientes (síncrono e assíncrono) do Ollama compartilhados para o host.
+
+    Args:
+        host (str): Endereço do servidor Ollama.
+        max_connections (int, optional): Tamanho máximo do pool de conexões de cada cliente. Padrão: 100.
+
+    Returns:
+        tuple: (Client, AsyncClient) do host.
+    """
+    with _ollama_clients_lock:
+        if host not in _ollama_clients:
+            # Importados apenas no primeiro uso de um OllamaModel
+            import httpx  # Dependência do próprio ollama, usada para configurar o pool de conexões
+            from ollama import Client, AsyncClient  # Import the ollama Clients
+
+            limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+            _ollama_clients[host] = (
+                Client(host=host, limits=limits),
+                AsyncClient(host=host, limits=limits),
+            )
+        return _ollama_clients[host]
+
+
+# Define uma classe OllamaModel para interagir com modelos locais servidos pelo Ollama
+class OllamaModel(LLMBaseModel):
+    """
+    Modelo local servido pelo Ollama.
+
+    O Ollama não guarda o estado da conversa, então o histórico de mensagens é mantido pelo modelo
+    e reenviado a cada turno. A persona é enviada como mensagem de sistema, sempre idêntica no início
+    da conversa, e o modelo é mantido carregado (keep_alive), o que permite ao Ollama reaproveitar o
+    processamento desse prefixo entre os turnos.
+
+    Args:
+        model_name (str): Nome do modelo no Ollama (ex.: "llama3.1").
+        host (str, optional): Endereço do servidor Ollama. Padrão: "http://localhost:11434".
+        temperature (float, optional): Temperatura do modelo. Padrão: 0.7.
+        temperature_range (tuple, optional): Faixa de valores permitidos para a temperatura.
+            Padrão: (0.0, 2.0).
+        keep_alive (str, optional): Por quanto tempo o Ollama mantém o modelo carregado na memória
+            após cada requisição. Padrão: "30m".
+    """
+    def __init__(
+        self,
+        model_name,
+        host="http://localhost:11434",
+        temperature=None,  # Permite que a temperatura seja opcional
+        temperature_range=(0.0, 2.0),
+        keep_alive="30m",
+    ):
+        """Inicializa a classe OllamaModel."""
+        super().__init__(
+            model_name,
+            temperature,  # Passa a temperatura para a superclasse
+            temperature_range
+        )
+        self.host = host
+        self.keep_alive = keep_alive
+        self.client, self.async_client = get_ollama_clients(host)  # Clientes compartilhados do host
+        self.messages = []  # Histórico da conversa no formato do Ollama
+
+    def set_persona_prefix(self, prefix, prefix_hash):
+        """Envia a persona como mensagem de sistema no início de todas as requisições da conversa."""
+        self.messages = [{"role": "system", "content": prefix}] + [
+            message for message in self.messages if message["role"] != "system"
+        ]
+        return True
+
+    def reset_history(self):
+        """Descarta as mensagens da conversa, mantendo a mensagem de sistema (persona)."""
+        self.messages = [message for message in self.messages if message["role"] == "system"]
+
+    def _chat_arguments(self, message):
+        """
+        Retorna os argumentos da requisição de chat: o histórico seguido da nova mensagem.
+
+        A mensagem só entra no histórico quando a resposta termina (veja _add_turn), para que um stream
+        que falhou ou foi interrompido não deixe no histórico uma mensagem do usuário sem resposta.
+        """
+        return {
+            "model": self.name,
+            "messages": self.messages + [{"role": "user", "content": message}],
+            "stream": True,  # Define o envio como stream
+            "options": {"temperature": self.temperature},
+            "keep_alive": self.keep_alive,  # Mantém o modelo carregado entre as requisições
+        }
+
+    def send_stream_message(self, message):
+        """
+        Envia uma mensagem para o modelo do Ollama e retorna a resposta em stream.
+
+        Args:
+            message (str): Mensagem a ser enviada para o modelo.
+
+        Returns:
+            generator: Um gerador que retorna as partes da resposta em stream.
+        """
+        self.last_usage = None
+        response_stream = self.client.chat(**self._chat_arguments(message))
+
+        # Repassa cada chunk assim que ele chega e, ao fim do stream, guarda o turno no histórico
+        chunks = []
+        for chunk in response_stream:
+            self._update_usage(chunk)
+            content = chunk["message"]["content"]
+            if content:
+                chunks.append(content)
+                yield content
+        self._add_turn(message, "".join(chunks))
+
+    async def async_send_stream_message(self, message):
+        """
+        Envia uma mensagem para o modelo do Ollama e retorna a resposta em stream, sem bloquear o event loop.
+
+        Args:
+            message (str): Mensagem a ser enviada para o modelo.
+
+        Returns:
+            async generator: Um gerador assíncrono que retorna as partes da resposta em stream.
+        """
+        self.last_usage = None
+        response_stream = await self.async_client.chat(**self._chat_arguments(message))
+
+        # Repassa cada chunk assim que ele chega e, ao fim do stream, guarda o turno no histórico
+        chunks = []
+        async for chunk in response_stream:
+            self._update_usage(chunk)
+            content = chunk["message"]["content"]
+            if content:
+                chunks.append(content)
+                yield content
+        self._add_turn(message, "".join(chunks))
+
+    def _add_turn(self, message, response):
+        """Adiciona ao histórico a mensagem do usuário e a resposta completa do modelo."""
+        self.messages += [
+            {"role": "user", "content": message},
+            {"role": "assistant", "content": response},
+        ]
+
+    def _update_usage(self, chunk):
+        """Guarda o uso de tokens informado no último chunk do stream (done=True)."""
+        if chunk.get("done"):
+            self.last_usage = {
+                "prompt_tokens": chunk.get("prompt_eval_count", 0),
+                "output_tokens": chunk.get("eval_count", 0),
+            }
@@ -1,11 +1,27 @@
-import json
-import pandas
+import time
 import streamlit as st
 from chat_session import ChatSession
-from llm_model import MockModel, GeminiModel
+from llm_model import MockModel, GeminiModel, OllamaModel, shared_context_cache
+from model_router import RouterModel, BackendLimiterRegistry
+from knowledge_index import load_or_build_index, KNOWLEDGE_FIELD
+from proposal_index import load_proposal_index
+from persona_registry import get_persona_registry
+from session_manager import SessionManager, get_session_key, resumed_from_url
+from async_stream import AsyncStreamBridge
+from stream_renderer import StreamRenderer
+from history_writer import HistoryWriter
+from content_registry import ContentRegistry
+from response_cache import ResponseCache
+from token_accounting import TokenAccounting
+from history_store import ShardedSQLiteHistoryStore
+from history_maintenance import HistoryMaintenance
 from sql_connection import get_database_session  # Import your SQLiteConnection class
+from metrics import metrics
 import os  # Import os module for file operations
 
+# Início do rerun, usado para medir a duração de cada execução do script
+rerun_start = time.perf_counter()
+
 # Nome da plataforma
 nome_da_plataforma = "Redação Unicamp Acessível: o caminho para a escrita leve e autoral"
 
@@ -22,17 +38,184 @@ google_token = st.query_params.get("google_token", "")  # Obtem o token do Googl
 persona_path = "personas/dani_stella/dani_stella.json" # Obtem o nome da persona da URL
 model_name = st.query_params.get("model_name", "gemini-1.5-flash") # Obtem o nome do modelo da URL
 
-# Função para criar um modelo Gemini (cache_resource garante que o modelo seja carregado apenas uma vez)
+# Orçamento de tokens por campo da persona no primeiro turno (metade dos exemplos de estilo)
+persona_field_budgets = {"exemplo_de_estilo_de_respostas_da_persona": 12000}
+
+# Orçamento de tokens da conversa mantida pelo modelo; acima dele, o histórico é resumido
+context_token_budget = 16000
+
+# Intervalo de agrupamento dos chunks exibidos e intervalo entre os checkpoints da resposta parcial (em segundos)
+stream_coalesce_seconds = 0.1
+stream_checkpoint_interval = 2.0
+
+# Mantém a base de conhecimento da persona em um arquivo mapeado em memória, compartilhado entre os
+# processos do Streamlit, em vez de no heap de cada processo (opcional)
+persona_mmap_fields = (KNOWLEDGE_FIELD,) if os.environ.get("PERSONA_MMAP_FIELDS", "") == "1" else ()
+
+# Mantém o token da sessão na URL (?sessao=...), para retomá-la após recarregar a página (opcional). Quem
+# tiver o link tem acesso à conversa; a chave de API, porém, precisa ser informada de novo
+session_url_resume = os.environ.get("SESSION_URL_RESUME", "") == "1"
+
+# Intervalo entre as remoções das sessões inativas do pool (em segundos) e prazo (em dias) após o qual o
+# estado gravado de uma sessão inativa é excluído
+session_eviction_interval = 60
+session_state_retention_days = 90
+
+# Particiona o histórico das conversas entre vários bancos de dados, cada um com o seu escritor, para que
+# as gravações de sessões diferentes não esperem umas pelas outras (ex.: HISTORY_SHARDS=4; opcional)
+history_shards = int(os.environ.get("HISTORY_SHARDS", "0"))
+history_shards_dir = "chat_history_shards"
+
+# Arquiva (comprimidas) as sessões sem mensagens há mais de N dias e devolve o espaço liberado ao sistema,
+# em segundo plano (ex.: HISTORY_RETENTION_DAYS=30); as sessões arquivadas continuam legíveis. Com
+# HISTORY_DELETE_AFTER_DAYS, as sessões arquivadas são excluídas após esse prazo (opcional)
+history_retention_days = float(os.environ.get("HISTORY_RETENTION_DAYS", "0"))
+history_delete_after_days = float(os.environ.get("HISTORY_DELETE_AFTER_DAYS", "0")) or None
+
+# Mantém o prefixo da persona em cache no Gemini, compartilhado entre as sessões (opcional)
+use_context_cache = os.environ.get("GEMINI_CONTEXT_CACHE", "") == "1"
+
+# Responde perguntas repetidas (no mesmo contexto) a partir do cache, sem chamar o modelo (opcional)
+use_response_cache = os.environ.get("RESPONSE_CACHE", "") == "1"
+
+# Modelo simulado, para testes de carga sem chave de API (ex.: ENABLE_MOCK_MODEL=1 MOCK_TIME_TO_FIRST_TOKEN=0.5)
+mock_models = ("mock",) if os.environ.get("ENABLE_MOCK_MODEL", "") == "1" else ()
+mock_model_options = {
+    "time_to_first_token": float(os.environ.get("MOCK_TIME_TO_FIRST_TOKEN", "0")),
+    "inter_chunk_delay": float(os.environ.get("MOCK_INTER_CHUNK_DELAY", "0")),
+    "chunk_size": int(os.environ.get("MOCK_CHUNK_SIZE", "0")) or None,
+    "response_length": int(os.environ.get("MOCK_RESPONSE_LENGTH", "0")) or None,
+}
+
+# Modelos locais servidos pelo Ollama (ex.: OLLAMA_MODELS="llama3.1,gemma2"), exibidos como "ollama/<modelo>"
+ollama_host = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+ollama_models = tuple(
+    "ollama/" + name.strip() for name in os.environ.get("OLLAMA_MODELS", "").split(",") if name.strip()
+)
+
+# Modelo "auto": distribui as mensagens entre os modelos disponíveis, do preferido para os mais baratos
+router_model_name = "auto"
+router_gemini_models = ("gemini-1.5-pro", "gemini-1.5-flash")
+
+# Limites de cada modelo, compartilhados entre as sessões (requisições simultâneas, por minuto e SLO do
+# tempo até o primeiro token); modelos sem limites configurados usam os limites padrão do BackendLimiter
+router_limits = {
+    "gemini-1.5-pro": {"max_concurrency": 16, "requests_per_minute": 360, "slo_seconds": 8.0},
+    "gemini-1.5-flash": {"max_concurrency": 32, "requests_per_minute": 1000, "slo_seconds": 4.0},
+}
+
+# Função para criar o gerenciador de sessões (cache_resource garante que ele seja criado apenas uma vez)
 @st.cache_resource
-def create_chat_session():
-    """Cria uma sessao de Chat."""
+def get_session_manager():
+    """Cria o gerenciador do pool de sessões de chat, compartilhado por todos os usuários."""
     # Conexão com o banco de dados SQLite
     conn = get_database_session()
-    chat_session = ChatSession(connection=conn, persona_path=persona_path)
-    return chat_session
 
-# Flag para indicar se o modelo foi inicializado
-chat_session = create_chat_session()
+    # Registro das personas, lidas uma única vez por processo e compartilhadas por todas as sessões
+    persona_registry = get_persona_registry(mmap_fields=persona_mmap_fields)
+
+    # Abre (ou constrói) o índice da base de conhecimento antes do primeiro turno; as sessões o obtêm pelo
+    # hash da persona a cada turno, de modo que uma persona alterada passa a usar o seu novo índice
+    load_or_build_index(persona_path, persona_registry=persona_registry)
+
+    # Índice da base de propostas de redação, consultado por (proposta, ano) a cada turno
+    proposal_index = load_proposal_index("dados/base_de_dados_proposta_redacoes.csv")
+
+    # Escritor em segundo plano do histórico, compartilhado por todas as sessões
+    history_writer = HistoryWriter(conn)
+
+    # Grava os eventos de cada sessão na tabela session_traces (requer METRICS_ENABLED=1)
+    if os.environ.get("METRICS_TRACE", "") == "1":
+        metrics.configure_traces(history_writer)
+
+    # Cache de respostas em memória e no SQLite, compartilhado por todas as sessões
+    response_cache = ResponseCache(conn, writer=history_writer) if use_response_cache else None
+
+    # Registro dos tokens e da latência de cada turno (tabela turn_usage)
+    token_accounting = TokenAccounting(conn, writer=history_writer)
+
+    # Histórico particionado (None: tabela chat_history de chat_history.db); ao ativar, desativar ou mudar o
+    # número de partições, as sessões existentes são movidas para o banco de dados em que passam a ser lidas
+    if history_shards > 1:
+        history_store = ShardedSQLiteHistoryStore.open(history_shards_dir, history_shards, legacy_connection=conn)
+    else:
+        history_store = None
+        ShardedSQLiteHistoryStore.drain(history_shards_dir, conn)
+
+    # Manutenção do histórico em segundo plano, em cada banco de dados que grava o histórico
+    if history_retention_days > 0:
+        databases = [(shard.connection, shard.writer) for shard in history_store.shards] if history_store else [(conn, history_writer)]
+        for database_connection, database_writer in databases:
+            HistoryMaintenance(
+                database_connection,
+                retention_days=history_retention_days,
+                writer=database_writer,
+                delete_after_days=history_delete_after_days,
+            ).start()
+
+    def create_chat_session():
+        """Cria uma sessao de Chat."""
+        return ChatSession(
+            connection=conn,
+            persona_path=persona_path,
+            persona_field_budgets=persona_field_budgets,
+            use_knowledge_index=True,
+            history_writer=history_writer,
+            proposal_index=proposal_index,
+            response_cache=response_cache,
+            context_token_budget=context_token_budget,
+            stream_checkpoint_interval=stream_checkpoint_interval,
+            persona_registry=persona_registry,
+            token_accounting=token_accounting,
+            history_store=history_store,
+        )
+
+    return SessionManager(
+        create_chat_session,
+        connection=conn,
+        writer=history_writer,
+        eviction_interval=session_eviction_interval,
+        state_retention_days=session_state_retention_days,
+    )
+
+# Ponte de streaming assíncrono (um único event loop atende as respostas de todos os usuários)
+@st.cache_resource
+def get_stream_bridge():
+    """Cria a ponte entre os streams assíncronos dos modelos e o st.write_stream."""
+    return AsyncStreamBridge()
+
+# Limites dos modelos usados pelo modelo "auto", compartilhados pelas sessões que usam a mesma chave de API
+@st.cache_resource
+def get_backend_limiters():
+    """Cria o registro dos limites compartilhados de cada chave de API e modelo."""
+    return BackendLimiterRegistry(router_limits)
+
+# Registro do conteúdo estático (documentação, propostas e persona), carregado uma vez por processo
+@st.cache_resource
+def get_content_registry():
+    """Cria o registro do conteúdo estático da plataforma."""
+    return ContentRegistry(get_persona_registry(mmap_fields=persona_mmap_fields))
+
+# Endpoint local das métricas no formato do Prometheus (ex.: METRICS_ENABLED=1 METRICS_PORT=9464)
+@st.cache_resource
+def get_metrics_server():
+    """Inicia o endpoint de métricas, se configurado."""
+    port = os.environ.get("METRICS_PORT", "")
+    return metrics.start_http_server(int(port)) if metrics.enabled and port else None
+
+# Cada aba do navegador possui a sua própria sessão de chat (identificada por um token mantido na URL, se
+# a retomada pela URL estiver habilitada)
+session_manager = get_session_manager()
+get_metrics_server()
+stream_bridge = get_stream_bridge()
+content_registry = get_content_registry()
+session_key = get_session_key(st.session_state, st.query_params if session_url_resume else None)
+chat_session, session_lock = session_manager.get_session_and_lock(session_key)
+if resumed_from_url(st.session_state) and chat_session.model is not None:
+    # O modelo em memória foi configurado com a chave de API de quem criou a sessão: quem chega pelo
+    # link mantém a conversa, mas precisa informar a própria chave
+    with session_lock:
+        chat_session.update_model(chat_session.model_name, None)
 
 # --- Layout da página ---
 _, profile_image, _ = st.columns([0.35, 0.3, 0.35])  # Divide a página em três colunas
@@ -42,46 +225,40 @@ column1, column2 = st.columns(2)  # Divide a página em duas colunas
 with column1:
     # Seção sobre a plataforma (expander permite expandir e recolher o conteúdo)
     with st.expander("✍️ Redação Unicamp Acessível: a chave para a escrita leve e autoral"):
-        # Lê e exibe o conteúdo do arquivo Markdown
-        with open("documentacao/secao_1_breve_descricao_plataforma.md") as f:
-            st.markdown(f.read())
+        # Exibe o conteúdo do arquivo Markdown (carregado uma única vez)
+        st.markdown(content_registry.get_text("documentacao/secao_1_breve_descricao_plataforma.md"))
 
     # Seção sobre a Unicamp
     with st.expander("🌎 A Unicamp: um portal para o futuro"):
-        # Lê e exibe o conteúdo do arquivo Markdown
-        with open("documentacao/secao_2_a_unicamp.md") as f:
-            st.markdown(f.read())
+        # Exibe o conteúdo do arquivo Markdown (carregado uma única vez)
+        st.markdown(content_registry.get_text("documentacao/secao_2_a_unicamp.md"))
 
     # Seção sobre a redação da Unicamp
     with st.expander("🗝️ Redação Unicamp: desvendando os segredos da escrita"):
-        # Lê e exibe o conteúdo do arquivo Markdown
-        with open("documentacao/secao_3_a_prova_de_redacao_unicamp.md") as f:
-            st.markdown(f.read())
+        # Exibe o conteúdo do arquivo Markdown (carregado uma única vez)
+        st.markdown(content_registry.get_text("documentacao/secao_3_a_prova_de_redacao_unicamp.md"))
 
 with column2:
     # Seção sobre Dani Stella
     with st.expander("👩🏾‍🏫 Dani Stella: a professora digital que te guia na jornada da escrita autoral"):
-        # Lê e exibe o conteúdo do arquivo Markdown
-        with open("documentacao/secao_4_dani_stella_a_professora_digital.md") as f:
-            # Converte a persona para JSON e codifica em UTF-8
-            st.markdown(f.read())
-
-            # Botão para download do prompt da persona
-            st.download_button(
-                label="Download do prompt de Dani Stella: a professora digital de redações",
-                data=json.dumps(chat_session.persona, indent=4),
-                file_name="prompt_dani_stella.json",
-                mime="application/json",
-            )
+        # Exibe o conteúdo do arquivo Markdown (carregado uma única vez)
+        st.markdown(content_registry.get_text("documentacao/secao_4_dani_stella_a_professora_digital.md"))
+
+        # Botão para download do prompt da persona (serializado uma única vez por versão do arquivo)
+        st.download_button(
+            label="Download do prompt de Dani Stella: a professora digital de redações",
+            data=content_registry.get_persona_json(chat_session.persona_path, indent=4),
+            file_name="prompt_dani_stella.json",
+            mime="application/json",
+        )
 
     # Seção sobre provas passadas
     with st.expander("📚 Provas de Redação Passadas: desvendando os segredos da Unicamp"):
-        # Lê e exibe o conteúdo do arquivo Markdown
-        with open("documentacao/secao_5_prova_de_redacao_passadas.md") as f:
-            st.markdown(f.read())
+        # Exibe o conteúdo do arquivo Markdown (carregado uma única vez)
+        st.markdown(content_registry.get_text("documentacao/secao_5_prova_de_redacao_passadas.md"))
 
-        # Lê a base de dados de provas de redação em formato CSV
-        propostas_redacoes = pandas.read_csv("dados/base_de_dados_proposta_redacoes.csv")
+        # Obtem a base de dados de provas de redação (lida do CSV uma única vez, sem o Pandas)
+        propostas_redacoes = content_registry.get_table("dados/base_de_dados_proposta_redacoes.csv")
 
         # Exibe a tabela com as provas de redação
         st.dataframe(
@@ -95,9 +272,8 @@ with column2:
 
     # Seção de agradecimentos
     with st.expander("🙏 Agradecimentos"):
-        # Lê e exibe o conteúdo do arquivo Markdown
-        with open("documentacao/secao_6_agradecimentos.md") as f:
-            st.markdown(f.read())
+        # Exibe o conteúdo do arquivo Markdown (carregado uma única vez)
+        st.markdown(content_registry.get_text("documentacao/secao_6_agradecimentos.md"))
 
 # Emojis do aluno e do professor
 student_emoji = "🧑🏾‍🎓"
@@ -117,9 +293,10 @@ with st.expander("⚙️ Configurações do modelo de Inteligência Artificial G
             placeholder="Acesse `https://aistudio.google.com/app/apikey` para criar esta chave",
         )
 
-        # Lista dos modelos Gemini disponíveis
-        models = ("gemini-1.5-flash", "gemini-1.5-pro", "gemini-1.5-pro-exp-0801")
-        model_idx = models.index(model_name)  # Obtem o índice do modelo atual na lista
+        # Lista dos modelos Gemini (e, se configurados, dos modelos locais do Ollama) disponíveis
+        models = ("gemini-1.5-flash", "gemini-1.5-pro", "gemini-1.5-pro-exp-0801", router_model_name) + ollama_models + mock_models
+        model_name = chat_session.model_name or model_name  # Sessão retomada: último modelo usado
+        model_idx = models.index(model_name) if model_name in models else 0  # Obtem o índice do modelo atual na lista
 
         # Caixa de seleção para escolher o modelo Gemini
         model_name = st.selectbox(
@@ -132,16 +309,52 @@ with st.expander("⚙️ Configurações do modelo de Inteligência Artificial G
         submitted = st.form_submit_button("Atualize a chave de acesso e o modelo Gemini")
 
         if submitted:
-            if gemini_api_key != "":
+            if model_name == router_model_name:
+                # Modelos Gemini (se houver chave de API), seguidos dos modelos locais e do modelo simulado
+                backends = [
+                    GeminiModel(
+                        model_name=name,
+                        api_key=gemini_api_key,
+                        temperature=1.0,
+                        context_cache=shared_context_cache if use_context_cache else None,
+                    )
+                    for name in (router_gemini_models if gemini_api_key != "" else ())
+                ]
+                backends += [
+                    OllamaModel(model_name=name.removeprefix("ollama/"), host=ollama_host, temperature=1.0)
+                    for name in ollama_models
+                ]
+                backends += [MockModel(name, temperature=1.0, **mock_model_options) for name in mock_models]
+                # Os modelos Gemini têm limites por chave de API; os locais e o simulado, um limite único
+                limiters = {
+                    backend.name: get_backend_limiters().get(
+                        backend.name, gemini_api_key if isinstance(backend, GeminiModel) else None
+                    )
+                    for backend in backends
+                }
+                gemini_model = RouterModel(model_name, backends, limiters=limiters) if backends else None
+            elif model_name in mock_models:
+                # Modelo simulado (testes de carga)
+                gemini_model = MockModel(model_name, temperature=1.0, **mock_model_options)
+            elif model_name.startswith("ollama/"):
+                # Modelos locais não precisam de chave de API
+                gemini_model = OllamaModel(
+                    model_name=model_name.removeprefix("ollama/"),
+                    host=ollama_host,
+                    temperature=1.0,
+                )
+            elif gemini_api_key != "":
                 gemini_model = GeminiModel(
                     model_name=model_name,
                     api_key=gemini_api_key,
                     temperature=1.0,
+                    context_cache=shared_context_cache if use_context_cache else None,
                 )
             else:
                 gemini_model = None
 
             chat_session.update_model(model_name, gemini_model)
+            session_manager.save_state(session_key)  # Permite retomar a sessão com o modelo escolhido
 
 # --- Mensagem de alerta se o modelo não estiver inicializado ---
 if chat_session.model is None:
@@ -175,12 +388,34 @@ if prompt_input:
     # Envia o prompt para o modelo escolhido e exibe a resposta
     with st.chat_message("assistant", avatar=teacher_emoji):
         try:
-            # Envia o prompt para o modelo e obtem a resposta como um stream
-            response_stream = chat_session.send_stream_message(prompt_input)
+            # Um novo prompt cancela a resposta anterior do mesmo usuário, se ela ainda estiver em andamento
+            stream_bridge.cancel(session_key)
 
-            with st.spinner('Processando mensagem...'):
-                # Exibe a resposta do modelo no chat
-                response = st.write_stream(response_stream)
+            # Avisa antes do envio se o prompt (persona, conversa e mensagem) é longo para o modelo escolhido
+            preflight_warning = chat_session.preflight_check(prompt_input)
+            if preflight_warning:
+                st.warning(preflight_warning)
+
+            # O lock da sessão impede que dois envios do mesmo usuário se misturem
+            with session_lock:
+                # Envia o prompt para o modelo e obtem a resposta como um stream (executado no event loop)
+                response_stream = stream_bridge.stream(
+                    session_key,
+                    lambda: chat_session.async_send_stream_message(prompt_input),
+                    coalesce_seconds=stream_coalesce_seconds,
+                )
+
+                with st.spinner('Processando mensagem...'):
+                    # Exibe a resposta do modelo no chat, renderizando o Markdown em intervalos (e não a cada chunk)
+                    response = StreamRenderer(st.empty(), min_interval=stream_coalesce_seconds).render(response_stream)
+
+            # Grava o contexto compacto da conversa, usado para retomá-la após uma reconexão
+            session_manager.save_state(session_key)
         except Exception as e:
             # Exibe uma mensagem de erro se ocorrer algum problema
             st.error("Error: " + str(e))
+
+# --- Métricas do rerun ---
+metrics.observe("app_rerun_seconds", time.perf_counter() - rerun_start)
+if metrics.enabled and os.environ.get("METRICS_FILE"):
+    metrics.write_file(os.environ["METRICS_FILE"])  # Ex.: para o textfile collector do node_exporter
@@ -0,0 +1,240 @@
+import os  # Importa o módulo os para ler a configuração e gravar o arquivo de métricas
+import time  # Importa o módulo time para medir as durações
+import threading  # Importa o módulo threading para proteger as métricas e servir o endpoint
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Servidor HTTP do endpoint de métricas
+
+# Limites (em segundos) dos buckets dos histogramas de duração
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Consulta usada para gravar os eventos de trace das sessões (tabela criada pelas migrações)
+TRACE_QUERY = "INSERT INTO session_traces (session_id, event, duration_ms, model_name) VALUES (?, ?, ?, ?)"
+
+
+class _NullTimer:
+    """Temporizador que não mede nada, usado quando as métricas estão desabilitadas."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    """Temporizador que registra a duração do bloco em um histograma."""
+
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _Histogram:
+    """Histograma cumulativo no formato do Prometheus."""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Metrics:
+    """
+    Registro leve de métricas (contadores e histogramas de duração) no formato texto do Prometheus.
+
+    Quando desabilitado, todas as operações retornam imediatamente (timer retorna um objeto
+    compartilhado que não mede nada), de modo que a instrumentação pode ficar nos caminhos críticos.
+
+    Args:
+        enabled (bool, optional): Habilita a coleta das métricas. Padrão: False.
+        buckets (tuple, optional): Limites dos buckets dos histogramas. Padrão: DEFAULT_BUCKETS.
+    """
+
+    def __init__(self, enabled=False, buckets=DEFAULT_BUCKETS):
+        """Inicializa o registro vazio."""
+        self.enabled = enabled
+        self.buckets = buckets
+        self._counters = {}  # (nome, labels) -> valor
+        self._histograms = {}  # (nome, labels) -> _Histogram
+        self._lock = threading.Lock()
+        self._trace_writer = None  # Escritor dos eventos de trace das sessões (opcional)
+
+    def inc(self, name, value=1, **labels):
+        """
+        Incrementa um contador.
+
+        Args:
+            name (str): Nome da métrica (ex.: "response_cache_hits_total").
+            value (float, optional): Incremento. Padrão: 1.
+            **labels: Labels da métrica (ex.: model="gemini-1.5-flash").
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        """
+        Registra uma duração em um histograma.
+
+        Args:
+            name (str): Nome da métrica (ex.: "sqlite_query_seconds").
+            seconds (float): Duração observada, em segundos.
+            **labels: Labels da métrica.
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets)
+            for position, limit in enumerate(self.buckets):
+                if seconds <= limit:
+                    histogram.counts[position] += 1
+            histogram.sum += seconds
+            histogram.count += 1
+
+    def timer(self, name, **labels):
+        """
+        Retorna um gerenciador de contexto que registra a duração do bloco no histograma.
+
+        Args:
+            name (str): Nome da métrica.
+            **labels: Labels da métrica.
+
+        Returns:
+            Gerenciador de contexto (sem custo de medição quando as métricas estão desabilitadas).
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def configure_traces(self, writer):
+        """
+        Habilita a gravação dos eventos de cada sessão na tabela session_traces.
+
+        Args:
+            writer (HistoryWriter): Escritor em segundo plano usado para gravar os eventos.
+        """
+        self._trace_writer = writer
+
+    def trace(self, session_id, event, seconds, model_name=""):
+        """
+        Grava um evento de uma sessão (ex.: o tempo até o primeiro chunk de uma resposta), se habilitado.
+
+        Args:
+            session_id (str): ID da sessão.
+            event (str): Nome do evento.
+            seconds (float): Duração do evento, em segundos.
+            model_name (str, optional): Nome do modelo. Padrão: "".
+        """
+        if not self.enabled or self._trace_writer is None:
+            return
+        self._trace_writer.submit(TRACE_QUERY, (session_id, event, seconds * 1000, model_name))
+
+    def render(self):
+        """
+        Retorna as métricas no formato texto do Prometheus.
+
+        Returns:
+            str: Métricas formatadas.
+        """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, list(histogram.counts), histogram.sum, histogram.count)
+                for key, histogram in self._histograms.items()
+            )
+
+        lines = []
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f"# TYPE {name} counter")
+                declared.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), counts, total, count in histograms:
+            if name not in declared:
+                lines.append(f"# TYPE {name} histogram")
+                declared.add(name)
+            for limit, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', repr(limit)),))} {bucket_count}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path):
+        """
+        Grava as métricas em um arquivo (ex.: para o textfile collector do node_exporter).
+
+        Args:
+            path (str): Caminho do arquivo.
+        """
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as metrics_file:
+            metrics_file.write(self.render())
+        os.replace(tmp_path, path)  # Leitores nunca veem um arquivo parcial
+
+    def start_http_server(self, port, host="127.0.0.1"):
+        """
+        Serve as métricas em http://host:port/metrics, em uma thread em segundo plano.
+
+        Args:
+            port (int): Porta do endpoint.
+            host (str, optional): Endereço do endpoint. Padrão: "127.0.0.1" (apenas local).
+
+        Returns:
+            ThreadingHTTPServer: O servidor iniciado.
+        """
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Não registra cada coleta no log do servidor
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        return server
+
+
+def _format_labels(labels):
+    """Formata as labels no formato do Prometheus (ex.: {model="mock"})."""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in labels) + "}"
+
+
+def _escape_label(value):
+    """Escapa o valor de uma label (barras invertidas, aspas e quebras de linha)."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Registro de métricas do processo, habilitado com METRICS_ENABLED=1
+metrics = Metrics(enabled=os.environ.get("METRICS_ENABLED", "") == "1")
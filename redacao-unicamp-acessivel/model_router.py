@@ -0,0 +1,614 @@
+import time  # Importa o módulo time para medir latências e esperar entre as tentativas
+import hashlib  # Importa o módulo hashlib para identificar as chaves de API sem guardá-las
+import random  # Importa o módulo random para o jitter do backoff
+import asyncio  # Importa o módulo asyncio para a versão assíncrona do roteamento
+import threading  # Importa o módulo threading para os limites compartilhados entre as sessões
+from llm_model import LLMBaseModel  # Importa a classe base dos modelos
+from conversation_context import ConversationContext  # Importa o contexto compacto enviado na troca de modelo
+from stream_renderer import StreamBuffer  # Importa o acumulador das respostas em stream
+from metrics import metrics  # Importa o registro de métricas do processo
+
+# Nomes de exceções (ou de suas classes base) que indicam falhas transitórias dos provedores:
+# google.api_core (Gemini), httpx (Ollama) e exceções nativas de rede
+TRANSIENT_ERROR_NAMES = frozenset({
+    "ResourceExhausted",
+    "ServiceUnavailable",
+    "DeadlineExceeded",
+    "InternalServerError",
+    "TooManyRequests",
+    "Aborted",
+    "TimeoutError",
+    "ConnectionError",
+    "ConnectError",
+    "ConnectTimeout",
+    "ReadTimeout",
+    "RemoteProtocolError",
+})
+
+# Códigos HTTP de falhas transitórias (ex.: ollama.ResponseError.status_code, google.api_core.exceptions.*.code)
+TRANSIENT_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+# Erros de autenticação e de cota: dizem respeito à chave de API usada, não à saúde do modelo
+CREDENTIAL_ERROR_NAMES = frozenset({"Unauthenticated", "PermissionDenied", "ResourceExhausted", "TooManyRequests"})
+CREDENTIAL_STATUS_CODES = frozenset({401, 403, 429})
+
+
+def is_transient_error(error):
+    """
+    Verifica se o erro de um modelo é transitório (e a requisição pode ser repetida).
+
+    Args:
+        error (Exception): Erro lançado pelo modelo.
+
+    Returns:
+        bool: True para limites de uso, indisponibilidade, timeouts e falhas de conexão.
+    """
+    if any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(error).__mro__):
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return isinstance(status, int) and status in TRANSIENT_STATUS_CODES
+
+
+def is_credential_error(error):
+    """
+    Verifica se o erro de um modelo se deve à chave de API (autenticação inválida ou cota esgotada).
+
+    Args:
+        error (Exception): Erro lançado pelo modelo.
+
+    Returns:
+        bool: True para erros de autenticação, de permissão e de cota.
+    """
+    if any(cls.__name__ in CREDENTIAL_ERROR_NAMES for cls in type(error).__mro__):
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return isinstance(status, int) and status in CREDENTIAL_STATUS_CODES
+
+
+class TokenBucket:
+    """
+    Limite de taxa de requisições (token bucket), seguro para uso por várias threads.
+
+    Args:
+        rate (float): Tokens repostos por segundo.
+        capacity (float, optional): Número máximo de tokens acumulados (rajada). Padrão: max(1, rate).
+        clock (callable, optional): Relógio em segundos. Padrão: time.monotonic.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        """Inicializa o bucket cheio."""
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        """Repõe os tokens acumulados desde a última leitura."""
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """
+        Consome um token, se houver.
+
+        Returns:
+            bool: True se o token foi consumido.
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def time_until_available(self):
+        """
+        Retorna o tempo (em segundos) até que um token esteja disponível.
+
+        Returns:
+            float: 0.0 se já houver um token.
+        """
+        with self._lock:
+            self._refill()
+            return max(0.0, (1 - self._tokens) / self.rate)
+
+
+class BackendLimiter:
+    """
+    Limites e estado de saúde de um modelo, compartilhados por todas as sessões do processo.
+
+    Combina um limite de requisições simultâneas (semáforo), um limite de taxa (token bucket) e um
+    disjuntor de latência: quando a média móvel do tempo até o primeiro token ultrapassa o SLO, ou
+    após failure_threshold falhas seguidas, o modelo fica degradado por cooldown_seconds e o roteador
+    passa a preferir os modelos seguintes. Ao fim do cooldown, o modelo volta a ser tentado.
+
+    Args:
+        name (str): Nome do modelo.
+        max_concurrency (int, optional): Número máximo de requisições simultâneas. Padrão: 8.
+        requests_per_minute (float, optional): Limite de requisições por minuto. Padrão: None (sem limite).
+        burst (float, optional): Rajada de requisições permitida pelo limite de taxa. Padrão: 10 segundos
+            de requisições.
+        slo_seconds (float, optional): SLO do tempo até o primeiro token. Padrão: None (sem SLO).
+        failure_threshold (int, optional): Falhas seguidas que degradam o modelo. Padrão: 3.
+        cooldown_seconds (float, optional): Duração da degradação. Padrão: 60.
+        ewma_alpha (float, optional): Peso da última medida na média móvel da latência. Padrão: 0.3.
+        clock (callable, optional): Relógio em segundos. Padrão: time.monotonic.
+    """
+
+    def __init__(
+        self,
+        name,
+        max_concurrency=8,
+        requests_per_minute=None,
+        burst=None,
+        slo_seconds=None,
+        failure_threshold=3,
+        cooldown_seconds=60.0,
+        ewma_alpha=0.3,
+        clock=time.monotonic,
+    ):
+        """Inicializa os limites e as estatísticas do modelo."""
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.slo_seconds = slo_seconds
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.ewma_alpha = ewma_alpha
+        self.clock = clock
+
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.bucket = None
+        if requests_per_minute:
+            rate = requests_per_minute / 60
+            self.bucket = TokenBucket(rate, burst if burst is not None else max(1.0, rate * 10), clock)
+
+        self._lock = threading.Lock()
+        self._latency_ewma = None  # Média móvel do tempo até o primeiro token
+        self._consecutive_failures = 0
+        self._degraded_until = 0.0
+
+        # Estatísticas do modelo
+        self._in_flight = 0
+        self._counters = dict.fromkeys(
+            ("requests", "successes", "failures", "retries", "failovers", "rate_limited", "saturated", "degradations"),
+            0,
+        )
+
+    def count(self, counter, value=1):
+        """Incrementa uma das estatísticas do modelo."""
+        with self._lock:
+            self._counters[counter] += value
+        metrics.inc(f"model_router_{counter}_total", value, backend=self.name)
+
+    def try_acquire(self):
+        """
+        Reserva uma vaga de requisição simultânea, sem esperar.
+
+        Returns:
+            bool: True se a vaga foi reservada (e deve ser liberada com release).
+        """
+        if not self._semaphore.acquire(blocking=False):
+            return False
+        with self._lock:
+            self._in_flight += 1
+        return True
+
+    def acquire(self, timeout):
+        """
+        Reserva uma vaga de requisição simultânea, esperando até timeout segundos.
+
+        Returns:
+            bool: True se a vaga foi reservada.
+        """
+        if not self._semaphore.acquire(timeout=timeout):
+            return False
+        with self._lock:
+            self._in_flight += 1
+        return True
+
+    def release(self):
+        """Libera a vaga de requisição simultânea."""
+        with self._lock:
+            self._in_flight -= 1
+        self._semaphore.release()
+
+    def is_degraded(self):
+        """Verifica se o modelo está degradado (latência acima do SLO ou falhas seguidas)."""
+        with self._lock:
+            if self._degraded_until and self.clock() >= self._degraded_until:
+                # Fim do cooldown: o modelo volta a ser tentado, sem o histórico de latência
+                self._degraded_until = 0.0
+                self._latency_ewma = None
+                self._consecutive_failures = 0
+            return self._degraded_until > 0
+
+    def _degrade(self):
+        """Marca o modelo como degradado (chamado com o lock adquirido)."""
+        if not self._degraded_until:
+            self._counters["degradations"] += 1
+            metrics.inc("model_router_degradations_total", backend=self.name)
+        self._degraded_until = self.clock() + self.cooldown_seconds
+
+    def record_first_token(self, seconds):
+        """
+        Registra o tempo até o primeiro token de uma resposta.
+
+        Args:
+            seconds (float): Tempo até o primeiro token.
+        """
+        with self._lock:
+            if self._latency_ewma is None:
+                self._latency_ewma = seconds
+            else:
+                self._latency_ewma = self.ewma_alpha * seconds + (1 - self.ewma_alpha) * self._latency_ewma
+            if self.slo_seconds is not None and self._latency_ewma > self.slo_seconds:
+                self._degrade()
+
+    def record_success(self):
+        """Registra uma resposta completa."""
+        with self._lock:
+            self._consecutive_failures = 0
+            self._counters["successes"] += 1
+        metrics.inc("model_router_successes_total", backend=self.name)
+
+    def record_failure(self, affects_health=True):
+        """
+        Registra uma requisição com erro.
+
+        Args:
+            affects_health (bool, optional): Se o erro conta para a degradação do modelo. Erros de
+                autenticação e de cota de uma chave não devem degradar o modelo para as demais. Padrão: True.
+        """
+        with self._lock:
+            self._counters["failures"] += 1
+            if affects_health:
+                self._consecutive_failures += 1
+                if self._consecutive_failures >= self.failure_threshold:
+                    self._degrade()
+        metrics.inc("model_router_failures_total", backend=self.name)
+
+    def stats(self):
+        """Retorna as estatísticas, a latência média e o estado do modelo."""
+        degraded = self.is_degraded()
+        with self._lock:
+            return {
+                **self._counters,
+                "in_flight": self._in_flight,
+                "max_concurrency": self.max_concurrency,
+                "first_token_ewma_seconds": self._latency_ewma,
+                "degraded": degraded,
+            }
+
+
+class BackendLimiterRegistry:
+    """
+    Limites (BackendLimiter) compartilhados por todas as sessões, um por chave de API e modelo.
+
+    Os limites de taxa e de cota dos provedores valem por chave de API: sessões com chaves diferentes
+    não disputam o mesmo token bucket, e os erros de uma chave não degradam o modelo para as demais.
+    As chaves são identificadas pelo hash SHA-256, nunca guardadas. Modelos sem chave (ex.: Ollama)
+    compartilham um único limite.
+
+    Args:
+        limits (dict, optional): Argumentos do BackendLimiter por nome de modelo. Modelos sem limites
+            configurados usam os limites padrão. Padrão: None.
+    """
+
+    def __init__(self, limits=None):
+        """Inicializa o registro vazio."""
+        self.limits = limits or {}
+        self._limiters = {}  # (hash da chave de API, nome do modelo) -> BackendLimiter
+        self._lock = threading.Lock()
+
+    def get(self, model_name, api_key=None):
+        """
+        Retorna o limite do modelo para a chave de API, criando-o no primeiro uso.
+
+        Args:
+            model_name (str): Nome do modelo.
+            api_key (str, optional): Chave de API usada pelo modelo. Padrão: None (modelo sem chave).
+
+        Returns:
+            BackendLimiter: Limite compartilhado.
+        """
+        api_key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest() if api_key else None
+        key = (api_key_hash, model_name)
+        with self._lock:
+            if key not in self._limiters:
+                self._limiters[key] = BackendLimiter(model_name, **self.limits.get(model_name, {}))
+            return self._limiters[key]
+
+    def stats(self):
+        """Retorna as estatísticas de cada limite, identificado pelo modelo e pelo início do hash da chave."""
+        with self._lock:
+            limiters = list(self._limiters.items())
+        return {
+            f"{model_name}@{api_key_hash[:8] if api_key_hash else '-'}": limiter.stats()
+            for (api_key_hash, model_name), limiter in limiters
+        }
+
+
+class RouterModel(LLMBaseModel):
+    """
+    Modelo que distribui as mensagens entre vários modelos (Gemini, Ollama, Mock), em ordem de preferência.
+
+    Cada mensagem vai para o primeiro modelo disponível da lista: os modelos degradados (veja
+    BackendLimiter) passam para o fim da fila, e um modelo sem vaga de requisição simultânea ou sem
+    token de taxa é pulado (o último da fila espera). Erros transitórios antes do primeiro chunk são
+    repetidos com backoff exponencial e, esgotadas as tentativas, a mensagem vai para o modelo
+    seguinte; erros durante o stream são propagados, pois parte da resposta já foi exibida. A lista
+    deve ir do modelo preferido para os mais baratos.
+
+    O roteador mantém a persona e um contexto compacto da conversa: quando um modelo recebe uma
+    mensagem sem ter acompanhado os turnos anteriores (troca de modelo ou falha), o seu histórico é
+    descartado e ele recebe a persona (se não a mantiver) e o contexto compacto junto com a mensagem.
+
+    Args:
+        model_name (str): Nome do modelo roteado (ex.: "auto").
+        backends (list): Modelos (LLMBaseModel), do preferido para os mais baratos.
+        limiters (dict, optional): Limites compartilhados por nome de modelo (BackendLimiter, veja
+            BackendLimiterRegistry). Modelos sem limites recebem um BackendLimiter padrão, exclusivo deste roteador.
+        max_retries (int, optional): Tentativas extras por modelo em erros transitórios. Padrão: 2.
+        backoff_seconds (float, optional): Espera antes da primeira repetição (dobra a cada tentativa). Padrão: 0.5.
+        max_backoff_seconds (float, optional): Espera máxima entre as tentativas. Padrão: 8.0.
+        acquire_timeout (float, optional): Espera máxima por uma vaga no último modelo da fila. Padrão: 30.0.
+    """
+
+    def __init__(
+        self,
+        model_name,
+        backends,
+        limiters=None,
+        max_retries=2,
+        backoff_seconds=0.5,
+        max_backoff_seconds=8.0,
+        acquire_timeout=30.0,
+    ):
+        """Inicializa o roteador."""
+        if not backends:
+            raise ValueError("RouterModel requires at least one backend.")
+
+        super().__init__(model_name, backends[0].temperature, backends[0].temperature_range)
+        self.backends = list(backends)
+        limiters = limiters or {}
+        self.limiters = {
+            backend.name: limiters.get(backend.name) or BackendLimiter(backend.name) for backend in self.backends
+        }
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.acquire_timeout = acquire_timeout
+
+        # Persona e contexto compacto da conversa, enviados aos modelos que não acompanharam os turnos
+        self._prefix = ""
+        self._holds_prefix = {}  # nome do modelo -> True se o modelo mantém a persona
+        self.context = ConversationContext()
+        self._turns = 0  # Turnos completos da conversa
+        self._synced_turns = dict.fromkeys(self._backend_names(), -1)  # Turnos acompanhados por cada modelo
+
+        self.active_backend = ""  # Modelo que respondeu a última mensagem
+
+    def _backend_names(self):
+        return [backend.name for backend in self.backends]
+
+    @LLMBaseModel.temperature.setter
+    def temperature(self, value):
+        """Define a temperatura do roteador e de todos os modelos."""
+        LLMBaseModel.temperature.fset(self, value)
+        for backend in self.backends:
+            backend.temperature = value
+
+    def set_persona_prefix(self, prefix, prefix_hash):
+        """Oferece a persona a todos os modelos; o roteador a envia aos que não a mantêm."""
+        self._prefix = prefix
+        self._holds_prefix = {
+            backend.name: backend.set_persona_prefix(prefix, prefix_hash) for backend in self.backends
+        }
+        return True
+
+    def next_backend_holds_persona(self):
+        """Verifica se o modelo que deve receber a próxima mensagem mantém a persona fora das mensagens."""
+        backend, _ = self._plan()[0]
+        return bool(self._holds_prefix.get(backend.name))
+
+    def reset_history(self):
+        """Descarta o histórico de todos os modelos e o contexto compacto do roteador."""
+        for backend in self.backends:
+            backend.reset_history()
+        self.context.reset()
+        self._turns = 0
+        self._synced_turns = dict.fromkeys(self._backend_names(), -1)
+
+    def _plan(self):
+        """Retorna os modelos na ordem de tentativa: os saudáveis primeiro, os degradados por último."""
+        healthy, degraded = [], []
+        for backend in self.backends:
+            limiter = self.limiters[backend.name]
+            (degraded if limiter.is_degraded() else healthy).append((backend, limiter))
+        return healthy + degraded
+
+    def _prepare_message(self, backend, message):
+        """Monta a mensagem para o modelo, com a persona e o contexto se ele não acompanhou a conversa."""
+        if self._synced_turns[backend.name] == self._turns:
+            return message
+
+        backend.reset_history()  # Descarta turnos parciais ou desatualizados
+        prefix = "" if self._holds_prefix.get(backend.name) else self._prefix
+        context = self.context.render()
+        if not prefix and not context:
+            return message
+        return prefix + context + "\nNova mensagem do usuario: " + message
+
+    def _complete_turn(self, backend, message, response):
+        """Registra o turno completo no contexto compacto."""
+        self.context.append("user", message)
+        self.context.append("assistant", response)
+        self._turns += 1
+        self._synced_turns[backend.name] = self._turns
+        self.active_backend = backend.name
+
+    def _backoff_delay(self, attempt):
+        """Espera (com jitter) antes da tentativa attempt (1, 2, ...)."""
+        delay = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (attempt - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _rate_limit_delay(self, limiter, is_last):
+        """
+        Consome um token de taxa do modelo.
+
+        Returns:
+            float: 0.0 se o token foi consumido, o tempo de espera até o próximo token se o modelo é o
+                último da fila, ou None se o modelo deve ser pulado.
+        """
+        if limiter.bucket is None or limiter.bucket.try_acquire():
+            return 0.0
+        limiter.count("rate_limited")
+        if not is_last:
+            return None
+        return max(limiter.bucket.time_until_available(), 0.001)  # Espera positiva: o token ainda não foi consumido
+
+    def _failed_attempt(self, limiter, error, received):
+        """
+        Registra uma tentativa com erro.
+
+        Returns:
+            bool: True se a mensagem pode ser repetida (erro transitório antes do primeiro chunk).
+        """
+        limiter.record_failure(affects_health=not is_credential_error(error))
+        return not received and is_transient_error(error)
+
+    def send_stream_message(self, message):
+        """
+        Envia a mensagem ao primeiro modelo disponível e retorna a resposta em stream.
+
+        Args:
+            message (str): Mensagem a ser enviada.
+
+        Returns:
+            generator: Um gerador que retorna as partes da resposta em stream.
+        """
+        self.last_usage = None
+        plan = self._plan()
+        last_error = None
+        for position, (backend, limiter) in enumerate(plan):
+            is_last = position == len(plan) - 1
+            acquired = limiter.try_acquire() or (is_last and limiter.acquire(self.acquire_timeout))
+            if not acquired:
+                limiter.count("saturated")
+                limiter.count("failovers")
+                continue
+
+            try:
+                for attempt in range(self.max_retries + 1):
+                    if attempt:
+                        limiter.count("retries")
+                        time.sleep(self._backoff_delay(attempt))
+                    delay = self._rate_limit_delay(limiter, is_last)
+                    if delay is None:
+                        break  # Sem token de taxa: passa para o próximo modelo
+                    while delay:
+                        time.sleep(delay)  # Último modelo da fila: espera o próximo token
+                        delay = self._rate_limit_delay(limiter, is_last)
+
+                    limiter.count("requests")
+                    prompt = self._prepare_message(backend, message)
+                    self._synced_turns[backend.name] = -1  # Até o fim da resposta, o histórico do modelo está incompleto
+                    buffer = StreamBuffer()
+                    start = time.monotonic()
+                    try:
+                        for chunk in backend.send_stream_message(prompt):
+                            if not buffer:
+                                limiter.record_first_token(time.monotonic() - start)
+                            buffer.append(chunk)
+                            yield chunk
+                    except Exception as e:
+                        if not self._failed_attempt(limiter, e, bool(buffer)):
+                            raise
+                        last_error = e
+                        continue
+
+                    limiter.record_success()
+                    self.last_usage = backend.last_usage
+                    self._complete_turn(backend, message, buffer.text())
+                    return
+            finally:
+                limiter.release()
+            limiter.count("failovers")
+
+        raise last_error or RuntimeError("Nenhum modelo disponível para responder a mensagem.")
+
+    async def async_send_stream_message(self, message):
+        """
+        Versão assíncrona de send_stream_message (as esperas não bloqueiam o event loop).
+
+        Args:
+            message (str): Mensagem a ser enviada.
+
+        Returns:
+            async generator: Um gerador assíncrono que retorna as partes da resposta em stream.
+        """
+        self.last_usage = None
+        plan = self._plan()
+        last_error = None
+        for position, (backend, limiter) in enumerate(plan):
+            is_last = position == len(plan) - 1
+            acquired = limiter.try_acquire()
+            if not acquired and is_last:
+                # Espera uma vaga no último modelo da fila, sem bloquear o event loop
+                deadline = time.monotonic() + self.acquire_timeout
+                while not acquired and time.monotonic() < deadline:
+                    await asyncio.sleep(0.01)
+                    acquired = limiter.try_acquire()
+            if not acquired:
+                limiter.count("saturated")
+                limiter.count("failovers")
+                continue
+
+            try:
+                for attempt in range(self.max_retries + 1):
+                    if attempt:
+                        limiter.count("retries")
+                        await asyncio.sleep(self._backoff_delay(attempt))
+                    delay = self._rate_limit_delay(limiter, is_last)
+                    if delay is None:
+                        break  # Sem token de taxa: passa para o próximo modelo
+                    while delay:
+                        await asyncio.sleep(delay)  # Último modelo da fila: espera o próximo token
+                        delay = self._rate_limit_delay(limiter, is_last)
+
+                    limiter.count("requests")
+                    prompt = self._prepare_message(backend, message)
+                    self._synced_turns[backend.name] = -1  # Até o fim da resposta, o histórico do modelo está incompleto
+                    buffer = StreamBuffer()
+                    start = time.monotonic()
+                    try:
+                        async for chunk in backend.async_send_stream_message(prompt):
+                            if not buffer:
+                                limiter.record_first_token(time.monotonic() - start)
+                            buffer.append(chunk)
+                            yield chunk
+                    except Exception as e:
+                        if not self._failed_attempt(limiter, e, bool(buffer)):
+                            raise
+                        last_error = e
+                        continue
+
+                    limiter.record_success()
+                    self.last_usage = backend.last_usage
+                    self._complete_turn(backend, message, buffer.text())
+                    return
+            finally:
+                limiter.release()
+            limiter.count("failovers")
+
+        raise last_error or RuntimeError("Nenhum modelo disponível para responder a mensagem.")
+
+    def stats(self):
+        """Retorna as estatísticas de cada modelo e o modelo que respondeu a última mensagem."""
+        return {
+            "active_backend": self.active_backend,
+            "backends": {name: limiter.stats() for name, limiter in self.limiters.items()},
+        }
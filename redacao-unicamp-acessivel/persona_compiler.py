@@ -0,0 +1,224 @@
+import os  # Importa o módulo os para manipular caminhos e diretórios
+import sys  # Importa o módulo sys para ler os argumentos da linha de comando
+import json  # Importa o módulo json para ler a persona e gravar o artefato compilado
+import hashlib  # Importa o módulo hashlib para calcular a chave do artefato compilado
+import threading  # Importa o módulo threading para proteger o cache em memória
+from persona_registry import get_persona_registry  # Importa o registro de personas compartilhado pelo processo
+
+# Diretório padrão onde os prompts compilados são armazenados
+DEFAULT_CACHE_DIR = os.path.join(".cache", "personas")
+
+# Campos da persona que delimitam o prompt e, portanto, não fazem parte do seu conteúdo
+PERSONA_MARKER_FIELDS = ("beg_persona_content", "end_persona_content")
+
+# Aproximação usada para estimar tokens localmente (cerca de 4 caracteres por token)
+CHARS_PER_TOKEN = 4
+
+# Versão do formato do artefato compilado (incrementar ao mudar a forma de compilar)
+COMPILER_VERSION = 2
+
+# Marcadores usados quando a persona não define os seus
+DEFAULT_BEG_MARKER = "<beg_persona>\n"
+DEFAULT_END_MARKER = "\n<end_persona>"
+
+# Cache em memória dos prompts compilados, compartilhado por todas as sessões do processo
+_compiled_personas = {}
+_compiled_personas_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    """
+    Estima localmente o número de tokens de um texto.
+
+    Args:
+        text (str): Texto a ser estimado.
+
+    Returns:
+        int: Número aproximado de tokens.
+    """
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class CompiledPersona:
+    """
+    Prompt compacto e determinístico gerado a partir do arquivo JSON de uma persona.
+
+    Args:
+        persona_hash (str): Hash SHA-256 do arquivo da persona.
+        prompt (str): Prompt compilado.
+        original_bytes (int): Tamanho, em bytes, do prompt gerado por str(persona).
+        original_tokens (int): Estimativa de tokens do prompt gerado por str(persona).
+        beg_marker (str, optional): Marcador de início da persona. Padrão: DEFAULT_BEG_MARKER.
+        end_marker (str, optional): Marcador de fim da persona. Padrão: DEFAULT_END_MARKER.
+    """
+
+    def __init__(
+        self,
+        persona_hash,
+        prompt,
+        original_bytes,
+        original_tokens,
+        beg_marker=DEFAULT_BEG_MARKER,
+        end_marker=DEFAULT_END_MARKER,
+    ):
+        """Inicializa o prompt compilado."""
+        self.persona_hash = persona_hash
+        self.prompt = prompt
+        self.original_bytes = original_bytes
+        self.original_tokens = original_tokens
+        self.beg_marker = beg_marker
+        self.end_marker = end_marker
+
+    @property
+    def compiled_bytes(self):
+        """Retorna o tamanho, em bytes, do prompt compilado."""
+        return len(self.prompt.encode("utf-8"))
+
+    @property
+    def compiled_tokens(self):
+        """Retorna a estimativa de tokens do prompt compilado."""
+        return estimate_tokens(self.prompt)
+
+    def report(self):
+        """Retorna um resumo da redução obtida com a compilação."""
+        reduction = 1 - self.compiled_bytes / self.original_bytes if self.original_bytes else 0.0
+        return (
+            f"{self.original_bytes} -> {self.compiled_bytes} bytes, "
+            f"~{self.original_tokens} -> ~{self.compiled_tokens} tokens "
+            f"({reduction:.1%} de redução)"
+        )
+
+
+def _render_field(value):
+    """Converte o valor de um campo da persona em texto, sem o escape do repr do Python."""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _render_field_with_budget(value, token_budget):
+    """
+    Converte o valor de um campo respeitando um orçamento de tokens.
+
+    Listas e dicionários mantêm apenas os itens inteiros que cabem no orçamento (preservando a
+    estrutura do JSON); textos são cortados no último espaço em branco.
+    """
+    max_chars = token_budget * CHARS_PER_TOKEN
+    text = _render_field(value)
+    if len(text) <= max_chars:
+        return text
+
+    if isinstance(value, (list, dict)):
+        items = list(value.items()) if isinstance(value, dict) else list(value)
+        used = 2  # Delimitadores da lista ou do dicionário
+        kept = []
+        for item in items:
+            used += len(_render_field(dict([item]) if isinstance(value, dict) else item)) + 1
+            if used > max_chars:
+                break
+            kept.append(item)
+        return _render_field(dict(kept) if isinstance(value, dict) else kept)
+
+    cut = text.rfind(" ", 0, max_chars)
+    return text[: cut if cut > 0 else max_chars] + " [...]"
+
+
+def render_persona(persona, field_budgets=None, exclude_fields=()):
+    """
+    Gera o prompt compacto de uma persona já carregada.
+
+    Args:
+        persona (dict): Persona carregada do arquivo JSON.
+        field_budgets (dict, optional): Orçamento máximo de tokens por campo da persona.
+        exclude_fields (iterable, optional): Campos que não devem ser incluídos no prompt.
+
+    Returns:
+        str: Prompt compilado.
+    """
+    field_budgets = field_budgets or {}
+    skipped = set(PERSONA_MARKER_FIELDS) | set(exclude_fields)
+
+    sections = []
+    for field, value in persona.items():
+        if field in skipped:
+            continue
+
+        if field in field_budgets:
+            text = _render_field_with_budget(value, field_budgets[field])
+        else:
+            text = _render_field(value)
+
+        sections.append(f"## {field}\n{text}")
+
+    return "\n".join(sections)
+
+
+def compile_persona(persona_path, cache_dir=DEFAULT_CACHE_DIR, field_budgets=None, exclude_fields=(), persona_registry=None):
+    """
+    Compila a persona em um prompt compacto, uma única vez por hash do arquivo.
+
+    O resultado é guardado em memória e em disco (em cache_dir), de modo que todas as sessões
+    (e todos os processos) reutilizam o mesmo artefato enquanto o arquivo não mudar. Com o artefato
+    em disco, um novo processo não precisa converter os campos da persona.
+
+    Args:
+        persona_path (str): Nome da persona ou caminho para o seu arquivo JSON.
+        cache_dir (str, optional): Diretório do cache em disco. Use None para desabilitá-lo.
+        field_budgets (dict, optional): Orçamento máximo de tokens por campo da persona.
+        exclude_fields (iterable, optional): Campos que não devem ser incluídos no prompt.
+        persona_registry (PersonaRegistry, optional): Registro que lê a persona. Padrão: o registro do processo.
+
+    Returns:
+        CompiledPersona: O prompt compilado e as estatísticas de redução.
+    """
+    # A persona é lida pelo registro (uma vez por versão do arquivo, compartilhada pelas sessões)
+    persona = (persona_registry or get_persona_registry()).get(persona_path)
+
+    # A chave considera o conteúdo do arquivo e as opções de compilação
+    persona_hash = persona.persona_hash
+    options = json.dumps(
+        [COMPILER_VERSION, sorted((field_budgets or {}).items()), sorted(exclude_fields)],
+        ensure_ascii=False,
+    )
+    cache_key = hashlib.sha256((persona_hash + options).encode("utf-8")).hexdigest()
+
+    with _compiled_personas_lock:
+        compiled = _compiled_personas.get(cache_key)
+    if compiled is not None:
+        return compiled
+
+    cache_path = os.path.join(cache_dir, cache_key + ".json") if cache_dir else None
+
+    if cache_path and os.path.exists(cache_path):
+        # Reaproveita o artefato compilado por outro processo (ou execução anterior)
+        with open(cache_path, encoding="utf-8") as cache_file:
+            compiled = CompiledPersona(**json.load(cache_file))
+    else:
+        persona = persona.to_dict()
+        original_prompt = str(persona)  # Prompt gerado antes da compilação, usado no relatório
+        compiled = CompiledPersona(
+            persona_hash=persona_hash,
+            prompt=render_persona(persona, field_budgets, exclude_fields),
+            original_bytes=len(original_prompt.encode("utf-8")),
+            original_tokens=estimate_tokens(original_prompt),
+            beg_marker=persona.get("beg_persona_content", DEFAULT_BEG_MARKER),
+            end_marker=persona.get("end_persona_content", DEFAULT_END_MARKER),
+        )
+
+        if cache_path:
+            # Grava em um arquivo temporário e renomeia, para que leitores nunca vejam um arquivo parcial
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"  # Único por processo e thread
+            with open(tmp_path, "w", encoding="utf-8") as cache_file:
+                json.dump(vars(compiled), cache_file, ensure_ascii=False)
+            os.replace(tmp_path, cache_path)
+
+    with _compiled_personas_lock:
+        _compiled_personas[cache_key] = compiled
+    return compiled
+
+
+if __name__ == "__main__":
+    # Compila as personas informadas e exibe a redução obtida para cada uma delas
+    for path in sys.argv[1:]:
+        print(f"{path}: {compile_persona(path).report()}")
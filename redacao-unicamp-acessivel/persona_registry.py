@@ -0,0 +1,350 @@
+import os  # Importa o módulo os para descobrir as personas e verificar alterações nos arquivos
+import sys  # Importa o módulo sys para ler os argumentos da linha de comando
+import json  # Importa o módulo json para ler as personas e o cabeçalho dos campos mapeados
+import mmap  # Importa o módulo mmap para mapear os campos grandes em memória
+import time  # Importa o módulo time para limitar a frequência das verificações de alteração
+import struct  # Importa o módulo struct para ler e gravar o cabeçalho binário
+import hashlib  # Importa o módulo hashlib para identificar a versão de cada persona
+import threading  # Importa o módulo threading para proteger o registro entre threads
+from types import MappingProxyType  # Visão somente leitura de um dicionário
+from collections.abc import Mapping  # Interface de mapeamento da visão da persona
+
+# Diretório com as personas (uma pasta por persona, com um arquivo JSON)
+DEFAULT_PERSONAS_DIR = "personas"
+
+# Diretório onde os campos mapeados em memória são gravados
+DEFAULT_FIELDS_DIR = os.path.join(".cache", "personas")
+
+# Formato do arquivo de campos mapeados: assinatura, versão e tamanho do cabeçalho JSON
+_MAGIC = b"RUPF"
+_VERSION = 1
+_PREAMBLE = struct.Struct("<4sII")
+
+
+def freeze(value):
+    """
+    Retorna uma cópia somente leitura de um valor lido do JSON.
+
+    Args:
+        value: Valor (dicionário, lista ou valor simples).
+
+    Returns:
+        Dicionários como MappingProxyType, listas como tuplas e os demais valores sem alteração.
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """
+    Retorna uma cópia modificável de um valor da persona (o inverso de freeze).
+
+    Args:
+        value: Valor somente leitura (visão, tupla, MappedField ou valor simples).
+
+    Returns:
+        Dicionários e listas comuns, com os campos mapeados já lidos do arquivo.
+    """
+    if isinstance(value, MappedField):
+        return json.loads(value.text())
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+class MappedField:
+    """
+    Campo da persona mantido em um arquivo mapeado em memória, e não no heap do processo.
+
+    O texto JSON do campo é lido do mmap a cada acesso, de modo que vários processos (ex.: os workers
+    do Streamlit) compartilham as mesmas páginas do arquivo.
+
+    Args:
+        buffer (mmap.mmap): Arquivo mapeado.
+        offset (int): Posição do campo no arquivo.
+        size (int): Tamanho (em bytes) do campo.
+    """
+
+    __slots__ = ("_buffer", "_offset", "_size")
+
+    def __init__(self, buffer, offset, size):
+        self._buffer = buffer
+        self._offset = offset
+        self._size = size
+
+    def __len__(self):
+        """Retorna o tamanho (em bytes) do campo."""
+        return self._size
+
+    def text(self):
+        """Retorna o campo como texto JSON."""
+        return self._buffer[self._offset : self._offset + self._size].decode("utf-8")
+
+    def load(self):
+        """Retorna o valor do campo (somente leitura), interpretado a cada chamada."""
+        return freeze(json.loads(self.text()))
+
+
+def _write_fields_file(fields, fields_path):
+    """Grava os campos em um arquivo (cabeçalho JSON com os deslocamentos, seguido dos textos JSON)."""
+    encoded = {field: json.dumps(value, ensure_ascii=False).encode("utf-8") for field, value in fields.items()}
+    positions, offset = {}, 0
+    for field, data in encoded.items():
+        positions[field] = [offset, len(data)]
+        offset += len(data)
+    header_bytes = json.dumps(positions, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    # Grava em um arquivo temporário e renomeia, para que leitores nunca vejam um arquivo parcial
+    os.makedirs(os.path.dirname(fields_path) or ".", exist_ok=True)
+    tmp_path = f"{fields_path}.{os.getpid()}.{threading.get_ident()}.tmp"  # Único por processo e thread
+    with open(tmp_path, "wb") as fields_file:
+        fields_file.write(_PREAMBLE.pack(_MAGIC, _VERSION, len(header_bytes)))
+        fields_file.write(header_bytes)
+        for data in encoded.values():
+            fields_file.write(data)
+    os.replace(tmp_path, fields_path)
+
+
+def _map_fields_file(fields_path):
+    """Mapeia o arquivo de campos e retorna um MappedField por campo."""
+    with open(fields_path, "rb") as fields_file:
+        buffer = mmap.mmap(fields_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, header_size = _PREAMBLE.unpack_from(buffer, 0)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError(f"Invalid persona fields file: {fields_path}")
+
+    start = _PREAMBLE.size + header_size
+    positions = json.loads(buffer[_PREAMBLE.size : start].decode("utf-8"))
+    return {field: MappedField(buffer, start + offset, size) for field, (offset, size) in positions.items()}
+
+
+class Persona(Mapping):
+    """
+    Visão somente leitura de uma persona, compartilhada por todas as sessões do processo.
+
+    Funciona como um dicionário dos campos do JSON (com dicionários e listas somente leitura). Os
+    campos mapeados em memória são retornados como MappedField; use load para obter o valor de
+    qualquer campo, mapeado ou não.
+
+    Args:
+        name (str): Nome da persona (nome da pasta).
+        path (str): Caminho do arquivo JSON.
+        persona_hash (str): Hash SHA-256 do arquivo.
+        fields (dict): Campos da persona.
+    """
+
+    def __init__(self, name, path, persona_hash, fields):
+        """Inicializa a visão."""
+        self.name = name
+        self.path = path
+        self.persona_hash = persona_hash
+        self._fields = MappingProxyType(fields)
+
+    def __getitem__(self, field):
+        return self._fields[field]
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def load(self, field, default=None):
+        """
+        Retorna o valor de um campo, lendo-o do arquivo mapeado se necessário.
+
+        Args:
+            field (str): Nome do campo.
+            default (optional): Valor retornado se o campo não existir. Padrão: None.
+
+        Returns:
+            Valor do campo (somente leitura).
+        """
+        value = self._fields.get(field, default)
+        return value.load() if isinstance(value, MappedField) else value
+
+    def to_dict(self):
+        """Retorna uma cópia modificável de todos os campos, na ordem do arquivo (ex.: para serializá-la)."""
+        return {field: thaw(value) for field, value in self._fields.items()}
+
+
+class PersonaRegistry:
+    """
+    Registro das personas, carregadas uma única vez por processo e compartilhadas por todas as sessões.
+
+    Descobre as personas em personas_dir (uma pasta por persona, com um arquivo JSON). Cada arquivo é
+    lido uma vez e exposto como uma visão somente leitura (Persona); quando o arquivo muda, a persona
+    é recarregada no próximo acesso, e as sessões que ainda usam a versão anterior continuam com uma
+    visão válida. Os campos em mmap_fields (ex.: a base de conhecimento) podem ser mantidos em um
+    arquivo mapeado em memória, compartilhado entre os processos, em vez de no heap de cada um.
+
+    Args:
+        personas_dir (str, optional): Diretório das personas. Padrão: DEFAULT_PERSONAS_DIR.
+        mmap_fields (iterable, optional): Campos mantidos em arquivo mapeado em memória. Padrão: ().
+        fields_dir (str, optional): Diretório dos arquivos de campos mapeados. Padrão: DEFAULT_FIELDS_DIR.
+        check_interval (float, optional): Intervalo mínimo (em segundos) entre as verificações de
+            alteração de cada arquivo. Padrão: 1.0.
+    """
+
+    def __init__(self, personas_dir=DEFAULT_PERSONAS_DIR, mmap_fields=(), fields_dir=DEFAULT_FIELDS_DIR, check_interval=1.0):
+        """Inicializa o registro vazio."""
+        self.personas_dir = personas_dir
+        self.mmap_fields = tuple(mmap_fields)
+        self.fields_dir = fields_dir
+        self.check_interval = check_interval
+
+        self._personas = {}  # caminho -> (versão do arquivo, instante da última verificação, Persona)
+        self._lock = threading.Lock()
+        self._loads = 0
+        self._reloads = 0
+        self._hits = 0
+
+    def discover(self):
+        """
+        Descobre as personas disponíveis.
+
+        Returns:
+            dict: Nome da persona (nome da pasta) -> caminho do arquivo JSON.
+        """
+        personas = {}
+        if not os.path.isdir(self.personas_dir):
+            return personas
+        for name in sorted(os.listdir(self.personas_dir)):
+            folder = os.path.join(self.personas_dir, name)
+            if not os.path.isdir(folder):
+                continue
+            # Prefere o arquivo com o nome da pasta (ex.: dani_stella/dani_stella.json)
+            files = sorted(file for file in os.listdir(folder) if file.endswith(".json"))
+            if files:
+                preferred = name + ".json"
+                personas[name] = os.path.join(folder, preferred if preferred in files else files[0])
+        return personas
+
+    def names(self):
+        """Retorna os nomes das personas disponíveis."""
+        return list(self.discover())
+
+    def path(self, name_or_path):
+        """
+        Retorna o caminho do arquivo de uma persona.
+
+        Args:
+            name_or_path (str): Nome da persona (ex.: "dani_stella") ou caminho do arquivo JSON.
+
+        Returns:
+            str: Caminho do arquivo JSON.
+        """
+        if os.path.isfile(name_or_path):
+            return name_or_path
+        path = self.discover().get(name_or_path)
+        if path is None:
+            raise KeyError(f"Persona not found: {name_or_path}")
+        return path
+
+    def get(self, name_or_path):
+        """
+        Retorna a persona, carregando-a no primeiro acesso ou quando o arquivo muda.
+
+        Args:
+            name_or_path (str): Nome da persona (ex.: "dani_stella") ou caminho do arquivo JSON.
+
+        Returns:
+            Persona: Visão somente leitura da persona.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._personas.get(name_or_path)
+            if entry is not None and now - entry[1] < self.check_interval:
+                self._hits += 1
+                return entry[2]
+
+        path = self.path(name_or_path)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._personas.get(name_or_path)
+            if entry is not None and entry[0] == version:
+                self._personas[name_or_path] = (version, now, entry[2])
+                self._hits += 1
+                return entry[2]
+
+        # Carrega fora do lock, para que a leitura de uma persona não bloqueie as demais
+        persona = self._load(path)
+
+        with self._lock:
+            if entry is not None:
+                self._reloads += 1
+            self._personas[name_or_path] = (version, now, persona)
+            self._loads += 1
+        return persona
+
+    def _load(self, path):
+        """Lê o arquivo da persona e cria a sua visão somente leitura."""
+        with open(path, "rb") as persona_file:
+            raw_persona = persona_file.read()
+        persona_hash = hashlib.sha256(raw_persona).hexdigest()
+        fields = json.loads(raw_persona)
+
+        mapped = {field: fields[field] for field in self.mmap_fields if field in fields}
+        # Os campos mapeados mantêm a sua posição na persona (substituídos pelo MappedField abaixo)
+        frozen = {field: None if field in mapped else freeze(value) for field, value in fields.items()}
+        del fields
+        if mapped:
+            # O arquivo é identificado pelo hash da persona e pelos campos mapeados
+            key = hashlib.sha256((persona_hash + json.dumps(sorted(mapped))).encode("utf-8")).hexdigest()
+            fields_path = os.path.join(self.fields_dir, key + ".fields")
+            if not os.path.exists(fields_path):
+                _write_fields_file(mapped, fields_path)
+            frozen.update(_map_fields_file(fields_path))
+            del mapped  # Os valores interpretados não ficam na memória do processo
+
+        name = os.path.basename(os.path.dirname(path)) or os.path.splitext(os.path.basename(path))[0]
+        return Persona(name, path, persona_hash, frozen)
+
+    def stats(self):
+        """Retorna estatísticas de uso do registro."""
+        with self._lock:
+            return {
+                "personas": len(self._personas),
+                "loads": self._loads,
+                "reloads": self._reloads,
+                "hits": self._hits,
+            }
+
+
+# Registros compartilhados por todas as sessões do processo, por configuração
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_persona_registry(personas_dir=DEFAULT_PERSONAS_DIR, mmap_fields=()):
+    """
+    Retorna o registro de personas do processo para a configuração informada.
+
+    Args:
+        personas_dir (str, optional): Diretório das personas. Padrão: DEFAULT_PERSONAS_DIR.
+        mmap_fields (iterable, optional): Campos mantidos em arquivo mapeado em memória. Padrão: ().
+
+    Returns:
+        PersonaRegistry: O registro compartilhado.
+    """
+    key = (personas_dir, tuple(mmap_fields))
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = _registries[key] = PersonaRegistry(personas_dir, mmap_fields)
+        return registry
+
+
+if __name__ == "__main__":
+    # Lista as personas descobertas e o número de campos de cada uma
+    registry = get_persona_registry(*(sys.argv[1:2] or [DEFAULT_PERSONAS_DIR]))
+    for persona_name, persona_path in registry.discover().items():
+        print(f"{persona_name}: {persona_path} ({len(registry.get(persona_name))} campos)")
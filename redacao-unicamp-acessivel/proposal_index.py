@@ -0,0 +1,218 @@
+import re  # Importa o módulo re para separar a mensagem do usuário em palavras
+import csv  # Importa o módulo csv para ler a base de propostas sem depender do Pandas
+import difflib  # Importa o módulo difflib para reconhecer a palavra "proposta" escrita com erros
+import threading  # Importa o módulo threading para proteger o cache de índices entre threads
+import unicodedata  # Importa o módulo unicodedata para remover acentos da mensagem
+
+# Caminho padrão da base de propostas de redação
+DEFAULT_PROPOSALS_PATH = "dados/base_de_dados_proposta_redacoes.csv"
+
+# Similaridade mínima para que uma palavra seja considerada uma grafia de "proposta" (ex.: "porposta")
+PROPOSAL_WORD_SIMILARITY = 0.8
+
+# Número de palavras, depois de "proposta", em que o número da proposta é procurado
+PROPOSAL_NUMBER_WINDOW = 3
+
+# Formas por extenso do número da proposta (a prova da Unicamp possui duas propostas). "uma" não é
+# aceita, e "um" só depois de "proposta": antes dela são artigos (ex.: "uma proposta de lei em 2015")
+_PROPOSAL_NUMBER_WORDS = {
+    "um": 1, "primeira": 1, "primeiro": 1, "i": 1,
+    "dois": 2, "duas": 2, "segunda": 2, "segundo": 2, "ii": 2,
+    "tres": 3, "terceira": 3, "terceiro": 3, "iii": 3,
+}
+
+# Artigos indefinidos, que não são o número da proposta quando aparecem antes dela
+_ARTICLE_WORDS = {"um", "uma"}
+
+# Palavras que podem aparecer entre "proposta" e o seu número (ex.: "proposta número 2")
+_PROPOSAL_FILLER_WORDS = {"n", "no", "nr", "num", "numero", "o", "a", "de", "da", "do"}
+
+# Anos aceitos como ano de uma proposta
+_YEAR_PATTERN = re.compile(r"(?:19|20)\d{2}")
+
+# Separa a mensagem em palavras e números (ex.: "2a" -> "2", "a"; "2/2019" -> "2", "2019")
+_WORD_PATTERN = re.compile(r"[a-z]+|\d+")
+
+# Campos da base que identificam a proposta e não precisam ser repetidos no prompt
+_IDENTIFICATION_FIELDS = ("nome", "proposta", "ano")
+
+
+def _normalize(text):
+    """Converte o texto para minúsculas, sem acentos (ex.: "Número" -> "numero")."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def _is_proposal_word(word):
+    """Verifica se a palavra é uma grafia (possivelmente com erros) de "proposta"."""
+    if word in ("proposta", "propostas", "prop"):
+        return True
+    if len(word) < 6:
+        return False  # Palavras curtas demais geram falsos positivos (ex.: "posta")
+    return difflib.SequenceMatcher(None, word, "proposta").ratio() >= PROPOSAL_WORD_SIMILARITY
+
+
+def _parse_proposal_number(word):
+    """Converte a palavra no número da proposta, ou retorna None."""
+    if word.isdigit():
+        return int(word) if len(word) == 1 else None  # Anos e outros números não são propostas
+    return _PROPOSAL_NUMBER_WORDS.get(word)
+
+
+def parse_proposal_reference(message):
+    """
+    Identifica a proposta mencionada em uma mensagem do usuário.
+
+    Aceita variações como "proposta 2 de 2019", "Proposta nº 2/2019", "segunda proposta de 2019",
+    "proposta dois, Unicamp 2019" e erros de digitação em "proposta" (ex.: "porposta 1 2020").
+    O ano associado é o ano mais próximo da menção à proposta.
+
+    Args:
+        message (str): Mensagem do usuário.
+
+    Returns:
+        tuple: Tupla (proposta, ano) com dois inteiros, ou None se a mensagem não menciona uma proposta.
+    """
+    words = _WORD_PATTERN.findall(_normalize(message))
+    years = [(position, int(word)) for position, word in enumerate(words) if _YEAR_PATTERN.fullmatch(word)]
+    if not years:
+        return None
+
+    for position, word in enumerate(words):
+        if not _is_proposal_word(word):
+            continue
+
+        number = None
+
+        # Número depois de "proposta" (ex.: "proposta 2", "proposta número dois")
+        for following in words[position + 1:position + 1 + PROPOSAL_NUMBER_WINDOW]:
+            number = _parse_proposal_number(following)
+            if number is not None or following not in _PROPOSAL_FILLER_WORDS:
+                break
+
+        # Ordinal antes de "proposta" (ex.: "segunda proposta", "2a proposta")
+        if number is None and position > 0:
+            previous = words[position - 1]
+            if previous in ("a", "o") and position > 1:
+                previous = words[position - 2]  # "2a proposta" é separado em "2", "a"
+            if previous not in _ARTICLE_WORDS:
+                number = _parse_proposal_number(previous)
+
+        if number is not None:
+            # Associa a proposta ao ano mencionado mais perto dela
+            _, year = min(years, key=lambda item: abs(item[0] - position))
+            return number, year
+
+    return None
+
+
+class ProposalIndex:
+    """
+    Índice da base de propostas de redação, com acesso direto por (proposta, ano).
+
+    Permite que cada turno do chat receba apenas os dados estruturados da proposta mencionada pelo
+    usuário (gênero, enunciador, interlocutor, expectativas da banca etc.), em vez de depender de o
+    modelo encontrá-los no prompt da persona.
+
+    Args:
+        csv_path (str, optional): Caminho da base de propostas. Padrão: DEFAULT_PROPOSALS_PATH.
+    """
+
+    def __init__(self, csv_path=DEFAULT_PROPOSALS_PATH):
+        """Lê a base de propostas e monta o índice."""
+        self.csv_path = csv_path
+        self._proposals = {}  # (proposta, ano) -> linha da base (dict)
+        self._formatted = {}  # (proposta, ano) -> linha já formatada para o prompt
+
+        # O arquivo é salvo com BOM, removido pela codificação utf-8-sig
+        with open(csv_path, encoding="utf-8-sig", newline="") as csv_file:
+            for row in csv.DictReader(csv_file):
+                key = (int(row["proposta"]), int(row["ano"]))
+                self._proposals[key] = row
+                self._formatted[key] = self._format_row(row)
+
+    def __len__(self):
+        """Retorna o número de propostas no índice."""
+        return len(self._proposals)
+
+    def __contains__(self, key):
+        """Verifica se a proposta (proposta, ano) está no índice."""
+        return key in self._proposals
+
+    def keys(self):
+        """Retorna as chaves (proposta, ano) das propostas do índice, em ordem."""
+        return sorted(self._proposals)
+
+    def get(self, proposal, year):
+        """
+        Retorna a linha da base correspondente à proposta.
+
+        Args:
+            proposal (int): Número da proposta.
+            year (int): Ano da prova.
+
+        Returns:
+            dict: Linha da base (campo -> valor), ou None se a proposta não existe.
+        """
+        return self._proposals.get((int(proposal), int(year)))
+
+    def find(self, message):
+        """
+        Identifica a proposta mencionada na mensagem e retorna a sua chave, se ela estiver no índice.
+
+        Args:
+            message (str): Mensagem do usuário.
+
+        Returns:
+            tuple: Chave (proposta, ano), ou None.
+        """
+        reference = parse_proposal_reference(message)
+        if reference in self._proposals:
+            return reference
+        return None
+
+    def format_proposal(self, proposal, year):
+        """
+        Retorna os dados da proposta formatados para o prompt.
+
+        Args:
+            proposal (int): Número da proposta.
+            year (int): Ano da prova.
+
+        Returns:
+            str: Dados da proposta, ou uma string vazia se a proposta não existe.
+        """
+        return self._formatted.get((int(proposal), int(year)), "")
+
+    @staticmethod
+    def _format_row(row):
+        """Formata uma linha da base como seções "## campo", omitindo campos vazios."""
+        sections = [f"Dados da {row['nome'].lower()} (base de propostas de redação da Unicamp):"]
+        for field, value in row.items():
+            if field in _IDENTIFICATION_FIELDS:
+                continue
+            value = " ".join((value or "").split())  # Remove espaços não separáveis e quebras de linha
+            if value:
+                sections.append(f"## {field}\n{value}")
+        return "\n".join(sections) + "\n"
+
+
+# Cache dos índices já carregados neste processo (caminho -> ProposalIndex)
+_loaded_indices = {}
+_loaded_indices_lock = threading.Lock()
+
+
+def load_proposal_index(csv_path=DEFAULT_PROPOSALS_PATH):
+    """
+    Carrega o índice da base de propostas, uma única vez por processo.
+
+    Args:
+        csv_path (str, optional): Caminho da base de propostas. Padrão: DEFAULT_PROPOSALS_PATH.
+
+    Returns:
+        ProposalIndex: O índice da base de propostas.
+    """
+    with _loaded_indices_lock:
+        if csv_path not in _loaded_indices:
+            _loaded_indices[csv_path] = ProposalIndex(csv_path)
+        return _loaded_indices[csv_path]
@@ -0,0 +1,220 @@
+import json  # Importa o módulo json para serializar as partes da chave do cache
+import time  # Importa o módulo time para controlar a expiração das respostas
+import asyncio  # Importa o módulo asyncio para a reprodução assíncrona das respostas
+import hashlib  # Importa o módulo hashlib para gerar as chaves do cache
+import threading  # Importa o módulo threading para proteger o cache em memória
+from collections import OrderedDict  # Importa OrderedDict para implementar o nível LRU em memória
+
+# Tamanho (em caracteres) das partes em que uma resposta em cache é reproduzida
+REPLAY_CHUNK_SIZE = 64
+
+
+def normalize_prompt(prompt):
+    """
+    Normaliza a mensagem do usuário para a chave do cache.
+
+    Ignora diferenças de maiúsculas/minúsculas, de espaços e da pontuação final, de modo que
+    "O que é a máscara discursiva?" e "o que é a máscara discursiva" compartilhem a mesma resposta.
+
+    Args:
+        prompt (str): Mensagem do usuário.
+
+    Returns:
+        str: Mensagem normalizada.
+    """
+    return " ".join(prompt.casefold().split()).rstrip("?!.;: ")
+
+
+def replay(response, chunk_size=REPLAY_CHUNK_SIZE):
+    """
+    Reproduz uma resposta em cache parte por parte, com a mesma interface do stream de um modelo.
+
+    Args:
+        response (str): Resposta em cache.
+        chunk_size (int, optional): Tamanho das partes. Padrão: REPLAY_CHUNK_SIZE.
+
+    Returns:
+        generator: Um gerador que retorna as partes da resposta.
+    """
+    for start in range(0, len(response), chunk_size):
+        yield response[start:start + chunk_size]
+
+
+async def async_replay(response, chunk_size=REPLAY_CHUNK_SIZE):
+    """
+    Versão assíncrona de replay.
+
+    Args:
+        response (str): Resposta em cache.
+        chunk_size (int, optional): Tamanho das partes. Padrão: REPLAY_CHUNK_SIZE.
+
+    Returns:
+        async generator: Um gerador assíncrono que retorna as partes da resposta.
+    """
+    for chunk in replay(response, chunk_size):
+        yield chunk
+        await asyncio.sleep(0)  # Devolve o controle ao event loop entre as partes
+
+
+class ResponseCache:
+    """
+    Cache de respostas do modelo para perguntas repetidas (ex.: dúvidas comuns de quem começa a usar a plataforma).
+
+    A chave combina o hash da persona, o nome e a temperatura do modelo, a mensagem normalizada e a
+    janela de histórico relevante, de forma que a mesma pergunta feita em contextos diferentes não
+    compartilhe a resposta. As respostas ficam em dois níveis: um LRU em memória, por processo, e
+    uma tabela no SQLite, compartilhada entre processos e reinícios. Ambos expiram após ttl_seconds.
+
+    Args:
+        connection (SQLiteConnection, optional): Conexão usada pelo nível em SQLite. Sem conexão,
+            apenas o nível em memória é usado.
+        max_entries (int, optional): Número máximo de respostas em memória. Padrão: 1000.
+        ttl_seconds (float, optional): Tempo de vida de uma resposta. Padrão: 86400 (1 dia).
+        writer (HistoryWriter, optional): Escritor em segundo plano. Quando informado, as respostas são
+            gravadas no SQLite fora do caminho da resposta.
+        evict_every (int, optional): Número de respostas guardadas entre as remoções das respostas
+            expiradas (sem elas, a tabela do SQLite cresceria indefinidamente). Padrão: 1000.
+    """
+
+    def __init__(self, connection=None, max_entries=1000, ttl_seconds=86400, writer=None, evict_every=1000):
+        """Inicializa o cache de respostas."""
+        self.connection = connection
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.writer = writer
+        self.evict_every = evict_every
+
+        self._entries = OrderedDict()  # Nível em memória: chave -> (instante de expiração, resposta)
+        self._lock = threading.Lock()
+
+        # Estatísticas de uso do cache
+        self._memory_hits = 0
+        self._database_hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._expirations = 0
+
+    @staticmethod
+    def make_key(persona_hash, model_name, temperature, prompt, history=()):
+        """
+        Gera a chave do cache para uma mensagem.
+
+        Args:
+            persona_hash (str): Hash que identifica a versão da persona.
+            model_name (str): Nome do modelo.
+            temperature (float): Temperatura do modelo.
+            prompt (str): Mensagem do usuário (normalizada por normalize_prompt).
+            history (iterable, optional): Janela de histórico relevante, como tuplas (role, message).
+
+        Returns:
+            str: Chave do cache.
+        """
+        parts = [persona_hash, model_name, temperature, normalize_prompt(prompt), [list(turn) for turn in history]]
+        serialized = json.dumps(parts, ensure_ascii=False)
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Retorna a resposta em cache para a chave, consultando a memória e, em seguida, o SQLite.
+
+        Args:
+            key (str): Chave gerada por make_key.
+
+        Returns:
+            str: Resposta em cache, ou None se não houver uma resposta válida.
+        """
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, response = entry
+                if expires_at > now:
+                    self._memory_hits += 1
+                    self._entries.move_to_end(key)  # Marca a resposta como a mais recente
+                    return response
+                del self._entries[key]  # Resposta expirada
+                self._expirations += 1
+
+        if self.connection:
+            rows = self.connection.query(
+                "SELECT response, expires_at FROM response_cache WHERE cache_key = ? AND expires_at > ?",
+                (key, now),
+            )
+            if rows:
+                response, expires_at = rows[0]
+                with self._lock:
+                    self._database_hits += 1
+                    self._remember(key, expires_at, response)  # Promove a resposta para a memória
+                return response
+
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def put(self, key, response, model_name=""):
+        """
+        Guarda uma resposta no cache.
+
+        Args:
+            key (str): Chave gerada por make_key.
+            response (str): Resposta completa do modelo.
+            model_name (str, optional): Nome do modelo, guardado para consulta. Padrão: "".
+        """
+        if not response:
+            return  # Respostas vazias (ex.: interrompidas) não são guardadas
+
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, expires_at, response)
+            self._stores += 1
+            evict = self.evict_every and self._stores % self.evict_every == 0
+
+        if self.connection:
+            query = "INSERT OR REPLACE INTO response_cache (cache_key, response, model_name, expires_at) VALUES (?, ?, ?, ?)"
+            params = (key, response, model_name, expires_at)
+            if self.writer:
+                self.writer.submit(query, params)  # Gravada em lote pela thread de escrita
+            else:
+                self.connection.execute(query, params)
+
+        if evict:
+            self.evict_expired()
+
+    def evict_expired(self):
+        """Remove as respostas expiradas da memória e do SQLite."""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]
+            for key in expired:
+                del self._entries[key]
+            self._expirations += len(expired)
+
+        if self.connection:
+            query, params = "DELETE FROM response_cache WHERE expires_at <= ?", (now,)
+            if self.writer:
+                self.writer.submit(query, params)
+            else:
+                self.connection.execute(query, params)
+
+    def stats(self):
+        """Retorna estatísticas de acertos e falhas do cache."""
+        with self._lock:
+            hits = self._memory_hits + self._database_hits
+            lookups = hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "memory_hits": self._memory_hits,
+                "database_hits": self._database_hits,
+                "misses": self._misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "stores": self._stores,
+                "expirations": self._expirations,
+            }
+
+    def _remember(self, key, expires_at, response):
+        """Guarda a resposta no nível em memória. Deve ser chamado com o lock."""
+        self._entries[key] = (expires_at, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)  # Remove a resposta usada há mais tempo
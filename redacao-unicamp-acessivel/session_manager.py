@@ -0,0 +1,326 @@
+import json  # Importa o módulo json para gravar o contexto compacto das sessões
+import time  # Importa o módulo time para controlar a expiração das sessões
+import uuid  # Importa o módulo uuid para gerar chaves de sessão únicas
+import threading  # Importa o módulo threading para os locks do pool e de cada sessão
+from collections import OrderedDict  # Importa OrderedDict para implementar o pool LRU
+
+# Chave usada para guardar a identificação da sessão no st.session_state
+SESSION_KEY_NAME = "chave_da_sessao"
+
+# Parâmetro da URL com o token estável da sessão, usado para retomá-la após uma reconexão (opcional)
+SESSION_TOKEN_PARAM = "sessao"
+
+# Chave do st.session_state que indica que a sessão foi retomada pelo token da URL nesta conexão
+SESSION_RESUMED_NAME = "sessao_retomada_pela_url"
+
+
+def _is_valid_token(token):
+    """Verifica se o token recebido na URL tem o formato de uma chave de sessão."""
+    try:
+        return str(uuid.UUID(token)) == token
+    except (TypeError, ValueError, AttributeError):
+        return False
+
+
+def get_session_key(session_state, query_params=None):
+    """
+    Obtem (ou cria) a chave que identifica a sessão do usuário.
+
+    Quando query_params é informado, a chave também é mantida na URL (parâmetro "sessao"): ao
+    recarregar a página ou reconectar, o usuário volta à mesma sessão. Quem tem o link tem acesso à
+    sessão: a retomada pela URL deve ser opcional, e o modelo da sessão retomada não deve ser
+    reaproveitado (veja resumed_from_url).
+
+    Args:
+        session_state (MutableMapping): Estado da sessão do Streamlit (st.session_state) ou
+            qualquer dicionário equivalente.
+        query_params (MutableMapping, optional): Parâmetros da URL (st.query_params).
+
+    Returns:
+        str: Chave única da sessão do usuário.
+    """
+    if SESSION_KEY_NAME not in session_state:
+        token = query_params.get(SESSION_TOKEN_PARAM) if query_params is not None else None
+        if _is_valid_token(token):
+            session_state[SESSION_KEY_NAME] = token  # Retoma a sessão indicada na URL
+            session_state[SESSION_RESUMED_NAME] = True
+        else:
+            session_state[SESSION_KEY_NAME] = str(uuid.uuid4())  # Gera uma nova chave para a aba do navegador
+
+    session_key = session_state[SESSION_KEY_NAME]
+    if query_params is not None and query_params.get(SESSION_TOKEN_PARAM) != session_key:
+        query_params[SESSION_TOKEN_PARAM] = session_key
+    return session_key
+
+
+def resumed_from_url(session_state):
+    """
+    Verifica (uma única vez por conexão) se a sessão foi retomada pelo token da URL.
+
+    Args:
+        session_state (MutableMapping): Estado da sessão do Streamlit (st.session_state).
+
+    Returns:
+        bool: True na primeira chamada após a retomada pela URL.
+    """
+    return bool(session_state.pop(SESSION_RESUMED_NAME, False))
+
+
+class _SessionEntry:
+    """Entrada do pool: a sessão de chat, seu lock e o instante do último acesso."""
+
+    __slots__ = ("chat_session", "lock", "last_access")
+
+    def __init__(self, chat_session):
+        self.chat_session = chat_session
+        self.lock = threading.Lock()  # Lock exclusivo da sessão (serializa os envios de um mesmo usuário)
+        self.last_access = time.monotonic()
+
+
+class SessionManager:
+    """
+    Gerencia um pool limitado (LRU + TTL) de sessões de chat, uma por usuário.
+
+    Cada usuário possui sua própria ChatSession (e seu próprio LLMBaseModel), protegida por um
+    lock exclusivo. Quando o pool atinge o tamanho máximo, ou quando uma sessão fica inativa por
+    mais que o TTL, ela é removida da memória e seu estado é persistido no SQLite, de onde é
+    restaurado caso o usuário volte. O estado também pode ser gravado a cada turno (save_state),
+    para que a sessão sobreviva ao reinício do servidor.
+
+    Args:
+        session_factory (callable): Função sem argumentos que cria uma nova ChatSession.
+        connection (SQLiteConnection, optional): Conexão usada para persistir o estado das sessões.
+        max_sessions (int, optional): Número máximo de sessões mantidas em memória. Padrão: 1000.
+        ttl_seconds (float, optional): Tempo máximo de inatividade de uma sessão. Padrão: 3600.
+        writer (HistoryWriter, optional): Escritor em segundo plano. Quando informado, o estado das
+            sessões é gravado fora do caminho da resposta.
+        eviction_interval (float, optional): Intervalo (em segundos) entre as remoções periódicas das
+            sessões expiradas, em segundo plano. Padrão: None (as sessões expiradas só são removidas
+            quando uma nova sessão entra no pool).
+        state_retention_days (float, optional): Dias após os quais o estado gravado de uma sessão é
+            excluído pelas remoções periódicas. Padrão: None (o estado é mantido).
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        connection=None,
+        max_sessions=1000,
+        ttl_seconds=3600,
+        writer=None,
+        eviction_interval=None,
+        state_retention_days=None,
+    ):
+        """Inicializa o gerenciador de sessões."""
+        self.session_factory = session_factory
+        self.connection = connection
+        self.writer = writer
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.eviction_interval = eviction_interval
+        self.state_retention_days = state_retention_days
+
+        self._sessions = OrderedDict()  # Pool LRU: chave da sessão -> _SessionEntry
+        self._pool_lock = threading.Lock()  # Protege apenas a estrutura do pool (operações rápidas)
+
+        # Contadores para acompanhar o comportamento do pool
+        self._hits = 0
+        self._misses = 0
+        self._restored = 0
+        self._evictions = 0
+        self._pruned_states = 0
+        self.last_error = None
+
+        # Remoção periódica das sessões expiradas, em segundo plano
+        self._stop = threading.Event()
+        self._eviction_thread = None
+        if eviction_interval:
+            self._eviction_thread = threading.Thread(target=self._run_eviction, name="session-eviction", daemon=True)
+            self._eviction_thread.start()
+
+    def get_session(self, session_key):
+        """
+        Retorna a sessão de chat associada à chave, criando-a (ou restaurando-a) se necessário.
+
+        Args:
+            session_key (str): Chave da sessão do usuário (veja get_session_key).
+
+        Returns:
+            ChatSession: A sessão de chat exclusiva do usuário.
+        """
+        return self._get_entry(session_key).chat_session
+
+    def _get_entry(self, session_key):
+        """Retorna a entrada do pool da sessão, criando-a (ou restaurando-a) se necessário."""
+        with self._pool_lock:
+            entry = self._sessions.get(session_key)
+            if entry is not None:
+                self._hits += 1
+                entry.last_access = time.monotonic()
+                self._sessions.move_to_end(session_key)  # Marca a sessão como a mais recente
+                return entry
+            self._misses += 1
+
+        # A criação da sessão (leitura da persona, restauração) acontece fora do lock do pool,
+        # para que a chegada de um novo usuário não bloqueie os demais
+        chat_session = self.session_factory()
+        self._restore_state(session_key, chat_session)
+
+        with self._pool_lock:
+            # Outra thread pode ter criado a mesma sessão enquanto esta estava sendo construída
+            entry = self._sessions.get(session_key)
+            if entry is None:
+                entry = _SessionEntry(chat_session)
+                self._sessions[session_key] = entry
+            entry.last_access = time.monotonic()
+            self._sessions.move_to_end(session_key)
+            evicted = self._collect_evictions()
+
+        # Persiste o estado das sessões removidas sem segurar o lock do pool
+        for evicted_key, evicted_entry in evicted:
+            self._persist_state(evicted_key, evicted_entry.chat_session)
+
+        return entry
+
+    def get_session_and_lock(self, session_key):
+        """
+        Retorna a sessão de chat e o seu lock exclusivo, usado para serializar os envios de um mesmo usuário.
+
+        A sessão e o lock vêm da mesma entrada do pool: se a entrada for removida por outra thread (TTL
+        ou limite do pool) e recriada, quem já obteve a sessão continua usando o lock dela, e não o de
+        uma nova sessão com a mesma chave.
+
+        Args:
+            session_key (str): Chave da sessão do usuário.
+
+        Returns:
+            tuple: (ChatSession, threading.Lock).
+        """
+        entry = self._get_entry(session_key)
+        return entry.chat_session, entry.lock
+
+    def save_state(self, session_key):
+        """
+        Grava o estado da sessão (ID, modelo e contexto compacto), para que ela possa ser retomada.
+
+        Args:
+            session_key (str): Chave da sessão do usuário.
+        """
+        with self._pool_lock:
+            entry = self._sessions.get(session_key)
+        if entry is not None:
+            self._persist_state(session_key, entry.chat_session)
+
+    def evict_expired(self):
+        """Remove do pool as sessões inativas há mais tempo que o TTL, persistindo seu estado."""
+        with self._pool_lock:
+            evicted = self._collect_evictions()
+
+        for evicted_key, evicted_entry in evicted:
+            self._persist_state(evicted_key, evicted_entry.chat_session)
+
+    def prune_state(self):
+        """Exclui o estado gravado das sessões sem atividade há mais de state_retention_days dias."""
+        if not self.connection or self.state_retention_days is None:
+            return
+
+        query = "DELETE FROM session_state WHERE timestamp < datetime('now', ?)"
+        params = (f"-{self.state_retention_days} days",)
+        if self.writer:
+            self.writer.submit(query, params)
+        else:
+            self.connection.execute(query, params)
+        with self._pool_lock:
+            self._pruned_states += 1
+
+    def stop(self):
+        """Interrompe a remoção periódica das sessões expiradas."""
+        self._stop.set()
+        if self._eviction_thread is not None:
+            self._eviction_thread.join()
+            self._eviction_thread = None
+
+    def _run_eviction(self):
+        """Remove as sessões expiradas e o estado antigo a cada eviction_interval segundos, até stop."""
+        while not self._stop.wait(self.eviction_interval):
+            try:
+                self.evict_expired()
+                self.prune_state()
+            except Exception as e:
+                # Uma falha não interrompe as remoções; a próxima execução tenta novamente
+                self.last_error = e
+
+    def stats(self):
+        """Retorna estatísticas de uso do pool de sessões."""
+        with self._pool_lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "hits": self._hits,
+                "misses": self._misses,
+                "restored": self._restored,
+                "evictions": self._evictions,
+                "state_prunes": self._pruned_states,
+            }
+
+    def _collect_evictions(self):
+        """Remove do pool as sessões expiradas ou excedentes. Deve ser chamado com o lock do pool."""
+        now = time.monotonic()
+        evicted = []
+
+        # Percorre as sessões da menos recente para a mais recente
+        for key in list(self._sessions):
+            entry = self._sessions[key]
+            expired = now - entry.last_access > self.ttl_seconds
+            overflow = len(self._sessions) > self.max_sessions
+
+            if not expired and not overflow:
+                break  # As demais sessões são mais recentes e o pool está dentro do limite
+
+            # Sessões com uma resposta em andamento não são removidas
+            if entry.lock.locked():
+                continue
+
+            del self._sessions[key]
+            evicted.append((key, entry))
+
+        self._evictions += len(evicted)
+        return evicted
+
+    def _persist_state(self, session_key, chat_session):
+        """Salva no SQLite o estado necessário para restaurar a sessão."""
+        if not self.connection:
+            return
+
+        query = "INSERT OR REPLACE INTO session_state (session_key, session_id, model_name, persona_path, context_state) VALUES (?, ?, ?, ?, ?)"
+        params = (
+            session_key,
+            chat_session.session_id,
+            chat_session.model_name,
+            chat_session.persona_path,
+            json.dumps(chat_session.get_context_snapshot(), ensure_ascii=False),
+        )
+
+        if self.writer:
+            self.writer.submit(query, params)  # Gravada em lote pela thread de escrita
+        else:
+            self.connection.execute(query, params)
+
+    def _restore_state(self, session_key, chat_session):
+        """Restaura o estado de uma sessão removida anteriormente do pool, se existir."""
+        if not self.connection:
+            return
+
+        # Uma única leitura; o histórico só é lido quando for exibido ou enviado ao modelo
+        rows = self.connection.query(
+            "SELECT session_id, model_name, context_state FROM session_state WHERE session_key = ?",
+            (session_key,),
+        )
+        if rows:
+            session_id, model_name, context_state = rows[0]
+
+            # O modelo não é restaurado (a chave de API não é persistida), apenas a conversa, que é
+            # entregue ao próximo modelo junto com a primeira nova mensagem
+            chat_session.restore(session_id, model_name, json.loads(context_state) if context_state else None)
+            with self._pool_lock:
+                self._restored += 1
@@ -1,7 +1,161 @@
 import streamlit as st  # Importa o módulo Streamlit para a interface web
 from streamlit.connections import ExperimentalBaseConnection  # Importa a classe base para conexões personalizadas do Streamlit
 import sqlite3  # Importa o módulo SQLite3 para interagir com bancos de dados SQLite
-import pandas as pd  # Importa o módulo Pandas para trabalhar com DataFrames
+import time  # Importa o módulo time para medir as esperas por conexões
+import queue  # Importa o módulo queue para o pool de conexões de leitura
+import threading  # Importa o módulo threading para serializar as escritas
+import urllib.parse  # Importa urllib.parse para montar a URI das conexões somente leitura
+from contextlib import contextmanager  # Importa contextmanager para emprestar conexões do pool
+from metrics import metrics  # Importa o registro de métricas do processo
+
+# Migrações do esquema do banco de dados, aplicadas em ordem. A versão já aplicada fica registrada
+# em PRAGMA user_version; para alterar o esquema, acrescente uma nova migração ao final da lista.
+MIGRATIONS = [
+    # 1: Histórico de mensagens das sessões de chat
+    """
+    CREATE TABLE IF NOT EXISTS chat_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT NOT NULL,
+        role TEXT NOT NULL,
+        message TEXT NOT NULL,
+        model_name TEXT NOT NULL,
+        persona_name TEXT NOT NULL,
+        temperature REAL NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    # 2: Estado das sessões removidas do pool de sessões
+    """
+    CREATE TABLE IF NOT EXISTS session_state (
+        session_key TEXT PRIMARY KEY,
+        session_id TEXT NOT NULL,
+        model_name TEXT NOT NULL,
+        persona_path TEXT NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    # 3: Índice para ler o histórico de uma sessão, em ordem, sem percorrer a tabela inteira
+    """
+    CREATE INDEX IF NOT EXISTS idx_chat_history_session_id ON chat_history (session_id, id);
+    """,
+    # 4: Nível persistente do cache de respostas (expires_at em segundos desde a época Unix)
+    """
+    CREATE TABLE IF NOT EXISTS response_cache (
+        cache_key TEXT PRIMARY KEY,
+        response TEXT NOT NULL,
+        model_name TEXT NOT NULL,
+        expires_at REAL NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    # 5: Índice para remover as respostas expiradas sem percorrer a tabela inteira
+    """
+    CREATE INDEX IF NOT EXISTS idx_response_cache_expires_at ON response_cache (expires_at);
+    """,
+    # 6: Contexto compacto da conversa (JSON), usado para retomar a sessão sem reenviar o histórico
+    """
+    ALTER TABLE session_state ADD COLUMN context_state TEXT NOT NULL DEFAULT '';
+    """,
+    # 7: Eventos de cada sessão (tempo até o primeiro chunk, duração da resposta etc.), se habilitados
+    """
+    CREATE TABLE IF NOT EXISTS session_traces (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT NOT NULL,
+        event TEXT NOT NULL,
+        duration_ms REAL NOT NULL,
+        model_name TEXT NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    # 8: Índice para ler os eventos de uma sessão
+    """
+    CREATE INDEX IF NOT EXISTS idx_session_traces_session_id ON session_traces (session_id, id);
+    """,
+    # 9: Resposta parcial do stream em andamento de cada sessão (recuperada se o stream for interrompido)
+    """
+    CREATE TABLE IF NOT EXISTS stream_checkpoints (
+        session_id TEXT PRIMARY KEY,
+        message TEXT NOT NULL,
+        model_name TEXT NOT NULL,
+        temperature REAL NOT NULL,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    # 10: Resultados das avaliações em lote (batch_evaluation.py), usados para retomar execuções interrompidas
+    """
+    CREATE TABLE IF NOT EXISTS batch_evaluations (
+        run_id TEXT NOT NULL,
+        essay_id TEXT NOT NULL,
+        status TEXT NOT NULL,
+        proposal TEXT NOT NULL,
+        model_name TEXT NOT NULL,
+        response TEXT NOT NULL,
+        error TEXT NOT NULL,
+        duration_ms REAL NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (run_id, essay_id)
+    );
+    """,
+    # 11: Tokens e latência de cada turno (token_accounting.py)
+    """
+    CREATE TABLE IF NOT EXISTS turn_usage (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT NOT NULL,
+        model_name TEXT NOT NULL,
+        estimated_prompt_tokens INTEGER NOT NULL,
+        prompt_tokens INTEGER NOT NULL,
+        output_tokens INTEGER NOT NULL,
+        usage_source TEXT NOT NULL,
+        cached INTEGER NOT NULL,
+        time_to_first_token_ms REAL NOT NULL,
+        total_latency_ms REAL NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    # 12: Índice para agregar o uso de tokens de uma sessão
+    """
+    CREATE INDEX IF NOT EXISTS idx_turn_usage_session_id ON turn_usage (session_id, id);
+    """,
+    # 13: Sessões antigas arquivadas, com as mensagens comprimidas (history_maintenance.py)
+    """
+    CREATE TABLE IF NOT EXISTS chat_history_archive (
+        session_id TEXT PRIMARY KEY,
+        messages BLOB NOT NULL,
+        message_count INTEGER NOT NULL,
+        first_timestamp DATETIME NOT NULL,
+        last_timestamp DATETIME NOT NULL,
+        archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    # 14: Índice para encontrar as sessões a arquivar lendo apenas as mensagens antigas (history_maintenance.py)
+    """
+    CREATE INDEX IF NOT EXISTS idx_chat_history_timestamp ON chat_history (timestamp);
+    """,
+]
+
+
+def apply_migrations(connection: sqlite3.Connection) -> int:
+    """
+    Aplica ao banco de dados as migrações ainda não aplicadas.
+
+    Args:
+        connection (sqlite3.Connection): Conexão com o banco de dados.
+
+    Returns:
+        int: Versão do esquema após as migrações.
+    """
+    # BEGIN IMMEDIATE impede que dois processos apliquem a mesma migração ao mesmo tempo
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        for migration in MIGRATIONS[version:]:
+            connection.execute(migration)
+        connection.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    return len(MIGRATIONS)
 
 # Define a classe SQLiteConnection para interagir com bancos de dados SQLite
 class SQLiteConnection(ExperimentalBaseConnection[sqlite3.Connection]):
@@ -10,18 +164,42 @@ class SQLiteConnection(ExperimentalBaseConnection[sqlite3.Connection]):
 
     Esta classe estende a classe ExperimentalBaseConnection do Streamlit e fornece métodos para
     conectar a um banco de dados SQLite3, executar consultas SQL e recuperar resultados como
-    DataFrames do Pandas. Ela não depende de segredos para conexões com bancos de dados locais.
+    listas de tuplas. Ela não depende de segredos para conexões com bancos de dados locais.
+
+    As escritas passam por uma única conexão, serializada por um lock. As leituras usam um pool
+    limitado de conexões somente leitura, que (com o journal em WAL) executam em paralelo entre si e
+    com a escrita em andamento.
     """
 
-    def __init__(self, database: str, **kwargs) -> None:
+    def __init__(self, database: str, synchronous: str = "NORMAL", max_readers: int = 8, **kwargs) -> None:
         """
         Inicializa a classe SQLiteConnection.
 
         Args:
             database (str): Caminho para o arquivo do banco de dados SQLite3.
+            synchronous (str, optional): Modo de sincronização do SQLite. Com o journal em WAL, "NORMAL"
+                só sincroniza o disco nos checkpoints, mantendo a durabilidade contra falhas do processo.
+                Padrão: "NORMAL".
+            max_readers (int, optional): Número máximo de conexões de leitura abertas. Padrão: 8.
             **kwargs: Argumentos adicionais para a conexão.
         """
         self.database = database  # Armazena o caminho do banco de dados
+        self.synchronous = synchronous  # Armazena o modo de sincronização
+        self.max_readers = max_readers  # Armazena o tamanho máximo do pool de leitura
+
+        self._write_lock = threading.Lock()  # Serializa o uso da conexão de escrita
+        self._readers = queue.LifoQueue()  # Conexões de leitura livres (a mais recente é reutilizada primeiro)
+        self._readers_lock = threading.Lock()
+        self._readers_opened = 0
+
+        # Estatísticas do pool
+        self._stats_lock = threading.Lock()
+        self._reads = 0
+        self._writes = 0
+        self._reader_waits = 0
+        self._reader_wait_seconds = 0.0
+        self._write_wait_seconds = 0.0
+
         super().__init__(**kwargs)  # Chama o construtor da classe base
 
     def _connect(self, **kwargs) -> sqlite3.Connection:
@@ -35,11 +213,89 @@ class SQLiteConnection(ExperimentalBaseConnection[sqlite3.Connection]):
             sqlite3.Connection: Objeto de conexão SQLite3.
         """
         # Conecta ao banco de dados SQLite3 usando o caminho do arquivo e os argumentos adicionais
-        return sqlite3.connect(database=self.database, **kwargs)
+        connection = sqlite3.connect(database=self.database, **kwargs)
+
+        # Permite devolver ao sistema as páginas liberadas, aos poucos (só tem efeito em um banco novo; os
+        # bancos existentes são convertidos pela manutenção do histórico)
+        connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+
+        # WAL permite leituras simultâneas a uma escrita, e o modo de sincronização reduz os fsyncs
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(f"PRAGMA synchronous={self.synchronous}")
+
+        # Garante que o esquema esteja atualizado antes de qualquer consulta
+        apply_migrations(connection)
+        return connection
+
+    def _open_reader(self) -> sqlite3.Connection:
+        """Abre uma conexão somente leitura com o banco de dados."""
+        return sqlite3.connect(
+            f"file:{urllib.parse.quote(self.database)}?mode=ro",
+            uri=True,
+            check_same_thread=False,  # A conexão é emprestada a threads diferentes, uma de cada vez
+        )
+
+    @contextmanager
+    def _reader(self):
+        """Empresta uma conexão de leitura do pool, abrindo uma nova se o pool ainda não estiver cheio."""
+        # Bancos em memória não são compartilhados entre conexões: as leituras usam a conexão de escrita
+        if self.database in ("", ":memory:"):
+            with self._writer() as connection:
+                yield connection
+            return
+
+        try:
+            connection = self._readers.get_nowait()
+        except queue.Empty:
+            with self._readers_lock:
+                can_open = self._readers_opened < self.max_readers
+                if can_open:
+                    self._readers_opened += 1
+
+            if can_open:
+                connection = self._open_reader()
+            else:
+                # Pool cheio: espera uma conexão ser devolvida
+                start = time.perf_counter()
+                connection = self._readers.get()
+                with self._stats_lock:
+                    self._reader_waits += 1
+                    self._reader_wait_seconds += time.perf_counter() - start
+
+        try:
+            yield connection
+        finally:
+            self._readers.put(connection)  # Devolve a conexão ao pool
+            with self._stats_lock:
+                self._reads += 1
+
+    @contextmanager
+    def _writer(self):
+        """Obtem acesso exclusivo à conexão de escrita."""
+        start = time.perf_counter()
+        with self._write_lock:
+            with self._stats_lock:
+                self._write_wait_seconds += time.perf_counter() - start
+            yield self._instance
+
+    def stats(self) -> dict:
+        """Retorna estatísticas do pool de conexões."""
+        with self._stats_lock:
+            return {
+                "reads": self._reads,
+                "writes": self._writes,
+                "readers_opened": self._readers_opened,
+                "readers_idle": self._readers.qsize(),
+                "reader_waits": self._reader_waits,
+                "reader_wait_seconds": self._reader_wait_seconds,
+                "write_wait_seconds": self._write_wait_seconds,
+            }
 
     def cursor(self) -> sqlite3.Cursor:
         """
-        Retorna um cursor para a conexão.
+        Retorna um cursor para a conexão de escrita.
+
+        Prefira execute, executemany e query, que coordenam o acesso às conexões entre as threads.
 
         Returns:
             sqlite3.Cursor: Objeto de cursor SQLite3.
@@ -54,32 +310,95 @@ class SQLiteConnection(ExperimentalBaseConnection[sqlite3.Connection]):
             query (str): Consulta SQL a ser executada.
             *args: Parâmetros para a consulta.
         """
-        cursor = self.cursor()  # Obtem um cursor para a conexão
+        with metrics.timer("sqlite_query_seconds", operation="execute"), self._writer() as connection:
+            cursor = connection.cursor()  # Obtem um cursor para a conexão de escrita
+
+            cursor.execute(query, *args)  # Executa a consulta com os parâmetros fornecidos
+            connection.commit()  # Confirma a transação no banco de dados
+
+        with self._stats_lock:
+            self._writes += 1
+
+    def executemany(self, query: str, params_list: list) -> None:
+        """
+        Executa uma consulta SQL para cada conjunto de parâmetros, em uma única transação.
+
+        Args:
+            query (str): Consulta SQL a ser executada.
+            params_list (list): Lista de parâmetros, um conjunto para cada execução da consulta.
+        """
+        with metrics.timer("sqlite_query_seconds", operation="executemany"), self._writer() as connection:
+            cursor = connection.cursor()  # Obtem um cursor para a conexão de escrita
+
+            cursor.executemany(query, params_list)  # Executa a consulta para todos os parâmetros
+            connection.commit()  # Confirma a transação (um único commit para todo o grupo)
+
+        with self._stats_lock:
+            self._writes += 1
+
+    @contextmanager
+    def transaction(self):
+        """
+        Executa várias instruções em uma única transação na conexão de escrita.
+
+        A transação é confirmada ao fim do bloco, ou desfeita se ocorrer uma exceção. As demais escritas
+        (inclusive as do HistoryWriter) esperam o fim do bloco.
+
+        Yields:
+            sqlite3.Cursor: Cursor da conexão de escrita.
+        """
+        with metrics.timer("sqlite_query_seconds", operation="transaction"), self._writer() as connection:
+            try:
+                cursor = connection.cursor()
+                cursor.execute("BEGIN IMMEDIATE")  # As leituras do bloco também fazem parte da transação
+                yield cursor
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+
+        with self._stats_lock:
+            self._writes += 1
+
+    def execute_script(self, script: str) -> None:
+        """
+        Executa um script SQL na conexão de escrita, até o fim de cada instrução.
+
+        Use para instruções de manutenção que fora de um script executariam apenas o primeiro passo
+        (ex.: PRAGMA incremental_vacuum) ou que não podem ocorrer dentro de uma transação (ex.: VACUUM).
+
+        Args:
+            script (str): Instruções SQL separadas por ponto e vírgula.
+        """
+        with metrics.timer("sqlite_query_seconds", operation="script"), self._writer() as connection:
+            connection.executescript(script)
 
-        cursor.execute(query, *args)  # Executa a consulta com os parâmetros fornecidos
-        self._instance.commit()  # Confirma a transação no banco de dados
+        with self._stats_lock:
+            self._writes += 1
 
-    def query(self, query: str, ttl: int = 3600) -> pd.DataFrame:
+    def query(self, query: str, params: tuple = (), ttl: int = 3600) -> list:
         """
-        Executa uma consulta SQL no banco de dados e retorna os resultados como um DataFrame do Pandas.
+        Executa uma consulta SQL no banco de dados e retorna os resultados como uma lista de tuplas.
 
         Args:
             query (str): Consulta SQL a ser executada.
+            params (tuple, optional): Parâmetros para a consulta. Padrão: ().
             ttl (int, optional): Tempo de vida do cache (em segundos). Padrão: 3600 (1 hora).
             **kwargs: Argumentos adicionais para a consulta.
 
         Returns:
-            pd.DataFrame: DataFrame do Pandas com os resultados da consulta.
+            list: Lista de tuplas com os resultados da consulta.
         """
 
         # Função interna para executar a consulta e retornar os resultados
-        def _query(query: str) -> pd.DataFrame:
-            cursor = self.cursor()  # Obtem um cursor para a conexão
-            query_result = cursor.execute(query)  # Executa a consulta
-            return query_result.fetchall()  # Retorna os resultados como uma lista de tuplas
+        def _query(query: str, params: tuple) -> list:
+            with metrics.timer("sqlite_query_seconds", operation="query"), self._reader() as connection:
+                cursor = connection.cursor()  # Obtem um cursor para uma conexão de leitura do pool
+                query_result = cursor.execute(query, params)  # Executa a consulta com os parâmetros fornecidos
+                return query_result.fetchall()  # Retorna os resultados como uma lista de tuplas
 
-        # Retorna os resultados da consulta como um DataFrame do Pandas
-        return _query(query)
+        # Retorna os resultados da consulta como uma lista de tuplas
+        return _query(query, params)
 
 # Define uma função para obter a sessão do banco de dados, usando o cache do Streamlit
 @st.cache_resource
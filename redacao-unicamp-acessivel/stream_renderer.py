@@ -0,0 +1,116 @@
+import time  # Importa o módulo time para medir o intervalo entre as renderizações
+
+# Cursor exibido no fim da resposta enquanto o stream está em andamento
+STREAM_CURSOR = "▌"
+
+
+class StreamBuffer:
+    """
+    Acumula os chunks de uma resposta em stream.
+
+    Os chunks são guardados em uma lista e unidos apenas quando o texto é lido (e a união é
+    reaproveitada na leitura seguinte), evitando a concatenação quadrática de strings com += em
+    respostas longas.
+    """
+
+    def __init__(self):
+        """Inicializa o buffer vazio."""
+        self._parts = []
+        self._length = 0
+
+    def append(self, chunk):
+        """
+        Acrescenta um chunk ao buffer.
+
+        Args:
+            chunk (str): Parte da resposta.
+        """
+        if chunk:
+            self._parts.append(chunk)
+            self._length += len(chunk)
+
+    def text(self):
+        """
+        Retorna o texto acumulado até agora.
+
+        Returns:
+            str: Texto da resposta.
+        """
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]  # A próxima leitura une apenas os chunks novos
+        return self._parts[0] if self._parts else ""
+
+    def __len__(self):
+        """Retorna o número de caracteres acumulados."""
+        return self._length
+
+    def __bool__(self):
+        """Indica se algum chunk já foi recebido."""
+        return self._length > 0
+
+
+class StreamRenderer:
+    """
+    Exibe uma resposta em stream em um elemento do Streamlit (ex.: st.empty()), no lugar do st.write_stream.
+
+    O st.write_stream renderiza o Markdown da resposta inteira a cada chunk. Aqui, o texto é acumulado
+    em um StreamBuffer e renderizado no máximo uma vez a cada min_interval segundos (ou quando
+    max_pending_chars caracteres aguardam renderização); a última renderização sempre exibe a
+    resposta completa. Combinado com o agrupamento de chunks do AsyncStreamBridge, o número de
+    renderizações deixa de depender do tamanho dos chunks do modelo.
+
+    Args:
+        placeholder: Elemento com o método markdown (ex.: st.empty()).
+        min_interval (float, optional): Intervalo mínimo (em segundos) entre renderizações. Padrão: 0.1.
+        max_pending_chars (int, optional): Caracteres que forçam uma renderização antes do intervalo.
+            Padrão: 2000.
+        cursor (str, optional): Texto exibido no fim da resposta durante o stream. Padrão: STREAM_CURSOR.
+    """
+
+    def __init__(self, placeholder, min_interval=0.1, max_pending_chars=2000, cursor=STREAM_CURSOR):
+        """Inicializa o renderizador."""
+        self.placeholder = placeholder
+        self.min_interval = min_interval
+        self.max_pending_chars = max_pending_chars
+        self.cursor = cursor
+
+        self.chunks = 0  # Número de chunks recebidos
+        self.renders = 0  # Número de renderizações feitas
+
+    def render(self, chunks):
+        """
+        Consome o stream, exibindo a resposta à medida que ela chega.
+
+        Args:
+            chunks (iterable): Partes da resposta (ex.: o gerador retornado pelo AsyncStreamBridge).
+
+        Returns:
+            str: Resposta completa (ou a parte recebida, se o stream for interrompido por uma exceção).
+        """
+        buffer = StreamBuffer()
+        rendered_length = 0
+        last_render = 0.0
+        try:
+            for chunk in chunks:
+                buffer.append(chunk)
+                self.chunks += 1
+
+                # Renderiza apenas quando o intervalo passou ou há muito texto aguardando
+                now = time.monotonic()
+                if now - last_render >= self.min_interval or len(buffer) - rendered_length >= self.max_pending_chars:
+                    self._render(buffer.text() + self.cursor)
+                    rendered_length = len(buffer)
+                    last_render = now
+        finally:
+            # Exibe o texto completo (ou parcial) sem o cursor
+            self._render(buffer.text())
+        return buffer.text()
+
+    def _render(self, text):
+        """Renderiza o texto no elemento."""
+        self.placeholder.markdown(text)
+        self.renders += 1
+
+    def stats(self):
+        """Retorna o número de chunks recebidos e de renderizações feitas."""
+        return {"chunks": self.chunks, "renders": self.renders}
@@ -0,0 +1,241 @@
+from persona_compiler import estimate_tokens  # Importa o estimador local de tokens
+from metrics import metrics  # Importa o registro de métricas do processo
+
+# Limites de tokens do prompt por modelo: (máximo aceito pelo modelo, tamanho acima do qual o tempo até
+# o primeiro token cresce de forma perceptível para quem está conversando)
+MODEL_TOKEN_LIMITS = {
+    "gemini-1.5-flash": (1_048_576, 32_000),
+    "gemini-1.5-pro": (2_097_152, 32_000),
+    "gemini-1.5-pro-exp-0801": (2_097_152, 32_000),
+    "mock": (None, None),  # Modelo simulado (testes de carga): sem limites
+}
+
+# Limites usados para os demais modelos (ex.: modelos locais do Ollama, cujo máximo depende do modelo e
+# da configuração do servidor, e por isso não é verificado)
+DEFAULT_TOKEN_LIMITS = (None, 8_000)
+
+# Consulta usada para gravar o uso de cada turno
+USAGE_QUERY = (
+    "INSERT INTO turn_usage (session_id, model_name, estimated_prompt_tokens, prompt_tokens, output_tokens, "
+    "usage_source, cached, time_to_first_token_ms, total_latency_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+# Colunas agregadas por sessão e por modelo
+_AGGREGATE_COLUMNS = """
+    COUNT(*),
+    SUM(prompt_tokens),
+    SUM(output_tokens),
+    SUM(cached),
+    AVG(time_to_first_token_ms),
+    MAX(time_to_first_token_ms),
+    AVG(total_latency_ms),
+    MAX(total_latency_ms)
+"""
+_AGGREGATE_FIELDS = (
+    "turns",
+    "prompt_tokens",
+    "output_tokens",
+    "cached_turns",
+    "avg_time_to_first_token_ms",
+    "max_time_to_first_token_ms",
+    "avg_latency_ms",
+    "max_latency_ms",
+)
+
+
+def get_token_limits(model_name):
+    """
+    Retorna os limites de tokens do prompt para o modelo.
+
+    Args:
+        model_name (str): Nome do modelo.
+
+    Returns:
+        tuple: (máximo aceito pelo modelo, tamanho acima do qual a resposta fica perceptivelmente mais
+            lenta); None indica que o limite não é verificado.
+    """
+    return MODEL_TOKEN_LIMITS.get(model_name, DEFAULT_TOKEN_LIMITS)
+
+
+def get_router_token_limits(backend_names):
+    """
+    Retorna os limites de tokens do prompt para um roteador de modelos (ex.: o modelo "auto").
+
+    O roteador passa a mensagem ao modelo seguinte quando um deles falha, então o máximo aceito é o do
+    modelo com o maior limite; a latência esperada é a do modelo preferido (o primeiro da lista).
+
+    Args:
+        backend_names (list): Nomes dos modelos do roteador, do preferido para os mais baratos.
+
+    Returns:
+        tuple: (máximo aceito, tamanho acima do qual a resposta fica perceptivelmente mais lenta), como
+            em get_token_limits.
+    """
+    limits = [get_token_limits(name) for name in backend_names]
+    if not limits:
+        return DEFAULT_TOKEN_LIMITS
+    max_tokens = [limit[0] for limit in limits]
+    return (None if None in max_tokens else max(max_tokens), limits[0][1])
+
+
+def preflight(model_name, prompt_tokens, backend_names=None):
+    """
+    Verifica, antes do envio, se o prompt cabe no modelo.
+
+    Args:
+        model_name (str): Nome do modelo.
+        prompt_tokens (int): Estimativa de tokens do prompt (veja estimate_tokens).
+        backend_names (list, optional): Nomes dos modelos, se model_name é um roteador (veja
+            get_router_token_limits). Padrão: None.
+
+    Returns:
+        str: Aviso se o prompt deve deixar a resposta perceptivelmente mais lenta, ou None.
+
+    Raises:
+        ValueError: Se o prompt excede o máximo aceito pelo modelo.
+    """
+    if backend_names:
+        max_tokens, fast_tokens = get_router_token_limits(backend_names)
+    else:
+        max_tokens, fast_tokens = get_token_limits(model_name)
+    if max_tokens is not None and prompt_tokens > max_tokens:
+        metrics.inc("prompt_preflight_rejections_total", model=model_name)
+        raise ValueError(
+            f"O prompt (~{prompt_tokens} tokens) excede o limite do modelo {model_name} ({max_tokens} tokens)."
+        )
+    if fast_tokens is not None and prompt_tokens > fast_tokens:
+        metrics.inc("prompt_preflight_warnings_total", model=model_name)
+        return (
+            f"A mensagem (~{prompt_tokens} tokens com a persona e o contexto) é longa para o modelo "
+            f"{model_name}; a resposta pode demorar mais para começar."
+        )
+    return None
+
+
+class TokenAccounting:
+    """
+    Registro do uso de tokens e da latência de cada turno, na tabela turn_usage.
+
+    Cada turno guarda a estimativa local do prompt (feita antes do envio), os tokens de prompt e de
+    resposta informados pelo provedor (ou estimados localmente, quando o modelo não os informa), o
+    tempo até o primeiro token e a latência total. As consultas agregadas mostram quais sessões,
+    modelos e turnos concentram a latência e o custo.
+
+    Args:
+        connection (SQLiteConnection): Conexão com o banco de dados.
+        writer (HistoryWriter, optional): Escritor em segundo plano. Quando informado, os registros são
+            gravados fora do caminho da resposta.
+    """
+
+    def __init__(self, connection, writer=None):
+        """Inicializa o registro."""
+        self.connection = connection
+        self.writer = writer
+
+    def record(
+        self,
+        session_id,
+        model_name,
+        estimated_prompt_tokens,
+        response,
+        usage=None,
+        time_to_first_token=0.0,
+        total_latency=0.0,
+        cached=False,
+    ):
+        """
+        Grava o uso de um turno.
+
+        Args:
+            session_id (str): ID da sessão.
+            model_name (str): Nome do modelo.
+            estimated_prompt_tokens (int): Estimativa local dos tokens do prompt.
+            response (str): Resposta do turno (usada para estimar os tokens da resposta sem usage).
+            usage (dict, optional): Uso informado pelo modelo ({"prompt_tokens", "output_tokens"}). Padrão: None.
+            time_to_first_token (float, optional): Tempo até o primeiro chunk, em segundos. Padrão: 0.0.
+            total_latency (float, optional): Duração total do turno, em segundos. Padrão: 0.0.
+            cached (bool, optional): Indica se a resposta veio do cache de respostas. Padrão: False.
+        """
+        if usage:
+            prompt_tokens, output_tokens, source = usage["prompt_tokens"], usage["output_tokens"], "model"
+        else:
+            prompt_tokens, output_tokens, source = estimated_prompt_tokens, estimate_tokens(response), "estimate"
+        if cached:
+            prompt_tokens, source = 0, "cache"  # O modelo não foi chamado
+
+        metrics.inc("llm_prompt_tokens_total", prompt_tokens, model=model_name)
+        metrics.inc("llm_output_tokens_total", output_tokens, model=model_name)
+
+        params = (
+            session_id,
+            model_name,
+            estimated_prompt_tokens,
+            prompt_tokens,
+            output_tokens,
+            source,
+            int(cached),
+            time_to_first_token * 1000,
+            total_latency * 1000,
+        )
+        if self.writer:
+            self.writer.submit(USAGE_QUERY, params)
+        else:
+            self.connection.execute(USAGE_QUERY, params)
+
+    def _aggregate(self, where, params, group_by):
+        """Executa uma consulta agregada e retorna uma lista de dicionários."""
+        if self.writer:
+            self.writer.flush()  # Inclui os registros ainda na fila do escritor
+        rows = self.connection.query(
+            f"SELECT {group_by}, {_AGGREGATE_COLUMNS} FROM turn_usage {where} GROUP BY {group_by} ORDER BY {group_by}",
+            params,
+        )
+        return [dict(zip((group_by,) + _AGGREGATE_FIELDS, row)) for row in rows]
+
+    def session_usage(self, session_id):
+        """
+        Retorna o uso agregado de uma sessão, por modelo.
+
+        Args:
+            session_id (str): ID da sessão.
+
+        Returns:
+            list: Um dicionário por modelo, com o número de turnos, os tokens e as latências.
+        """
+        return self._aggregate("WHERE session_id = ?", (session_id,), "model_name")
+
+    def model_usage(self, since=None):
+        """
+        Retorna o uso agregado de todas as sessões, por modelo.
+
+        Args:
+            since (str, optional): Considera apenas os turnos a partir desta data (ex.: "2024-08-01"). Padrão: None.
+
+        Returns:
+            list: Um dicionário por modelo, com o número de turnos, os tokens e as latências.
+        """
+        if since:
+            return self._aggregate("WHERE timestamp >= ?", (since,), "model_name")
+        return self._aggregate("", (), "model_name")
+
+    def slowest_turns(self, limit=10, model_name=None):
+        """
+        Retorna os turnos com maior latência total.
+
+        Args:
+            limit (int, optional): Número máximo de turnos. Padrão: 10.
+            model_name (str, optional): Considera apenas os turnos deste modelo. Padrão: None.
+
+        Returns:
+            list: Um dicionário por turno, do mais lento para o mais rápido.
+        """
+        if self.writer:
+            self.writer.flush()
+        where, params = ("WHERE model_name = ?", (model_name, limit)) if model_name else ("", (limit,))
+        rows = self.connection.query(
+            "SELECT session_id, model_name, prompt_tokens, output_tokens, time_to_first_token_ms, total_latency_ms, "
+            f"timestamp FROM turn_usage {where} ORDER BY total_latency_ms DESC LIMIT ?",
+            params,
+        )
+        fields = ("session_id", "model_name", "prompt_tokens", "output_tokens", "time_to_first_token_ms", "total_latency_ms", "timestamp")
+        return [dict(zip(fields, row)) for row in rows]
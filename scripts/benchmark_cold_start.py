@@ -0,0 +1,103 @@
+"""
+Benchmark da inicialização a frio de um processo da plataforma (ex.: uma nova réplica).
+
+Cada medida é feita em um novo processo Python, repetida --runs vezes (mediana):
+    import <módulo>   tempo de importação dos módulos da aplicação, e quais bibliotecas pesadas
+                      (google.generativeai, ollama, pandas) eles carregam
+    first_session     criação da primeira ChatSession e montagem do prefixo da persona, com o
+                      artefato compilado da persona em disco (.cache/personas)
+    first_paint       primeira execução completa do main.py, sem interface (streamlit.testing.AppTest)
+
+Uso (a partir da raiz do repositório):
+    python scripts/benchmark_cold_start.py [--runs 5]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "redacao-unicamp-acessivel")
+
+MODULES = ("sql_connection", "llm_model", "chat_session", "main_dependencies")
+HEAVY_MODULES = ("google.generativeai", "ollama", "pandas")
+
+# Módulos importados pelo main.py, além do próprio Streamlit
+MAIN_DEPENDENCIES = (
+    "import chat_session, llm_model, knowledge_index, proposal_index, session_manager, "
+    "async_stream, history_writer, content_registry, response_cache, sql_connection, metrics"
+)
+
+IMPORT_SNIPPET = """
+import sys, time, json
+sys.path.insert(0, {app_dir!r})
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+FIRST_SESSION_SNIPPET = """
+import sys, time, json
+sys.path.insert(0, {app_dir!r})
+start = time.perf_counter()
+from chat_session import ChatSession
+session = ChatSession("personas/dani_stella/dani_stella.json", None)
+session.get_persona_prefix()
+print(json.dumps({{"seconds": time.perf_counter() - start, "heavy": []}}))
+"""
+
+FIRST_PAINT_SNIPPET = """
+import time, json
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file({main!r}, default_timeout=120)
+app.run()
+print(json.dumps({{"seconds": time.perf_counter() - start, "heavy": []}}))
+"""
+
+
+def run_snippet(snippet):
+    """Executa o trecho em um novo processo e retorna o resultado (ou None se ele falhar)."""
+    result = subprocess.run([sys.executable, "-c", snippet], capture_output=True, text=True)
+    if result.returncode != 0:
+        return None, result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "erro"
+    return json.loads(result.stdout.strip().splitlines()[-1]), None
+
+
+def measure(label, snippet, runs):
+    """Mede o trecho runs vezes e exibe a mediana."""
+    samples = []
+    heavy = []
+    for _ in range(runs):
+        result, error = run_snippet(snippet)
+        if result is None:
+            print(f"{label:>28}: não executado ({error})")
+            return
+        samples.append(result["seconds"] * 1000)
+        heavy = result["heavy"]
+
+    loaded = ", ".join(heavy) if heavy else "nenhuma"
+    print(f"{label:>28}: mediana {statistics.median(samples):8.1f}ms  (bibliotecas pesadas: {loaded})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    for module in MODULES:
+        statement = MAIN_DEPENDENCIES if module == "main_dependencies" else f"import {module}"
+        snippet = IMPORT_SNIPPET.format(app_dir=APP_DIR, statement=statement, heavy=HEAVY_MODULES)
+        measure(f"import {module}", snippet, args.runs)
+
+    # A primeira execução grava o artefato compilado da persona; as seguintes o reaproveitam
+    run_snippet(FIRST_SESSION_SNIPPET.format(app_dir=APP_DIR))
+    measure("first_session", FIRST_SESSION_SNIPPET.format(app_dir=APP_DIR), args.runs)
+
+    measure("first_paint", FIRST_PAINT_SNIPPET.format(main=os.path.join(APP_DIR, "main.py")), args.runs)
+
+
+if __name__ == "__main__":
+    main()
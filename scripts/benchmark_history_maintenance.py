@@ -0,0 +1,96 @@
+"""
+Simulação de uma temporada de vestibular com a manutenção do histórico (HistoryMaintenance).
+
+Cada dia simulado grava novas sessões (com redações e devolutivas longas) no histórico, com o horário
+daquele dia, e executa a manutenção com o dia como instante de referência. Ao fim de cada semana,
+exibe o tamanho do banco de dados, o número de mensagens na tabela chat_history e no arquivo e a
+latência da leitura do histórico de uma sessão recente e de uma sessão arquivada. Com --no-maintenance,
+a mesma temporada é gravada sem a manutenção, para comparação.
+
+Uso (a partir da raiz do repositório):
+    python scripts/benchmark_history_maintenance.py [--days 90] [--sessions-per-day 200]
+        [--messages 12] [--retention-days 14] [--no-maintenance]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import datetime
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "redacao-unicamp-acessivel"))
+
+from sql_connection import SQLiteConnection  # noqa: E402
+from history_store import SQLiteHistoryStore  # noqa: E402
+from history_maintenance import HistoryMaintenance  # noqa: E402
+
+INSERT = (
+    "INSERT INTO chat_history (session_id, role, message, model_name, persona_name, temperature, timestamp) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+WORDS = "redação proposta texto argumento coesão coerência tese parágrafo gênero leitor interlocutor autoria".split()
+
+
+def message(rng, words):
+    """Gera uma mensagem com o número de palavras informado."""
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def read_latency(store, session_id, repeat=20):
+    """Retorna a latência média (em ms) da leitura do histórico de uma sessão."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        store.load(session_id)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=90, help="dias da temporada")
+    parser.add_argument("--sessions-per-day", type=int, default=200, help="sessões novas por dia")
+    parser.add_argument("--messages", type=int, default=12, help="mensagens por sessão")
+    parser.add_argument("--retention-days", type=float, default=14, help="dias até o arquivamento")
+    parser.add_argument("--no-maintenance", action="store_true", help="grava a temporada sem a manutenção")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    season_start = datetime.datetime(2024, 8, 1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        connection = SQLiteConnection(
+            database=os.path.join(directory, "chat_history.db"), connection_name="benchmark", check_same_thread=False
+        )
+        store = SQLiteHistoryStore(connection)
+        maintenance = HistoryMaintenance(connection, retention_days=args.retention_days, max_sessions_per_run=10**6)
+        first_session = None
+
+        for day in range(args.days):
+            timestamp = (season_start + datetime.timedelta(days=day)).strftime("%Y-%m-%d %H:%M:%S")
+            rows = []
+            for number in range(args.sessions_per_day):
+                session_id = f"{day:03d}-{number:04d}"
+                for position in range(args.messages):
+                    # Mensagens do aluno com redações inteiras, respostas com devolutivas longas
+                    role, words = ("user", 450) if position % 2 == 0 else ("assistant", 700)
+                    rows.append((session_id, role, message(rng, words), "mock", "persona", 0.7, timestamp))
+            connection.executemany(INSERT, rows)
+            first_session = first_session or rows[0][0]
+
+            if not args.no_maintenance:
+                maintenance.run_once(now=timestamp)
+
+            if (day + 1) % 7 == 0 or day + 1 == args.days:
+                stats = maintenance.database_stats()
+                print(
+                    f"dia {day + 1:>3}: {stats['size_bytes'] / 2**20:>8.1f} MB, "
+                    f"chat_history: {stats['hot_messages']:>7} mensagens, arquivo: {stats['archived_messages']:>7} mensagens "
+                    f"({stats['archived_bytes'] / 2**20:.1f} MB), leitura recente: {read_latency(store, rows[0][0]):.2f}ms, "
+                    f"leitura da primeira sessão: {read_latency(store, first_session):.2f}ms"
+                )
+
+        print(f"manutenção: {maintenance.stats()}")
+
+
+if __name__ == "__main__":
+    main()
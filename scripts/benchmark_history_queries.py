@@ -0,0 +1,100 @@
+"""
+Benchmark da leitura do histórico de uma sessão (get_history) em função do tamanho da tabela.
+
+Compara o esquema antigo (sem índice e com o session_id interpolado na consulta) com o esquema
+atual (migrações de sql_connection: índice (session_id, id), WAL e consulta parametrizada).
+
+Uso (a partir da raiz do repositório):
+    python scripts/benchmark_history_queries.py [--rows 10000,1000000,10000000]
+"""
+import os
+import sys
+import time
+import uuid
+import sqlite3
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "redacao-unicamp-acessivel"))
+
+from sql_connection import MIGRATIONS, apply_migrations  # noqa: E402
+
+MESSAGES_PER_SESSION = 20
+QUERIES_PER_SIZE = 200
+
+
+def populate(connection, rows):
+    """Insere rows mensagens, distribuídas em sessões de MESSAGES_PER_SESSION mensagens."""
+    session_ids = []
+    batch = []
+    for row in range(rows):
+        if row % MESSAGES_PER_SESSION == 0:
+            session_ids.append(str(uuid.uuid4()))
+        role = "user" if row % 2 == 0 else "assistant"
+        batch.append((session_ids[-1], role, "mensagem de teste " * 10, "mock", "persona", 0.7))
+
+        if len(batch) == 100_000:
+            connection.executemany(
+                "INSERT INTO chat_history (session_id, role, message, model_name, persona_name, temperature) VALUES (?, ?, ?, ?, ?, ?)",
+                batch,
+            )
+            batch.clear()
+
+    if batch:
+        connection.executemany(
+            "INSERT INTO chat_history (session_id, role, message, model_name, persona_name, temperature) VALUES (?, ?, ?, ?, ?, ?)",
+            batch,
+        )
+    connection.commit()
+    return session_ids
+
+
+def measure(connection, session_ids, parameterized):
+    """Retorna as latências (em ms) de QUERIES_PER_SIZE leituras de sessões aleatórias."""
+    step = max(1, len(session_ids) // QUERIES_PER_SIZE)
+    latencies = []
+    for session_id in session_ids[::step][:QUERIES_PER_SIZE]:
+        start = time.perf_counter()
+        if parameterized:
+            connection.execute(
+                "SELECT role, message FROM chat_history WHERE session_id = ? ORDER BY id", (session_id,)
+            ).fetchall()
+        else:
+            connection.execute(
+                f"SELECT role, message FROM chat_history WHERE session_id = '{session_id}'"
+            ).fetchall()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="10000,1000000,10000000", help="Tamanhos da tabela, separados por vírgula.")
+    args = parser.parse_args()
+
+    for rows in [int(value) for value in args.rows.split(",")]:
+        for label, indexed in (("antes (sem índice)", False), ("depois (migrações)", True)):
+            with tempfile.TemporaryDirectory() as directory:
+                connection = sqlite3.connect(os.path.join(directory, "chat_history.db"))
+
+                if indexed:
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    connection.execute("PRAGMA synchronous=NORMAL")
+                    apply_migrations(connection)
+                else:
+                    connection.execute(MIGRATIONS[0])  # Apenas a tabela, como no esquema antigo
+
+                session_ids = populate(connection, rows)
+                latencies = measure(connection, session_ids, parameterized=indexed)
+                connection.close()
+
+            print(
+                f"{rows:>10} linhas, {label}: "
+                f"p50={statistics.median(latencies):.3f}ms "
+                f"p95={sorted(latencies)[int(0.95 * len(latencies))]:.3f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
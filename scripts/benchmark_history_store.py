@@ -0,0 +1,104 @@
+"""
+Benchmark da vazão de escrita do histórico particionado (ShardedSQLiteHistoryStore).
+
+Cada sessão simulada (uma thread) grava mensagens no histórico, como as respostas do chat. O mesmo
+número de sessões e mensagens é gravado com 1, 2, 4, ... partições (bancos de dados SQLite em um
+diretório temporário); ao final de cada rodada, a varredura entre as partições confere se todas as
+mensagens foram gravadas. Com --direct, cada mensagem é um commit (sem o HistoryWriter), o que
+evidencia o limite de uma escrita por vez em cada arquivo.
+
+Uso (a partir da raiz do repositório):
+    python scripts/benchmark_history_store.py [--sessions 64] [--messages 50] [--shards 1,2,4,8]
+        [--synchronous FULL] [--direct]
+"""
+import os
+import sys
+import time
+import uuid
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "redacao-unicamp-acessivel"))
+
+from sql_connection import SQLiteConnection  # noqa: E402
+from history_writer import HistoryWriter  # noqa: E402
+from history_store import SQLiteHistoryStore, ShardedSQLiteHistoryStore  # noqa: E402
+
+MESSAGE = "Texto de uma mensagem do histórico com o tamanho aproximado de um parágrafo de resposta. " * 8
+
+
+def open_store(directory, shards, synchronous, direct):
+    """Abre o armazenamento particionado com o modo de sincronização e de escrita informados."""
+    stores = []
+    for index in range(shards):
+        connection = SQLiteConnection(
+            database=os.path.join(directory, f"chat_history_{index:02d}.db"),
+            connection_name=f"benchmark_{index:02d}",
+            synchronous=synchronous,
+            check_same_thread=False,
+        )
+        stores.append(SQLiteHistoryStore(connection, None if direct else HistoryWriter(connection)))
+    return ShardedSQLiteHistoryStore(stores)
+
+
+def simulate_session(store, messages, errors):
+    """Simula uma sessão: grava messages mensagens, alternando usuário e assistente."""
+    session_id = str(uuid.uuid4())
+    try:
+        for position in range(messages):
+            role = "user" if position % 2 == 0 else "assistant"
+            store.append(session_id, role, MESSAGE, "mock", "persona", 0.7)
+    except Exception as e:
+        errors.append(f"{session_id}: {e!r}")
+
+
+def run(shards, args):
+    """Executa uma rodada e retorna (mensagens por segundo, mensagens lidas pela varredura, erros)."""
+    with tempfile.TemporaryDirectory() as directory:
+        store = open_store(directory, shards, args.synchronous, args.direct)
+        errors = []
+        threads = [
+            threading.Thread(target=simulate_session, args=(store, args.messages, errors))
+            for _ in range(args.sessions)
+        ]
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        store.flush()  # A rodada só termina quando todas as mensagens estão no disco
+        elapsed = time.perf_counter() - start
+
+        scanned = sum(1 for _ in store.scan())
+        store.close()
+        return args.sessions * args.messages / elapsed, scanned, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=64, help="sessões simultâneas")
+    parser.add_argument("--messages", type=int, default=50, help="mensagens por sessão")
+    parser.add_argument("--shards", default="1,2,4,8", help="números de partições, separados por vírgula")
+    parser.add_argument("--synchronous", default="FULL", help="modo de sincronização do SQLite")
+    parser.add_argument("--direct", action="store_true", help="um commit por mensagem, sem o HistoryWriter")
+    args = parser.parse_args()
+
+    expected = args.sessions * args.messages
+    failed = False
+    baseline = None
+    for shards in (int(value) for value in args.shards.split(",")):
+        throughput, scanned, errors = run(shards, args)
+        baseline = baseline or throughput
+        print(f"{shards:>3} partições: {throughput:>10.0f} mensagens/s ({throughput / baseline:.2f}x), varredura: {scanned}/{expected}")
+        for error in errors[:10]:
+            print(f"erro: {error}")
+        failed = failed or bool(errors) or scanned != expected
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark da recuperação na base de conhecimento da persona.
+
+Mede o tempo de construção do índice, a latência das consultas, o tamanho do prompt por turno e
+o tempo até o primeiro chunk (com o MockModel) com e sem o índice.
+
+Uso (a partir da raiz do repositório):
+    python scripts/benchmark_knowledge_index.py [caminho_da_persona]
+"""
+import os
+import sys
+import time
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "redacao-unicamp-acessivel"))
+
+from chat_session import ChatSession  # noqa: E402
+from llm_model import MockModel  # noqa: E402
+from knowledge_index import load_or_build_index  # noqa: E402
+
+QUERIES = [
+    "o que é a mascara discursiva?",
+    "me explique a proposta 1 de 2024",
+    "quais conectivos posso usar para concluir um argumento?",
+    "como a banca avalia a leitura dos textos da coletânea?",
+    "minha carta-denúncia para o Ministério Público do Trabalho está adequada ao gênero?",
+]
+
+
+def percentile(values, fraction):
+    """Retorna o percentil (0-1) de uma lista de valores."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure_first_turn(persona_path, knowledge_index, message):
+    """Retorna (tamanho do prompt, tempo até o primeiro chunk) do primeiro turno de uma sessão."""
+    chat_session = ChatSession(persona_path, connection=None, knowledge_index=knowledge_index)
+    model = MockModel("mock")
+    chat_session.update_model("mock", model)
+
+    start = time.perf_counter()
+    first_chunk = next(chat_session.send_stream_message(message))
+    elapsed = time.perf_counter() - start
+
+    # O MockModel responde com o tamanho da mensagem recebida
+    return int(first_chunk.rsplit(" ", 1)[-1]), elapsed
+
+
+def main():
+    persona_path = sys.argv[1] if len(sys.argv) > 1 else "personas/dani_stella/dani_stella.json"
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        start = time.perf_counter()
+        knowledge_index = load_or_build_index(persona_path, index_dir=index_dir)
+        print(f"construção do índice: {time.perf_counter() - start:.3f}s ({len(knowledge_index)} trechos)")
+
+        latencies = []
+        for _ in range(200):
+            for query in QUERIES:
+                start = time.perf_counter()
+                knowledge_index.search(query, top_k=4)
+                latencies.append(time.perf_counter() - start)
+        print(
+            f"consulta: p50={percentile(latencies, 0.5) * 1000:.3f}ms "
+            f"p95={percentile(latencies, 0.95) * 1000:.3f}ms"
+        )
+
+        for label, index in (("sem índice", None), ("com índice", knowledge_index)):
+            # Aquece o cache do prompt compilado antes de medir
+            measure_first_turn(persona_path, index, QUERIES[0])
+
+            sizes, ttfts = [], []
+            for query in QUERIES:
+                size, ttft = measure_first_turn(persona_path, index, query)
+                sizes.append(size)
+                ttfts.append(ttft)
+            print(
+                f"{label}: prompt do 1º turno={statistics.mean(sizes) / 1024:.1f}KB "
+                f"tempo até o 1º chunk={statistics.mean(ttfts) * 1000:.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Teste de carga da sessão de chat com alunos simulados, usando o MockModel.
+
+Cada aluno simulado (uma thread, como a thread de script de uma sessão do Streamlit) cria ou retoma
+a própria ChatSession pelo SessionManager, lê o histórico (como em cada rerun) e envia mensagens pelo
+AsyncStreamBridge, com o mesmo caminho usado pelo main.py. O MockModel simula o tempo até o primeiro
+token, o intervalo entre chunks e o tamanho das respostas.
+
+São medidos (p50/p95/p99, em ms):
+    history_load   leitura do histórico da sessão (get_history), a cada rerun
+    first_chunk    tempo até o primeiro chunk da resposta
+    full_response  tempo até o fim da resposta
+    db_write       duração de cada gravação em lote no SQLite (transação do HistoryWriter)
+    app_rerun      duração de cada rerun do main.py (apenas com --app, via streamlit.testing.AppTest)
+
+Os resultados podem ser gravados como referência (--save-baseline) e comparados com ela nas
+execuções seguintes: o script termina com código 1 se alguma métrica piorar além da tolerância. Métricas
+com pelo menos MIN_P95_SAMPLES amostras (na execução e na referência) são comparadas pelo p95; as demais
+(ex.: db_write, com uma amostra por lote), pelo p50, já que o p95 de poucas amostras é quase o máximo.
+Com --runs, o teste é repetido e as amostras são somadas (recomendado ao gravar a referência).
+
+Uso (a partir da raiz do repositório):
+    python scripts/load_test.py [--students 200] [--turns 5] [--ttft 0.3] [--runs 1] [--save-baseline]
+    python scripts/load_test.py --app --students 10  # Executa também o main.py sem interface
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import contextlib
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "redacao-unicamp-acessivel")
+sys.path.insert(0, APP_DIR)
+
+from chat_session import ChatSession  # noqa: E402
+from llm_model import MockModel  # noqa: E402
+from session_manager import SessionManager  # noqa: E402
+from async_stream import AsyncStreamBridge  # noqa: E402
+from history_writer import HistoryWriter  # noqa: E402
+from sql_connection import SQLiteConnection  # noqa: E402
+
+PERSONA_PATH = "personas/dani_stella/dani_stella.json"
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "load_test_baseline.json")
+
+# Diferença absoluta (em ms) tolerada além da tolerância relativa, para métricas muito rápidas
+ABSOLUTE_SLACK_MS = 1.0
+
+# Número mínimo de amostras para comparar o p95 (abaixo dele, a comparação usa o p50)
+MIN_P95_SAMPLES = 200
+
+
+class Recorder:
+    """Acumula as latências (em ms) de cada métrica, de várias threads."""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, metric, seconds):
+        with self._lock:
+            self.samples.setdefault(metric, []).append(seconds * 1000)
+
+    def summary(self):
+        """Retorna p50/p95/p99 (e o número de amostras) de cada métrica."""
+        with self._lock:
+            return {metric: summarize(values) for metric, values in sorted(self.samples.items())}
+
+
+def percentile(sorted_values, fraction):
+    """Percentil (pelo método do vizinho mais próximo) de uma lista ordenada."""
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+    }
+
+
+def instrument_writes(connection, recorder):
+    """Mede a duração de cada gravação em lote feita pelo HistoryWriter (uma transação por lote)."""
+    transaction = connection.transaction
+
+    @contextlib.contextmanager
+    def timed_transaction():
+        start = time.perf_counter()
+        with transaction() as cursor:
+            yield cursor
+        recorder.add("db_write", time.perf_counter() - start)
+
+    connection.transaction = timed_transaction
+
+
+def simulate_student(student, args, session_manager, stream_bridge, model_options, recorder, errors):
+    """Simula um aluno: a cada turno, um rerun (leitura do histórico) e o envio de uma mensagem."""
+    session_key = f"aluno-{student}"
+    try:
+        chat_session, session_lock = session_manager.get_session_and_lock(session_key)
+        chat_session.update_model("mock", MockModel("mock", **model_options))
+
+        for turn in range(args.turns):
+            start = time.perf_counter()
+            chat_session.get_history()
+            recorder.add("history_load", time.perf_counter() - start)
+
+            message = f"Aluno {student}, mensagem {turn}: o que é a máscara discursiva na proposta 1 de 2024?"
+            with session_lock:
+                start = time.perf_counter()
+                first_chunk = None
+                response_stream = stream_bridge.stream(
+                    session_key,
+                    lambda: chat_session.async_send_stream_message(message),
+                )
+                for _ in response_stream:
+                    if first_chunk is None:
+                        first_chunk = time.perf_counter()
+                        recorder.add("first_chunk", first_chunk - start)
+                recorder.add("full_response", time.perf_counter() - start)
+
+            time.sleep(args.think_time)  # Tempo de leitura da resposta antes do próximo turno
+    except Exception as e:
+        errors.append(f"{session_key}: {e!r}")
+
+
+def run_sessions(args, recorder):
+    """Executa o teste de carga sobre ChatSession/SessionManager/AsyncStreamBridge."""
+    model_options = {
+        "time_to_first_token": args.ttft,
+        "inter_chunk_delay": args.chunk_delay,
+        "chunk_size": args.chunk_size,
+        "response_length": args.response_length,
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        connection = SQLiteConnection(
+            database=os.path.join(directory, "chat_history.db"),
+            connection_name="load-test",
+            check_same_thread=False,
+        )
+        instrument_writes(connection, recorder)
+        history_writer = HistoryWriter(connection)
+        session_manager = SessionManager(
+            lambda: ChatSession(PERSONA_PATH, connection, history_writer=history_writer),
+            connection=connection,
+            writer=history_writer,
+        )
+        stream_bridge = AsyncStreamBridge()
+
+        errors = []
+        threads = [
+            threading.Thread(
+                target=simulate_student,
+                args=(student, args, session_manager, stream_bridge, model_options, recorder, errors),
+            )
+            for student in range(args.students)
+        ]
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        history_writer.close()
+        elapsed = time.perf_counter() - start
+
+        stored = connection.query("SELECT COUNT(*) FROM chat_history")[0][0]
+        expected = args.students * args.turns * 2
+        if stored != expected:
+            errors.append(f"esperado {expected} mensagens no banco, gravadas {stored}")
+
+    print(f"{args.students} alunos x {args.turns} turnos em {elapsed:.1f}s")
+    return errors
+
+
+def run_app(args, recorder):
+    """Executa o main.py sem interface (streamlit.testing.AppTest), com um AppTest por aluno."""
+    from streamlit.testing.v1 import AppTest
+
+    os.environ["ENABLE_MOCK_MODEL"] = "1"
+    os.environ["MOCK_TIME_TO_FIRST_TOKEN"] = str(args.ttft)
+    os.environ["MOCK_INTER_CHUNK_DELAY"] = str(args.chunk_delay)
+    os.environ["MOCK_CHUNK_SIZE"] = str(args.chunk_size or 0)
+    os.environ["MOCK_RESPONSE_LENGTH"] = str(args.response_length or 0)
+
+    errors = []
+    for student in range(args.students):
+        app = AppTest.from_file(os.path.join(APP_DIR, "main.py"), default_timeout=60)
+
+        start = time.perf_counter()
+        app.run()
+        recorder.add("app_rerun", time.perf_counter() - start)
+
+        app.selectbox[0].set_value("mock")
+        app.button[0].click()
+        start = time.perf_counter()
+        app.run()
+        recorder.add("app_rerun", time.perf_counter() - start)
+
+        for turn in range(args.turns):
+            app.chat_input[0].set_value(f"Aluno {student}, mensagem {turn}")
+            start = time.perf_counter()
+            app.run()
+            recorder.add("app_rerun", time.perf_counter() - start)
+
+        if app.exception:
+            errors.append(f"aluno {student}: {app.exception[0].message}")
+    return errors
+
+
+def compare_with_baseline(summary, baseline, tolerance):
+    """
+    Retorna as métricas que pioraram além da tolerância em relação à referência.
+
+    O p95 é comparado apenas quando a execução e a referência têm MIN_P95_SAMPLES amostras; com menos,
+    o p95 é praticamente o maior valor medido e varia de uma execução para outra, então compara-se o p50.
+    """
+    regressions = []
+    for metric, values in summary.items():
+        reference = baseline.get(metric)
+        if reference is None:
+            continue
+        statistic = "p95" if min(values["count"], reference["count"]) >= MIN_P95_SAMPLES else "p50"
+        limit = reference[statistic] * (1 + tolerance) + ABSOLUTE_SLACK_MS
+        if values[statistic] > limit:
+            regressions.append(
+                f"{metric}: {statistic} {values[statistic]:.2f}ms > {limit:.2f}ms "
+                f"(referência {reference[statistic]:.2f}ms, n={values['count']})"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=200, help="Número de alunos simulados.")
+    parser.add_argument("--turns", type=int, default=5, help="Mensagens enviadas por aluno.")
+    parser.add_argument("--ttft", type=float, default=0.3, help="Tempo até o primeiro token do MockModel (s).")
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="Intervalo entre chunks do MockModel (s).")
+    parser.add_argument("--chunk-size", type=int, default=16, help="Tamanho dos chunks do MockModel.")
+    parser.add_argument("--response-length", type=int, default=800, help="Tamanho das respostas do MockModel.")
+    parser.add_argument("--think-time", type=float, default=0.1, help="Espera do aluno entre os turnos (s).")
+    parser.add_argument("--runs", type=int, default=1, help="Repetições do teste (as amostras são somadas).")
+    parser.add_argument("--app", action="store_true", help="Executa também o main.py via AppTest.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Arquivo JSON com a referência.")
+    parser.add_argument("--save-baseline", action="store_true", help="Grava os resultados como referência.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Piora relativa tolerada (no p95 ou no p50).")
+    args = parser.parse_args()
+
+    recorder = Recorder()
+    errors = []
+    for _ in range(args.runs):
+        errors += run_sessions(args, recorder)
+    if args.app:
+        errors += run_app(args, recorder)
+
+    summary = recorder.summary()
+    for metric, values in summary.items():
+        print(
+            f"{metric:>14}: n={values['count']:<6} "
+            f"p50={values['p50']:.2f}ms p95={values['p95']:.2f}ms p99={values['p99']:.2f}ms"
+        )
+
+    for error in errors[:10]:
+        print("ERRO", error)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(summary, baseline_file, indent=4)
+        print(f"Referência gravada em {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            regressions = compare_with_baseline(summary, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print("REGRESSÃO", regression)
+        if regressions:
+            sys.exit(1)
+        print("Sem regressões em relação à referência.")
+
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
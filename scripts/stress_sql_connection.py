@@ -0,0 +1,85 @@
+"""
+Teste de estresse do SQLiteConnection com sessões de chat simuladas em paralelo.
+
+Cada sessão simulada (uma thread) grava mensagens no histórico e lê o histórico da própria sessão
+a cada mensagem, como acontece em cada rerun do Streamlit. Ao final, verifica se todas as
+mensagens foram gravadas e exibe as estatísticas do pool de conexões.
+
+Uso (a partir da raiz do repositório):
+    python scripts/stress_sql_connection.py [--sessions 50] [--messages 40] [--max-readers 8]
+"""
+import os
+import sys
+import time
+import uuid
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "redacao-unicamp-acessivel"))
+
+from sql_connection import SQLiteConnection  # noqa: E402
+
+INSERT = "INSERT INTO chat_history (session_id, role, message, model_name, persona_name, temperature) VALUES (?, ?, ?, ?, ?, ?)"
+SELECT = "SELECT role, message FROM chat_history WHERE session_id = ? ORDER BY id"
+
+
+def simulate_session(connection, messages, errors):
+    """Simula uma sessão: grava uma mensagem e relê o histórico, messages vezes."""
+    session_id = str(uuid.uuid4())
+    try:
+        for position in range(messages):
+            role = "user" if position % 2 == 0 else "assistant"
+            connection.execute(INSERT, (session_id, role, f"mensagem {position}", "mock", "persona", 0.7))
+
+            history = connection.query(SELECT, (session_id,))
+            if len(history) != position + 1:
+                errors.append(f"{session_id}: esperado {position + 1} mensagens, lido {len(history)}")
+                return
+    except Exception as e:
+        errors.append(f"{session_id}: {e!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=40)
+    parser.add_argument("--max-readers", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        connection = SQLiteConnection(
+            database=os.path.join(directory, "chat_history.db"),
+            max_readers=args.max_readers,
+            connection_name="stress",
+            check_same_thread=False,
+        )
+
+        errors = []
+        threads = [
+            threading.Thread(target=simulate_session, args=(connection, args.messages, errors))
+            for _ in range(args.sessions)
+        ]
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        total = connection.query("SELECT COUNT(*) FROM chat_history")[0][0]
+        expected = args.sessions * args.messages
+
+        print(f"{args.sessions} sessões x {args.messages} mensagens em {elapsed:.2f}s")
+        print(f"mensagens gravadas: {total} (esperado {expected})")
+        print(f"pool: {connection.stats()}")
+        for error in errors[:10]:
+            print(f"erro: {error}")
+
+        if errors or total != expected:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()